@@ -0,0 +1,256 @@
+def _listen_stats_change(table, key, sign, row, match):
+    """UPDATE adding (sign '+') or removing (sign '-') one History row's play to the matching stats rows"""
+    return f"""UPDATE {table} SET
+                        play_count = play_count {sign} 1,
+                        total_listen_time = total_listen_time {sign} COALESCE({row}.duration, 0)
+                    WHERE {key} {match};"""
+
+
+def _album_song_change(sign, row, albums=None):
+    """UPDATE adding or removing all plays of a song to/from an album (or `albums`) when it joins or leaves it"""
+    song = f"FROM SongListenStats WHERE song_id = {row}.song_id"
+    return f"""UPDATE AlbumListenStats SET
+                        play_count = play_count {sign} COALESCE((SELECT play_count {song}), 0),
+                        total_listen_time = total_listen_time {sign} COALESCE((SELECT total_listen_time {song}), 0)
+                    WHERE album_id {albums or f"= {row}.album_id"};"""
+
+
+def listen_stats_triggers():
+    """
+    Return the triggers keeping SongListenStats and AlbumListenStats equal to
+    what listen_stats_rebuild_statements() computes from History.
+
+    Every song and album has a stats row from the moment it is created. A play
+    counts for its song and every album the song is on; adding a song to an
+    album adds the song's plays so far. Changing the ID of a song or album
+    isn't followed: run `manage.py rebuild-stats` after doing that.
+    """
+    def plays(sign, row):
+        # Plays of a deleted song (left behind when foreign keys aren't
+        # enforced) no longer count for its albums, as in the rebuild
+        albums = f"""IN (SELECT Album_Info.album_id FROM Album_Info
+                                        JOIN SongListenStats ON SongListenStats.song_id = Album_Info.song_id
+                                        WHERE Album_Info.song_id = {row}.song_id)"""
+        return (_listen_stats_change('SongListenStats', 'song_id', sign, row, f"= {row}.song_id") + "\n                    "
+                + _listen_stats_change('AlbumListenStats', 'album_id', sign, row, albums))
+
+    return [
+        """CREATE TRIGGER IF NOT EXISTS trg_song_listen_stats_insert AFTER INSERT ON Song
+            BEGIN
+                INSERT OR IGNORE INTO SongListenStats (song_id) VALUES (NEW.song_id);
+            END""",
+        # Foreign keys aren't always enforced, so History and Album_Info rows may
+        # outlive the song: take whatever plays the cascades (if any) left off
+        # its albums before dropping its totals
+        f"""CREATE TRIGGER IF NOT EXISTS trg_song_listen_stats_delete AFTER DELETE ON Song
+            BEGIN
+                    {_album_song_change('-', 'OLD', albums="IN (SELECT album_id FROM Album_Info WHERE song_id = OLD.song_id)")}
+                DELETE FROM SongListenStats WHERE song_id = OLD.song_id;
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_album_listen_stats_insert AFTER INSERT ON Album
+            BEGIN
+                INSERT OR IGNORE INTO AlbumListenStats (album_id) VALUES (NEW.album_id);
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_album_listen_stats_delete AFTER DELETE ON Album
+            BEGIN
+                DELETE FROM AlbumListenStats WHERE album_id = OLD.album_id;
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_history_listen_stats_insert AFTER INSERT ON History
+            BEGIN
+                    {plays('+', 'NEW')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_history_listen_stats_delete AFTER DELETE ON History
+            BEGIN
+                    {plays('-', 'OLD')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_history_listen_stats_update AFTER UPDATE OF song_id, duration ON History
+            BEGIN
+                    {plays('-', 'OLD')}
+                    {plays('+', 'NEW')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_album_info_listen_stats_insert AFTER INSERT ON Album_Info
+            BEGIN
+                    {_album_song_change('+', 'NEW')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_album_info_listen_stats_delete AFTER DELETE ON Album_Info
+            BEGIN
+                    {_album_song_change('-', 'OLD')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_album_info_listen_stats_update AFTER UPDATE OF album_id, song_id ON Album_Info
+            BEGIN
+                    {_album_song_change('-', 'OLD')}
+                    {_album_song_change('+', 'NEW')}
+            END""",
+    ]
+
+
+def listen_stats_rebuild_statements():
+    """Return the statements (for one transaction) that recompute SongListenStats and AlbumListenStats from History"""
+    return (
+        "DELETE FROM SongListenStats",
+        # Aggregating History once and joining the totals beats looking up
+        # every song's plays one by one
+        """INSERT INTO SongListenStats (song_id, play_count, total_listen_time)
+           SELECT Song.song_id, COALESCE(plays.play_count, 0), COALESCE(plays.total_listen_time, 0)
+           FROM Song
+           LEFT JOIN (
+               SELECT song_id, COUNT(*) AS play_count, SUM(duration) AS total_listen_time
+               FROM History
+               GROUP BY song_id
+           ) AS plays ON plays.song_id = Song.song_id""",
+        "DELETE FROM AlbumListenStats",
+        """INSERT INTO AlbumListenStats (album_id, play_count, total_listen_time)
+           SELECT Album.album_id, COALESCE(SUM(songs.play_count), 0), COALESCE(SUM(songs.total_listen_time), 0)
+           FROM Album
+           LEFT JOIN Album_Info ON Album_Info.album_id = Album.album_id
+           LEFT JOIN SongListenStats AS songs ON songs.song_id = Album_Info.song_id
+           GROUP BY Album.album_id""",
+    )
+
+
+# Rollups of listens per genre: (table, SQL expression turning a start_time
+# into the start of its bucket). Hourly buckets start at 'YYYY-MM-DD HH:00:00',
+# daily ones are dates.
+GENRE_ROLLUPS = [
+    ('GenreListensHourly', "strftime('%Y-%m-%d %H:00:00', {})"),
+    ('GenreListensDaily', "date({})"),
+]
+
+
+def _genre_play_change(table, bucket, sign, row):
+    """Upsert counting one History row (sign '' adds it, '-' removes it) in the buckets of its song's genres"""
+    start = bucket.format(f'{row}.start_time')
+    return f"""INSERT INTO {table} (bucket_start, genre_id, listens)
+                        SELECT {start}, genre_id, {sign}1 FROM Genre
+                        WHERE song_id = {row}.song_id AND {start} IS NOT NULL
+                        ON CONFLICT (bucket_start, genre_id) DO UPDATE SET listens = listens + excluded.listens;"""
+
+
+def _genre_song_change(table, bucket, sign, row):
+    """Upsert counting all plays of a song in (or out of) the buckets of a genre it was tagged with (or untagged from)"""
+    start = bucket.format('start_time')
+    return f"""INSERT INTO {table} (bucket_start, genre_id, listens)
+                        SELECT {start} AS bucket, {row}.genre_id, {sign}COUNT(*) FROM History
+                        WHERE song_id = {row}.song_id AND bucket IS NOT NULL
+                        GROUP BY bucket
+                        ON CONFLICT (bucket_start, genre_id) DO UPDATE SET listens = listens + excluded.listens;"""
+
+
+def genre_rollup_triggers():
+    """
+    Return the triggers keeping the GENRE_ROLLUPS tables equal to what
+    genre_rollup_rebuild_statements() computes from History.
+
+    A play counts once for every genre of its song, in the bucket its
+    start_time falls in. Tagging a song with a genre (or removing the tag)
+    moves all the song's plays so far, found through idx_history_song_id.
+    """
+    def each(change, sign, row):
+        return "\n                    ".join(change(table, bucket, sign, row) for table, bucket in GENRE_ROLLUPS)
+
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_history_genre_rollup_insert AFTER INSERT ON History
+            BEGIN
+                    {each(_genre_play_change, '', 'NEW')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_history_genre_rollup_delete AFTER DELETE ON History
+            BEGIN
+                    {each(_genre_play_change, '-', 'OLD')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_history_genre_rollup_update AFTER UPDATE OF song_id, start_time ON History
+            BEGIN
+                    {each(_genre_play_change, '-', 'OLD')}
+                    {each(_genre_play_change, '', 'NEW')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_genre_genre_rollup_insert AFTER INSERT ON Genre
+            BEGIN
+                    {each(_genre_song_change, '', 'NEW')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_genre_genre_rollup_delete AFTER DELETE ON Genre
+            BEGIN
+                    {each(_genre_song_change, '-', 'OLD')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_genre_genre_rollup_update AFTER UPDATE OF song_id, genre_id ON Genre
+            BEGIN
+                    {each(_genre_song_change, '-', 'OLD')}
+                    {each(_genre_song_change, '', 'NEW')}
+            END""",
+    ]
+
+
+def genre_rollup_rebuild_statements():
+    """Return the statements (for one transaction) that recompute the GENRE_ROLLUPS tables from History"""
+    statements = ()
+    for table, bucket in GENRE_ROLLUPS:
+        start = bucket.format('History.start_time')
+        statements += (
+            f"DELETE FROM {table}",
+            f"""INSERT INTO {table} (bucket_start, genre_id, listens)
+                SELECT {start} AS bucket, Genre.genre_id, COUNT(*)
+                FROM History
+                JOIN Genre ON Genre.song_id = History.song_id
+                WHERE bucket IS NOT NULL
+                GROUP BY bucket, Genre.genre_id""",
+        )
+    return statements
+
+
+def _follow_change(sign, row):
+    """UPDATEs counting one Follower row (sign '+') or taking it off (sign '-') both users' counters"""
+    return f"""UPDATE UserFollowCounts SET follower_count = follower_count {sign} 1 WHERE user_id = {row}.user_id_2;
+                    UPDATE UserFollowCounts SET following_count = following_count {sign} 1 WHERE user_id = {row}.user_id_1;"""
+
+
+# Counts a user's followers and followings from scratch, through idx_follower_user1/2
+_RECOUNT_FOLLOWS = """SELECT {user}, (SELECT COUNT(*) FROM Follower WHERE user_id_2 = {user}),
+                                 (SELECT COUNT(*) FROM Follower WHERE user_id_1 = {user})"""
+
+
+def follow_count_triggers():
+    """
+    Return the triggers keeping UserFollowCounts equal to the number of
+    Follower rows naming each user as followed (follower_count) and as
+    follower (following_count).
+    """
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_user_follow_counts_insert AFTER INSERT ON User
+            BEGIN
+                INSERT OR REPLACE INTO UserFollowCounts (user_id, follower_count, following_count)
+                    {_RECOUNT_FOLLOWS.format(user='NEW.user_id')};
+            END""",
+        # Runs after the cascaded Follower deletes took the user off the
+        # counters of everyone they followed or were followed by
+        """CREATE TRIGGER IF NOT EXISTS trg_user_follow_counts_delete AFTER DELETE ON User
+            BEGIN
+                DELETE FROM UserFollowCounts WHERE user_id = OLD.user_id;
+            END""",
+        # The cascaded Follower updates counted the new ID before it had a row
+        f"""CREATE TRIGGER IF NOT EXISTS trg_user_follow_counts_update AFTER UPDATE OF user_id ON User
+            BEGIN
+                DELETE FROM UserFollowCounts WHERE user_id = OLD.user_id;
+                INSERT OR REPLACE INTO UserFollowCounts (user_id, follower_count, following_count)
+                    {_RECOUNT_FOLLOWS.format(user='NEW.user_id')};
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_follower_follow_counts_insert AFTER INSERT ON Follower
+            BEGIN
+                    {_follow_change('+', 'NEW')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_follower_follow_counts_delete AFTER DELETE ON Follower
+            BEGIN
+                    {_follow_change('-', 'OLD')}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_follower_follow_counts_update AFTER UPDATE OF user_id_1, user_id_2 ON Follower
+            BEGIN
+                    {_follow_change('-', 'OLD')}
+                    {_follow_change('+', 'NEW')}
+            END""",
+    ]
+
+
+def follow_count_rebuild_statements():
+    """Return the statements (for one transaction) that recount UserFollowCounts from Follower"""
+    return (
+        "DELETE FROM UserFollowCounts",
+        f"""INSERT INTO UserFollowCounts (user_id, follower_count, following_count)
+            {_RECOUNT_FOLLOWS.format(user='User.user_id')} FROM User""",
+    )
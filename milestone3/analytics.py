@@ -0,0 +1,284 @@
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional; without it /analytics runs the same aggregations in SQL
+    np = None
+
+
+def can_analyze():
+    """Return True if NumPy is installed and the columnar engine can be used"""
+    return np is not None
+
+
+# What plays can be grouped by: dimension -> (table, id column, name column,
+# integer code column). Songs and users are encoded by rowid, so SQLite does
+# the encoding while loading; genres already have integer IDs.
+ANALYTICS_DIMENSIONS = {
+    'song': ('Song', 'song_id', 'song_name', 'rowid'),
+    'album': ('Album', 'album_id', 'album_name', 'rowid'),
+    'genre': ('GenreFields', 'genre_id', 'genre_name', 'genre_id'),
+    'user': ('User', 'user_id', 'nickname', 'rowid'),
+}
+ANALYTICS_METRICS = ('listen_time', 'plays')
+
+# Largest start time the uint32 column holds
+_MAX_EPOCH = 2 ** 32 - 1
+
+# History rows as (rowid, user code, song code, start as epoch seconds, duration);
+# plays of deleted songs or users are left out, like the SQL stats do
+_HISTORY_COLUMNS_SQL = """
+    SELECT History.rowid, User.rowid, Song.rowid,
+           COALESCE(CAST(strftime('%s', History.start_time) AS INTEGER), 0),
+           COALESCE(History.duration, 0)
+    FROM History
+    JOIN User ON User.user_id = History.user_id
+    JOIN Song ON Song.song_id = History.song_id
+    WHERE History.rowid > ? AND History.rowid <= ?
+"""
+
+# Which songs belong to which albums and genres: (group code, song code)
+_MEMBERSHIP_SQL = {
+    'album': """SELECT Album.rowid, Song.rowid FROM Album_Info
+                JOIN Album ON Album.album_id = Album_Info.album_id
+                JOIN Song ON Song.song_id = Album_Info.song_id""",
+    'genre': """SELECT Genre.genre_id, Song.rowid FROM Genre
+                JOIN Song ON Song.song_id = Genre.song_id""",
+}
+
+
+def top_sql(dimension, metric):
+    """
+    Return the SQL aggregation answering ListeningAnalytics.top() without NumPy.
+
+    Parameters: since, until ('YYYY-MM-DD HH:MM:SS' UTC strings), limit. Rows
+    are (code, plays, listen_time), codes as in ANALYTICS_DIMENSIONS.
+
+    start_time is normalized with datetime() before comparing, since plays
+    are stored in ISO 8601 ('T'-separated) as well as SQLite's format; like
+    the NumPy loader, unreadable times count as the epoch.
+    """
+    joins = {
+        'song': "",
+        'album': """JOIN Album_Info ON Album_Info.song_id = Song.song_id
+                    JOIN Album ON Album.album_id = Album_Info.album_id""",
+        'genre': "JOIN Genre ON Genre.song_id = Song.song_id",
+        'user': "",
+    }[dimension]
+    code = {
+        'song': 'Song.rowid',
+        'album': 'Album.rowid',
+        'genre': 'Genre.genre_id',
+        'user': 'User.rowid',
+    }[dimension]
+    return f"""
+        SELECT {code} AS code, COUNT(*) AS plays, COALESCE(SUM(History.duration), 0) AS listen_time
+        FROM History
+        JOIN User ON User.user_id = History.user_id
+        JOIN Song ON Song.song_id = History.song_id
+        {joins}
+        WHERE COALESCE(datetime(History.start_time), '1970-01-01 00:00:00') >= ?
+          AND COALESCE(datetime(History.start_time), '1970-01-01 00:00:00') < ?
+        GROUP BY code
+        ORDER BY {metric} DESC, code
+        LIMIT ?
+    """
+
+
+class ListeningAnalytics:
+    """
+    Columnar in-memory copy of History for ad-hoc listening statistics.
+
+    Plays are held in four NumPy arrays (user code, song code, start time in
+    epoch seconds, duration) of 16 bytes per play, so totals per song, album,
+    genre or user over any time range are a boolean mask and a bincount:
+    milliseconds for millions of plays, with no SQL aggregation.
+
+    refresh() appends History rows added since the last refresh (by rowid).
+    Deleted or edited plays and album/genre membership are picked up by the
+    full reload every `rebuild_interval` seconds.
+
+    Args:
+        refresh_interval (float): Seconds between checks for new History rows
+        rebuild_interval (float): Seconds between full reloads
+        chunk_size (int): Rows converted to arrays at a time while loading
+    """
+    def __init__(self, refresh_interval=5.0, rebuild_interval=900.0, chunk_size=200000):
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._columns = None
+        self._size = 0
+        self._membership = {}
+        self._last_rowid = 0
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    def refresh(self, connect, force=False):
+        """
+        Bring the arrays up to date if they haven't been checked for `refresh_interval` seconds.
+
+        Only the first call waits for the load; later calls return at once
+        while another thread refreshes.
+
+        Args:
+            connect (callable): Returns a database connection (closed afterwards)
+            force (bool): Check now, however recently the arrays were checked
+        """
+        if not force and time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            now = time.monotonic()
+            if not force and now - self._checked_at < self.refresh_interval:
+                return
+            connection = connect()
+            try:
+                if not self._loaded or now - self._loaded_at >= self.rebuild_interval:
+                    self._load(connection)
+                else:
+                    self._append_new(connection)
+            finally:
+                connection.close()
+            self._checked_at = now
+        finally:
+            self._refresh_lock.release()
+
+    def _read_history(self, connection, after_rowid, up_to_rowid):
+        """Read History rows in the rowid range as one (n, 5) int64 array"""
+        cursor = connection.execute(_HISTORY_COLUMNS_SQL, (after_rowid, up_to_rowid))
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64))
+        if not chunks:
+            return np.empty((0, 5), dtype=np.int64)
+        return np.concatenate(chunks)
+
+    @staticmethod
+    def _split(rows, capacity):
+        """Turn (n, 5) rows into the column arrays, with room for `capacity` plays"""
+        columns = {
+            'user': np.empty(capacity, dtype=np.int32),
+            'song': np.empty(capacity, dtype=np.int32),
+            # Unsigned 32-bit epoch seconds last until 2106
+            'start': np.empty(capacity, dtype=np.uint32),
+            'duration': np.empty(capacity, dtype=np.int32),
+        }
+        for name, i in (('user', 1), ('song', 2), ('start', 3), ('duration', 4)):
+            column = columns[name]
+            column[:len(rows)] = np.clip(rows[:, i], 0, np.iinfo(column.dtype).max)
+        return columns
+
+    def _load(self, connection):
+        """Read all of History and the album/genre membership into arrays"""
+        last_rowid = connection.execute("SELECT COALESCE(MAX(rowid), 0) FROM History").fetchone()[0]
+        rows = self._read_history(connection, 0, last_rowid)
+        columns = self._split(rows, max(len(rows) * 5 // 4, 1024))
+        membership = {}
+        for dimension, sql in _MEMBERSHIP_SQL.items():
+            pairs = np.array(connection.execute(sql).fetchall(), dtype=np.int64).reshape(-1, 2)
+            membership[dimension] = (pairs[:, 0], pairs[:, 1])
+        with self._lock:
+            self._columns = columns
+            self._size = len(rows)
+            self._membership = membership
+            self._last_rowid = last_rowid
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+
+    def _append_new(self, connection):
+        """Append the History rows added since the last refresh"""
+        last_rowid = connection.execute("SELECT COALESCE(MAX(rowid), 0) FROM History").fetchone()[0]
+        if last_rowid <= self._last_rowid:
+            return
+        rows = self._read_history(connection, self._last_rowid, last_rowid)
+        with self._lock:
+            size = self._size + len(rows)
+            columns = self._columns
+            if size > len(columns['user']):
+                # Grow by half, so appends stay amortized O(1)
+                grown = self._split(np.empty((0, 5), dtype=np.int64), max(size * 3 // 2, 1024))
+                for name, column in columns.items():
+                    grown[name][:self._size] = column[:self._size]
+                columns = grown
+            new = self._split(rows, len(rows))
+            for name, column in new.items():
+                columns[name][self._size:size] = column
+            self._columns = columns
+            self._size = size
+            self._last_rowid = last_rowid
+
+    def top(self, dimension, since=None, until=None, limit=10, metric='listen_time'):
+        """
+        Return the songs, albums, genres or users with the most listening in a time range.
+
+        A play counts for its song, every album and genre of the song, and its user.
+
+        Args:
+            dimension (str): One of ANALYTICS_DIMENSIONS
+            since (int): Only plays starting at or after this (epoch seconds)
+            until (int): Only plays starting before this (epoch seconds)
+            limit (int): How many to return
+            metric (str): Rank by 'listen_time' (seconds) or 'plays'
+
+        Returns:
+            list: (code, plays, listen_time) tuples, best first; codes as in
+                  ANALYTICS_DIMENSIONS
+        """
+        with self._lock:
+            columns, size, membership = self._columns, self._size, self._membership
+        if columns is None or size == 0:
+            return []
+        start = columns['start'][:size]
+        mask = None
+        if since is not None:
+            mask = start >= min(max(since, 0), _MAX_EPOCH)
+        if until is not None:
+            before = start < min(max(until, 0), _MAX_EPOCH)
+            mask = before if mask is None else mask & before
+        key = columns['user' if dimension == 'user' else 'song'][:size]
+        duration = columns['duration'][:size]
+        if mask is not None:
+            key, duration = key[mask], duration[mask]
+        plays = np.bincount(key)
+        listen_time = np.bincount(key, weights=duration)
+
+        if dimension in membership:
+            # Spread each song's totals over the albums/genres it belongs to
+            groups, songs = membership[dimension]
+            songs_in_range = songs < len(plays)
+            groups, songs = groups[songs_in_range], songs[songs_in_range]
+            width = int(groups.max()) + 1 if len(groups) else 0
+            plays = np.bincount(groups, weights=plays[songs], minlength=width)
+            listen_time = np.bincount(groups, weights=listen_time[songs], minlength=width)
+
+        ranked = listen_time if metric == 'listen_time' else plays
+        codes = np.flatnonzero(plays)
+        if len(codes) > limit:
+            # Only the best `limit` (and whatever ties with the last of them) need sorting
+            values = ranked[codes]
+            threshold = np.partition(values, len(values) - limit)[len(values) - limit]
+            codes = codes[values >= threshold]
+        codes = codes[np.lexsort((codes, -ranked[codes]))][:limit]
+        return [(int(code), int(plays[code]), int(listen_time[code])) for code in codes]
+
+    def stats(self):
+        """Return how many plays are loaded and how current they are"""
+        with self._lock:
+            columns = self._columns
+            return {
+                'engine': 'numpy' if can_analyze() else 'sql',
+                'plays': self._size,
+                'bytes': sum(column.nbytes for column in columns.values()) if columns else 0,
+                'history_rowid': self._last_rowid,
+                'loaded_seconds_ago': round(time.monotonic() - self._loaded_at, 1) if self._loaded else None
+            }
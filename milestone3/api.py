@@ -1,11 +1,38 @@
-from flask import Flask, request, jsonify
-from flask_restx import Api, Namespace, Resource, fields
+from flask import Flask, request, jsonify, has_request_context, Response, send_file
+from flask_restx import Api, Namespace, Resource, fields, abort
+from flask_restx.utils import unpack
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from statements import statements
+from statements import statements, authentication_table
 from dummy_data_insertion import *
+from database import ConnectionPool, BusyRetry, is_busy_error
+from ingestion import HistoryIngestor, IngestBufferFull, IngestTimeout, PlayEvent, current_timestamp
+from migrations import MigrationRunner, MIGRATIONS
+from pagination import KeysetPage, InvalidPageRequest
+from streaming import stream_rows, STREAM_FORMATS, NDJSON_MIMETYPE
+from projection import FieldSet, InvalidFieldSet
+from media import (decode_media, guess_mimetype, is_media_ref, FileSystemMediaStore,
+                   InlineMedia, read_media_ref, stream_inline_media, MEDIA_REF_PREFIX,
+                   DerivedMediaCache, externalize_value)
+from thumbnails import resize_image, can_resize
+from search import fts_query, catalog_search_sql, catalog_rebuild_statements, CATALOG_KINDS
+from autocomplete import AutocompleteIndex, SUGGEST_KINDS
+from analytics import ListeningAnalytics, ANALYTICS_DIMENSIONS, ANALYTICS_METRICS, can_analyze, top_sql
+from charts import TrendingCharts, CHART_WINDOWS, CHART_KINDS
+from aggregates import (listen_stats_rebuild_statements, genre_rollup_rebuild_statements,
+                        follow_count_rebuild_statements)
+from compression import ResponseCompressor, PrecompressedCache, is_compressible
+from serialization import serializer_for, dumps, SQLiteDateTime
+from flask_restx.mask import ParseError
+import atexit
+import base64
+import hashlib
 import sqlite3
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.http import http_date, is_resource_modified
+from datetime import datetime, timezone
+from functools import wraps
 import uuid
+from urllib.parse import urlencode
 
 # Initialize Flask application
 app = Flask(__name__)
@@ -22,6 +49,220 @@ api = Api(app,
 
 # SQLite database file path
 DATABASE = 'supertify.db'
+# Maximum number of read-only connections kept open for GET requests
+DB_READ_POOL_SIZE = 8
+# Idle connections older than this (seconds) are pinged before being reused
+DB_POOL_HEALTH_CHECK_INTERVAL = 30.0
+
+# Retry policy for transient "database is locked/busy" errors: jittered
+# exponential backoff starting at DB_BUSY_RETRY_BASE_DELAY, capped at
+# DB_BUSY_RETRY_MAX_DELAY, until DB_BUSY_RETRY_DEADLINE seconds have passed
+DB_BUSY_RETRY_DEADLINE = 5.0
+DB_BUSY_RETRY_BASE_DELAY = 0.01
+DB_BUSY_RETRY_MAX_DELAY = 0.5
+# How long (milliseconds) SQLite itself waits for a lock before reporting busy.
+# Each wait counts against DB_BUSY_RETRY_DEADLINE, so it is kept short: a
+# request gives up after at most the deadline plus one busy timeout.
+DB_BUSY_TIMEOUT_MS = 250
+
+# Storage mode applied to every connection at connect time.
+# WAL lets readers keep going while a write is in progress, NORMAL sync is
+# safe under WAL and avoids an fsync per commit, and busy_timeout makes other
+# processes wait for the lock instead of failing straight away.
+DB_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': DB_BUSY_TIMEOUT_MS
+}
+
+# Read connections are pinned to query_only so a GET can never write, and get
+# a bigger page cache (negative = KiB, so 32 MB per connection) plus a memory
+# map of the database file (256 MB) shared with the OS page cache
+DB_READ_PRAGMAS = {
+    **DB_PRAGMAS,
+    'query_only': 'ON',
+    'cache_size': -32768,
+    'mmap_size': 268435456
+}
+
+# Rows copied per transaction by chunked migration steps, and the pause between
+# batches; small batches keep the write lock short while the API is running
+MIGRATION_BATCH_SIZE = 5000
+MIGRATION_BATCH_PAUSE = 0.0
+
+# HTTP methods whose handlers modify the database
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Busy retry shared by both pools. It only re-runs the statement that opens a
+# transaction (nothing has been written yet at that point), never a whole
+# request; once the deadline expires the client gets a 503
+# (see handle_operational_error below).
+busy_retry = BusyRetry(DB_BUSY_RETRY_DEADLINE, DB_BUSY_RETRY_BASE_DELAY, DB_BUSY_RETRY_MAX_DELAY)
+
+# Read-only connection pool shared by every GET request handler
+db_reader = ConnectionPool(DATABASE, size=DB_READ_POOL_SIZE,
+                           health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
+                           pragmas=DB_READ_PRAGMAS, retry=busy_retry)
+
+# Single writer connection: every mutating request queues for it, so writers
+# inside this process never collide with each other on the SQLite write lock
+db_writer = ConnectionPool(DATABASE, size=1,
+                           health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
+                           pragmas=DB_PRAGMAS, retry=busy_retry)
+
+# Group-commit ingestion for listening history (POST /histories/).
+# Set HISTORY_INGEST_BUFFERED to False to write every play in its own transaction.
+HISTORY_INGEST_BUFFERED = True
+# Flush a batch once it holds this many plays...
+HISTORY_INGEST_BATCH_SIZE = 500
+# ...or once its oldest play has waited this long (seconds)
+HISTORY_INGEST_FLUSH_INTERVAL = 0.05
+# Plays that may wait in memory before new ones are pushed back with a 503
+HISTORY_INGEST_MAX_BUFFER = 10000
+# 'sync': answer once the play's batch is committed (201)
+# 'async': answer as soon as the play is buffered (202); a crash can lose the last batch
+HISTORY_INGEST_DURABILITY = 'sync'
+# In 'sync' mode, give up waiting for the batch after this long (seconds) with a 503
+HISTORY_INGEST_COMMIT_TIMEOUT = 10.0
+
+# Images and audio are kept as files named by their SHA-256 under MEDIA_ROOT;
+# the media columns only hold 'sha256:<hex>' references to them
+MEDIA_ROOT = 'media'
+# Media columns of every table: table -> (primary key, columns)
+MEDIA_COLUMNS = {
+    'Song': ('song_id', ['song_image', 'audio']),
+    'Album': ('album_id', ['album_image']),
+    'Playlist': ('playlist_id', ['playlist_image']),
+    'User': ('user_id', ['user_image']),
+    'MusicGroup': ('group_id', ['group_image'])
+}
+# Bytes read from the database per chunk when streaming inline media
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+# Responses are gzip/deflate compressed (brotli too, if the brotli package is
+# installed) when the client accepts it. Bodies smaller than COMPRESSION_MIN_SIZE
+# bytes aren't worth it; COMPRESSION_LEVEL trades CPU for size (zlib, 1-9).
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_LEVEL = 6
+BROTLI_QUALITY = 5
+# Compressed copies of compressible media store files (SVG artwork, WAV audio, ...)
+# are made once, at the highest level, and kept here
+MEDIA_CACHE_ROOT = 'media_cache'
+
+# Image endpoints serve scaled-down copies with ?size= (needs Pillow). Only these
+# sizes (largest side, pixels) are made, so the cache holds at most one copy of
+# each image per size; copies are kept under THUMBNAIL_CACHE_ROOT.
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+THUMBNAIL_CACHE_ROOT = 'thumbnails'
+# List endpoints link images as ?v=<start of the image's SHA-256>. The content
+# behind such a URL never changes, so it may be cached this long (seconds);
+# URLs without v (or with an outdated one) are revalidated on every use.
+VERSIONED_IMAGE_MAX_AGE = 365 * 24 * 3600
+
+# Collection endpoints return pages of at most this many rows by default;
+# clients may ask for up to MAX_PAGE_SIZE with ?limit=
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Rows fetched and encoded per chunk by streaming export endpoints
+STREAM_FETCH_SIZE = 500
+
+# Search endpoints return the best SEARCH_DEFAULT_LIMIT matches by default;
+# clients may ask for up to SEARCH_MAX_LIMIT with ?limit=
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# /search returns this many results per type by default
+CATALOG_SEARCH_DEFAULT_LIMIT = 5
+# Full-text indexes (see statements.py) and the statements that rebuild them.
+# They point at their tables' rowids, which VACUUM may renumber, so run
+# `manage.py rebuild-search` after a VACUUM.
+SEARCH_INDEXES = {
+    'SongSearch': ("INSERT INTO SongSearch(SongSearch) VALUES ('rebuild')",),
+    'CatalogSearch': catalog_rebuild_statements()
+}
+# Running totals kept by triggers (see aggregates.py) and the statements that
+# recompute them from scratch; `manage.py rebuild-stats` runs them to repair drift
+STATS_TABLES = {
+    'SongListenStats/AlbumListenStats': listen_stats_rebuild_statements(),
+    'GenreListensHourly/GenreListensDaily': genre_rollup_rebuild_statements(),
+    'UserFollowCounts': follow_count_rebuild_statements()
+}
+# /users/most-followed returns this many users by default, at most MOST_FOLLOWED_MAX_LIMIT
+MOST_FOLLOWED_DEFAULT_LIMIT = 10
+MOST_FOLLOWED_MAX_LIMIT = 100
+# Windows offered by /genres/most-listened (SQLite date modifiers going back from now)
+GENRE_LISTEN_WINDOWS = {
+    'hour': '-1 hour',
+    'day': '-1 day',
+    'week': '-7 days',
+    'month': '-1 month'
+}
+# /analytics keeps History in memory as NumPy columns (when numpy is installed),
+# appends new plays at most this often (seconds) and reloads everything this often
+ANALYTICS_REFRESH_INTERVAL = 5.0
+ANALYTICS_REBUILD_INTERVAL = 15 * 60
+ANALYTICS_DEFAULT_LIMIT = 10
+ANALYTICS_MAX_LIMIT = 1000
+# /charts approximates the most played songs and groups with Count-Min sketches:
+# estimates are at most e / CHART_SKETCH_WIDTH of a window's plays too high, except
+# with probability e ** -CHART_SKETCH_DEPTH, and each sketch takes
+# CHART_SKETCH_WIDTH * CHART_SKETCH_DEPTH * 4 bytes (one per window, kind and time bucket)
+CHART_SKETCH_WIDTH = 2048
+CHART_SKETCH_DEPTH = 5
+# Heaviest songs/groups remembered per time bucket, and so the longest chart
+CHART_TOP_K = 100
+CHART_DEFAULT_LIMIT = 10
+# The sketches are saved to ChartSketches this often (seconds) by a background
+# thread once plays come in, and on exit; a crash loses the plays counted since the last save
+CHART_CHECKPOINT_INTERVAL = 60.0
+# /search/suggest returns this many suggestions by default
+SUGGEST_DEFAULT_LIMIT = 10
+# The in-memory autocomplete index picks up renamed, added and deleted names
+# at most this often (seconds) ...
+SUGGEST_REFRESH_INTERVAL = 1.0
+# ... and reloads everything, including plays logged by other processes, this often
+SUGGEST_REBUILD_INTERVAL = 15 * 60
+
+history_ingestor = HistoryIngestor(db_writer,
+                                   batch_size=HISTORY_INGEST_BATCH_SIZE,
+                                   flush_interval=HISTORY_INGEST_FLUSH_INTERVAL,
+                                   max_buffer=HISTORY_INGEST_MAX_BUFFER,
+                                   commit_timeout=HISTORY_INGEST_COMMIT_TIMEOUT,
+                                   durability=HISTORY_INGEST_DURABILITY,
+                                   logger=app.logger)
+# Write out whatever is still buffered when the process exits
+atexit.register(history_ingestor.close)
+
+suggest_index = AutocompleteIndex(refresh_interval=SUGGEST_REFRESH_INTERVAL,
+                                  rebuild_interval=SUGGEST_REBUILD_INTERVAL)
+# Plays rank suggestions as soon as they are written
+history_ingestor.add_listener(suggest_index.add_plays)
+listening_analytics = ListeningAnalytics(refresh_interval=ANALYTICS_REFRESH_INTERVAL,
+                                         rebuild_interval=ANALYTICS_REBUILD_INTERVAL)
+trending_charts = TrendingCharts(width=CHART_SKETCH_WIDTH, depth=CHART_SKETCH_DEPTH, top_k=CHART_TOP_K,
+                                 checkpoint_interval=CHART_CHECKPOINT_INTERVAL)
+
+def count_chart_plays(events):
+    """
+    Count written plays in the trending charts. Saving the sketches is left to
+    their background checkpoint thread, so a request never waits for it.
+    """
+    trending_charts.start_checkpoints(db_writer.acquire)
+    trending_charts.add_plays(events, db_reader.acquire)
+
+history_ingestor.add_listener(count_chart_plays)
+
+def save_charts():
+    """Write out the buffered plays, then save the sketches counting them"""
+    history_ingestor.close()
+    trending_charts.checkpoint(db_writer.acquire, force=True)
+
+atexit.register(save_charts)
+
+media_store = FileSystemMediaStore(MEDIA_ROOT)
+media_cache = PrecompressedCache(MEDIA_CACHE_ROOT)
+thumbnail_cache = DerivedMediaCache(THUMBNAIL_CACHE_ROOT)
+response_compressor = ResponseCompressor(min_size=COMPRESSION_MIN_SIZE, level=COMPRESSION_LEVEL,
+                                         brotli_quality=BROTLI_QUALITY)
 
 @app.before_request
 def force_json():
@@ -57,13 +298,7 @@ def init_db():
             cursor.execute(statement)
             
         # We also need a table for user authentication
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS Authentication (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password TEXT NOT NULL
-            )
-        """)
+        cursor.execute(authentication_table)
         connection.commit()
         print("Database all set up and ready to go!")
     except sqlite3.Error as e:
@@ -71,10 +306,56 @@ def init_db():
     finally:
         connection.close()
 
+def schema_fingerprint():
+    """
+    Compute a fingerprint of the schema this code expects.
+    
+    It is a hash of every CREATE statement and migration version, squeezed into the positive range of
+    SQLite's 32-bit `PRAGMA user_version` so it can be stored in the database header.
+    
+    Returns:
+        int: A non-zero fingerprint that changes whenever statements.py changes
+    """
+    ddl = "\n".join(statements + [authentication_table] +
+                    [f"migration {m.version}" for m in MIGRATIONS])
+    return int(hashlib.sha1(ddl.encode('utf-8')).hexdigest()[:7], 16) or 1
+
+def get_schema_version():
+    """Read the fingerprint stored in the database header (O(1), no table scans)"""
+    connection = sqlite3.connect(DATABASE)
+    try:
+        return connection.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        connection.close()
+
+def set_schema_version(version):
+    """Record the schema fingerprint in the database header"""
+    connection = sqlite3.connect(DATABASE)
+    try:
+        connection.execute(f"PRAGMA user_version = {int(version)}")
+        connection.commit()
+    finally:
+        connection.close()
+
+def migration_runner(batch_size=None, pause=None):
+    """
+    Create the versioned migration runner for this database.
+    
+    Args:
+        batch_size (int): Rows copied per transaction by chunked steps
+        pause (float): Seconds to wait between batches so live writers get the lock
+    """
+    return MigrationRunner(DATABASE, MIGRATIONS,
+                           batch_size=batch_size or MIGRATION_BATCH_SIZE,
+                           pause=MIGRATION_BATCH_PAUSE if pause is None else pause)
+
 def check_db_schema():
     """
     Check the database schema to identify any issues with table structure.
     This is useful for debugging issues with table creation and data insertion.
+    
+    It counts every row of every table, so on a big database it is slow; it is
+    not part of startup and runs only through `python manage.py check-schema`.
     """
     connection = sqlite3.connect(DATABASE)
     cursor = connection.cursor()
@@ -128,142 +409,115 @@ def check_db_schema():
     print("\n--------- End of Schema Check ---------\n")
     connection.close()
 
-# Call the schema check function after db initialization
-# Note: before_first_request is deprecated in newer Flask, using alternative approach
-@app.before_request
-def setup_before_request():
+def prepare_database(with_dummy_data=True, force=False):
     """
-    Initializes the database before handling any requests.
-    Uses a global variable to ensure initialization happens only once.
+    Bring the database up to date before the API starts serving.
+    
+    Runs pending migrations, creates tables and loads the sample data. This
+    used to run inside the first request of every worker; it now runs once
+    from `python manage.py setup` (or `python api.py`) before any worker
+    starts, so workers boot without doing schema work.
+    
+    The schema fingerprint is stored in `PRAGMA user_version` afterwards, so
+    when nothing changed the whole step is a single header read.
+    
+    Args:
+        with_dummy_data (bool): Also insert the sample data set
+        force (bool): Run every step even if the fingerprint already matches
+    
+    Returns:
+        bool: True if any work was done, False if the database was already current
     """
-    global _initialization_done
+    expected = schema_fingerprint()
+    if not force and get_schema_version() == expected:
+        print(f"Database schema is up to date (fingerprint {expected:07x}).")
+        return False
     
-    if not getattr(app, '_initialization_done', False):
-        init_db()
-        check_db_schema()  # Check the schema after initialization
-        
-        # Migrate genre data if needed
-        migrate_genre_data()
-        
-        # Migrate genre structure to new format
-        migrate_genre_structure()
-        
+    # Rewrite legacy layouts first, then create anything missing, then
+    # run the migrations that need the current tables to exist
+    migration_runner().run(phase='pre')
+    init_db()
+    migration_runner().run(phase='post')
+    
+    if with_dummy_data:
         # Try to insert dummy data after initialization
         try:
             insert_dummy_data(DATABASE)
         except Exception as e:
             print(f"Notice: Could not insert dummy data: {str(e)}")
-            
-        app._initialization_done = True
-
-def migrate_genre_data():
-    """
-    Migrate data from the old Genre table structure to the new many-to-many structure.
-    This function should be called after init_db() to ensure data consistency.
-    """
-    connection = sqlite3.connect(DATABASE)
-    cursor = connection.cursor()
     
-    try:
-        # Check if old genre table exists by looking for a song_id column in Genre table
-        cursor.execute("PRAGMA table_info(Genre)")
-        columns = cursor.fetchall()
-        has_old_structure = any(column[1] == 'song_id' for column in columns)
-        
-        if has_old_structure:
-            print("Detected old Genre table structure. Migrating data...")
-            
-            # Check if SongGenre table exists
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='SongGenre'")
-            has_songgenre_table = cursor.fetchone() is not None
-            
-            if not has_songgenre_table:
-                print("SongGenre table not found. Migration cannot proceed.")
-                return
-            
-            # Get existing genre data
-            cursor.execute("SELECT song_id, genre FROM Genre")
-            old_genres = cursor.fetchall()
-            
-            for song_id, genre_name in old_genres:
-                # Create or get genre_id for this genre name
-                cursor.execute("SELECT genre_id FROM Genre WHERE genre_name = ?", (genre_name,))
-                genre_row = cursor.fetchone()
-                
-                if genre_row:
-                    genre_id = genre_row[0]
-                else:
-                    # Create new genre
-                    genre_id = str(uuid.uuid4())
-                    cursor.execute("INSERT INTO Genre (genre_id, genre_name) VALUES (?, ?)", 
-                                   (genre_id, genre_name))
-                
-                # Create song-genre relationship
-                try:
-                    cursor.execute("INSERT INTO SongGenre (song_id, genre_id) VALUES (?, ?)",
-                                   (song_id, genre_id))
-                except sqlite3.IntegrityError:
-                    # Relationship might already exist - ignore
-                    pass
-            
-            # Rename old Genre table to backup
-            cursor.execute("ALTER TABLE Genre RENAME TO Genre_Old")
-            
-            # Create new Genre table with updated schema
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS Genre (
-                    genre_id CHAR(36) PRIMARY KEY,
-                    genre_name VARCHAR(50) NOT NULL UNIQUE CHECK (length(genre_name) > 0)
-                )
-            """)
-            
-            # Populate new Genre table with unique genres
-            cursor.execute("""
-                INSERT INTO Genre (genre_id, genre_name)
-                SELECT DISTINCT genre_id, genre_name FROM Genre_Old
-            """)
-            
-            connection.commit()
-            print("Genre data migration completed successfully.")
-            
-    except sqlite3.Error as e:
-        connection.rollback()
-        print(f"Error during genre data migration: {str(e)}")
-    finally:
-        connection.close()
+    set_schema_version(expected)
+    return True
 
 # Helper function to get database connection
-def get_db_connection(timeout=30.0):
+def get_db_connection(timeout=30.0, write=None):
     """
-    Create and return a new database connection with row factory enabled.
+    Borrow a database connection from the shared pools.
+    
+    Requests that modify data (POST/PUT/PATCH/DELETE) get the single writer
+    connection and queue behind each other for it; everything else reads
+    from the read-only pool. Calling close() on the returned connection hands it
+    back rather than closing it, so callers use it exactly like a fresh connection.
     
     Args:
-        timeout (float): Timeout in seconds for the database connection
+        timeout (float): How long to wait (in seconds) for a free pooled connection
+        write (bool): Force the writer (True) or the read pool (False); by default
+                      it is picked from the current request's HTTP method, and code
+                      running outside a request gets the writer
         
     Returns:
         sqlite3.Connection: An active connection to the SQLite database with row_factory
                            enabled for dict-like access to rows.
     """
-    connection = sqlite3.connect(DATABASE, timeout=timeout)
-    connection.row_factory = sqlite3.Row
-    return connection
+    if write is None:
+        write = not has_request_context() or request.method in WRITE_METHODS
+    if write:
+        return db_writer.acquire(timeout)
+    return db_reader.acquire(timeout)
+
+@app.after_request
+def compress_response(response):
+    """Compress the response body with the best encoding the client accepts"""
+    return response_compressor(request, response)
+
+@app.teardown_request
+def release_db_connection(exception=None):
+    """
+    Return any connection a handler forgot to close back to the pool
+    so a missing close() can never leak a pool slot or hold up the writer queue.
+    """
+    db_reader.release_thread()
+    db_writer.release_thread()
+
+@api.errorhandler(sqlite3.OperationalError)
+def handle_operational_error(error):
+    """
+    Turn database errors that escaped a handler into JSON responses.
+    
+    Busy/locked errors get here once the pools' busy retry has run out of
+    time, or when they hit a statement inside an open transaction.
+    """
+    if is_busy_error(error):
+        return {"message": "Database is currently busy, please try again"}, 503, {'Retry-After': '1'}
+    return {"message": f"Database error: {str(error)}"}, 500
 
 # Context manager for database connection to ensure proper closing
 class DBConnection:
     """
-    Context manager for database connections to ensure proper closing
-    even when exceptions occur.
+    Context manager for database connections to ensure the connection is
+    committed or rolled back and handed back to the pool even when exceptions occur.
     
     Usage:
         with DBConnection() as conn:
             # use conn for database operations
     """
-    def __init__(self, timeout=30.0):
+    def __init__(self, timeout=30.0, write=None):
         self.timeout = timeout
+        self.write = write
         self.conn = None
         
     def __enter__(self):
-        self.conn = get_db_connection(self.timeout)
+        self.conn = get_db_connection(self.timeout, self.write)
         return self.conn
         
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -286,6 +540,483 @@ def generate_uuid():
     """
     return str(uuid.uuid4())
 
+# Query parameters shared by every paginated collection endpoint (for Swagger)
+PAGINATION_PARAMS = {
+    'limit': {'description': f'Maximum number of items to return (1-{MAX_PAGE_SIZE}, default {DEFAULT_PAGE_SIZE})',
+              'type': 'integer', 'in': 'query'},
+    'after': {'description': 'Cursor from the X-Next-Cursor header of the previous page',
+              'type': 'string', 'in': 'query'}
+}
+
+def keyset_page(keys, descending=False):
+    """
+    Read the `limit` and `after` query parameters of a collection request.
+    
+    Call it before opening a connection: an invalid limit or cursor ends the
+    request with a 400 response.
+    
+    Args:
+        keys (list): Unique ordering columns of the listing (its primary key)
+        descending (bool): List the newest/highest keys first
+        
+    Returns:
+        KeysetPage: Use its fetch() to run the listing query for this page
+    """
+    try:
+        return KeysetPage.from_args(keys, request.args, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, descending)
+    except InvalidPageRequest as e:
+        abort(400, str(e))
+
+# Query parameter of list endpoints that accept a sparse fieldset (for Swagger)
+FIELDS_PARAM = {
+    'fields': {'description': 'Comma separated fields to return (the key is always included); '
+                              'by default everything except media, which is linked via *_url fields',
+               'type': 'string', 'in': 'query'}
+}
+
+def select_fields(fieldset, source=None):
+    """
+    Read the `fields` query parameter of a list request.
+    
+    Call it before opening a connection: an unknown field ends the request
+    with a 400 response.
+    
+    Args:
+        fieldset (FieldSet): The fields the endpoint can return
+        source (str): FROM clause to select from instead of the fieldset's table
+        
+    Returns:
+        tuple: (SELECT query reading only the needed columns, marshal mask)
+    """
+    try:
+        return fieldset.select(request.args.get('fields'), source)
+    except InvalidFieldSet as e:
+        abort(400, str(e))
+
+# Query parameter of search endpoints (for Swagger)
+SEARCH_PARAMS = {
+    'limit': {'description': f'Maximum number of results (1-{SEARCH_MAX_LIMIT}, default {SEARCH_DEFAULT_LIMIT})',
+              'type': 'integer', 'in': 'query'}
+}
+
+def search_request(text, default_limit=SEARCH_DEFAULT_LIMIT):
+    """
+    Read the search text and `limit` query parameter of a search request.
+    
+    Call it before opening a connection: search text without any word or an
+    invalid limit ends the request with a 400 response.
+    
+    Args:
+        text (str): The search text
+        default_limit (int): Limit when the request has none
+    
+    Returns:
+        tuple: (FTS5 MATCH expression, limit)
+    """
+    query = fts_query(text or '')
+    if query is None:
+        abort(400, "Search text must contain at least one letter or digit")
+    return query, limit_arg(default_limit, SEARCH_MAX_LIMIT)
+
+def limit_arg(default, maximum):
+    """
+    Read the `limit` query parameter of a top-N request; a limit that isn't an
+    integer from 1 to `maximum` ends the request with a 400 response.
+    """
+    limit = request.args.get('limit', default)
+    try:
+        limit = int(limit)
+    except ValueError:
+        abort(400, "limit must be an integer")
+    if not 1 <= limit <= maximum:
+        abort(400, f"limit must be between 1 and {maximum}")
+    return limit
+
+def search_kinds(kinds):
+    """
+    Read the `types` query parameter of a search request (comma separated);
+    an unknown type ends the request with a 400 response.
+    
+    Args:
+        kinds (list): The types the endpoint searches
+    
+    Returns:
+        list: The requested types, all of `kinds` by default
+    """
+    if not request.args.get('types'):
+        return kinds
+    requested = [kind.strip() for kind in request.args['types'].split(',') if kind.strip()]
+    if not requested or any(kind not in kinds for kind in requested):
+        abort(400, f"types must be chosen from: {', '.join(kinds)}")
+    return requested
+
+def list_response(ns, model, description='Success'):
+    """
+    Document a list endpoint's 200 response the way ns.marshal_list_with(model)
+    does (array of `model`, X-Fields mask header) without marshalling the result:
+    paged() serializes the rows itself with the model's compiled serializer.
+    """
+    return ns.doc(responses={'200': (description, [model], {})}, __mask__=True)
+
+def paged(page, rows, model=None, mask=None):
+    """
+    Build the response for one page of a collection.
+    
+    The body stays a plain JSON list; when more rows follow, the cursor for the
+    next page is sent in the X-Next-Cursor header and as a Link: rel="next" URL.
+    
+    Rows are encoded straight to JSON by the compiled serializer of `model`
+    (see serialization.py), which gives the same output as marshal_list_with
+    at a fraction of the cost on big pages.
+    
+    Args:
+        page (KeysetPage): The page the rows were fetched for
+        rows (list): The rows of the page
+        model (Model): Model the rows are documented with; rows are output
+                       as they are without one
+        mask (str): Fields of `model` to output (from select_fields());
+                    defaults to the X-Fields header, like marshal_with
+    
+    Returns:
+        Response: The JSON list of items with the paging headers (or a 400
+                  for a malformed X-Fields header)
+    """
+    headers = {}
+    if page.next_cursor:
+        args = request.args.to_dict()
+        args.update(limit=page.limit, after=page.next_cursor)
+        headers['X-Next-Cursor'] = page.next_cursor
+        headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return json_list(rows, model, mask, headers)
+
+def json_list(rows, model=None, mask=None, headers=None):
+    """
+    Encode rows as a JSON list response with the model's compiled serializer
+    (see paged() for the arguments).
+    """
+    if model is None:
+        body = dumps([dict(row) for row in rows])
+    else:
+        mask = mask or request.headers.get(app.config.get('RESTX_MASK_HEADER', 'X-Fields'))
+        try:
+            body = serializer_for(model).dumps(rows, mask)
+        except ParseError as e:
+            # (not abort(): handlers turn any exception they catch into a 500)
+            return {"message": f"Invalid field mask: {e}"}, 400
+    return Response(body + b'\n', status=200, headers=headers or {}, mimetype='application/json')
+
+def streamed(page, query, model, where=None, params=()):
+    """
+    Stream every row of a listing instead of returning one page.
+    
+    Rows are read with fetchmany() on a read connection that is held only
+    while the body is being sent, marshalled with the same model as the paged
+    endpoint and encoded chunk by chunk, so memory use does not grow with the
+    number of rows. The export starts after the page's `after` cursor, if any.
+    
+    The format is taken from ?format=json|ndjson, or NDJSON if the client
+    accepts application/x-ndjson, and a JSON array otherwise.
+    
+    Returns:
+        Response: A streamed response
+    """
+    stream_format = request.args.get('format')
+    if stream_format is None:
+        stream_format = 'ndjson' if NDJSON_MIMETYPE in request.headers.get('Accept', '') else 'json'
+    if stream_format not in STREAM_FORMATS:
+        abort(400, f"format must be one of: {', '.join(STREAM_FORMATS)}")
+    body = stream_rows(db_reader.acquire,
+                       lambda connection: page.execute(connection, query, where, params),
+                       serializer_for(model).to_dicts,
+                       stream_format, STREAM_FETCH_SIZE)
+    return Response(body, mimetype=STREAM_FORMATS[stream_format])
+
+def send_media(table, key, item_id, column):
+    """
+    Send the media stored in one column of one row as a file.
+    
+    Range requests are supported, so players can seek and start playback
+    without downloading the whole file: media in the media store is sent
+    straight from disk (sendfile where the server supports it), and media
+    still stored inline is streamed in chunks through SQLite incremental blob
+    I/O, reading only the requested bytes.
+    
+    Args:
+        table (str): Table holding the media
+        key (str): Primary key column of the table
+        item_id (str): Primary key value of the row
+        column (str): Media column to send
+        
+    Returns:
+        Response: The media (200, or 206 for a range) with a Content-Type guessed
+                  from its content, or a 404 if the row or its media doesn't exist
+    """
+    connection = get_db_connection()
+    try:
+        # typeof() doesn't read the value itself, so this never loads the media
+        row = connection.execute(f'SELECT rowid, typeof({column}) FROM {table} WHERE {key} = ?',
+                                 (item_id,)).fetchone()
+        if row is None:
+            return {"message": f"{table} not found"}, 404
+        rowid, kind = row
+        if kind not in ('blob', 'text'):
+            return {"message": f"No {column} stored for this {table}"}, 404
+        with connection.blobopen(table, column, rowid, readonly=True) as blob:
+            ref = read_media_ref(blob)
+            if ref is None:
+                inline = InlineMedia(blob, kind == 'text')
+                size = inline.size
+                head = inline.read(0, 16)
+    except ValueError as e:
+        return {"message": str(e)}, 500
+    finally:
+        connection.close()
+
+    if ref is not None:
+        try:
+            path = media_store.path(ref)
+        except FileNotFoundError:
+            return {"message": f"The {column} file is missing from the media store"}, 404
+        with open(path, 'rb') as f:
+            mimetype = guess_mimetype(f.read(16))
+        # Compressible media is sent from its pre-compressed copy (ranges are
+        # served from the original, so their offsets stay meaningful)
+        encoding = None
+        if request.range is None and is_compressible(mimetype):
+            encoding = response_compressor.choose(request.accept_encodings)
+        if encoding is not None:
+            cached = media_cache.path(ref[len(MEDIA_REF_PREFIX):], encoding,
+                                      lambda: media_store.read(ref))
+            if cached is not None:
+                response = send_file(cached, mimetype=mimetype, conditional=True)
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                return response
+        return send_file(path, mimetype=mimetype, conditional=True)
+
+    # Media that was stored inline before the media store existed
+    headers = {'Accept-Ranges': 'bytes'}
+    start, stop, status = 0, size, 200
+    if request.range is not None:
+        span = request.range.range_for_length(size)
+        if span is None:
+            if len(request.range.ranges) == 1:
+                return {"message": "Requested range not satisfiable"}, 416, {'Content-Range': f'bytes */{size}'}
+        else:
+            # (multi-range requests are answered with the whole file)
+            start, stop = span
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    headers['Content-Length'] = str(stop - start)
+    body = stream_inline_media(db_reader.acquire, table, column, rowid, kind == 'text',
+                               start, stop, MEDIA_CHUNK_SIZE)
+    return Response(body, status=status, headers=headers, mimetype=guess_mimetype(head),
+                    direct_passthrough=True)
+
+# Query parameters of the image endpoints (for Swagger)
+THUMBNAIL_PARAMS = {
+    'size': {'description': 'Scale the image down to fit this many pixels (largest side)',
+             'type': 'integer', 'in': 'query', 'enum': list(THUMBNAIL_SIZES)},
+    'v': {'description': 'Image version, as in the *_image_url links of list endpoints; '
+                         'the response for a current version may be cached for good',
+          'type': 'string', 'in': 'query'}
+}
+
+def send_image(table, key, item_id, column):
+    """
+    Send an image column, scaled down to the `size` query parameter if given.
+    
+    Only the image's digest column is read to answer, so revalidations never
+    read the image. Thumbnails are made once per image and size and cached on
+    disk under the SHA-256 of the original, which also serves as their ETag.
+    A URL whose `v` matches the digest is marked immutable; any other is
+    revalidated on every use. Images that already fit, can't be decoded, or
+    can't be resized because Pillow isn't installed are sent at their original size.
+    
+    An image still stored inline (from before the media store existed) is
+    moved to the media store the first time it is asked for.
+    
+    Args:
+        table (str): Table holding the image
+        key (str): Primary key column of the table
+        item_id (str): Primary key value of the row
+        column (str): Image column to send
+        
+    Returns:
+        Response: The (scaled) image, a 304, or an error message
+    """
+    size = None
+    if 'size' in request.args:
+        size = request.args.get('size', type=int)
+        if size not in THUMBNAIL_SIZES:
+            return {"message": f"size must be one of: {', '.join(map(str, THUMBNAIL_SIZES))}"}, 400
+    
+    with DBConnection() as connection:
+        # typeof() doesn't read the value itself, so this never loads the image
+        row = connection.execute(f'SELECT rowid, {column}_digest, typeof({column}) FROM {table} WHERE {key} = ?',
+                                 (item_id,)).fetchone()
+    if row is None:
+        return {"message": f"{table} not found"}, 404
+    rowid, digest, kind = row
+    if kind not in ('blob', 'text'):
+        return {"message": f"No {column} stored for this {table}"}, 404
+    if digest is None:
+        try:
+            with DBConnection(write=True) as connection:
+                ref = externalize_value(connection, media_store, table, column, rowid)
+        except ValueError as e:
+            return {"message": str(e)}, 500
+        if ref is None:
+            return {"message": f"No {column} stored for this {table}"}, 404
+        digest = ref[len(MEDIA_REF_PREFIX):]
+    
+    if request.args.get('v') == digest[:16]:
+        cache_control = f'public, max-age={VERSIONED_IMAGE_MAX_AGE}, immutable'
+    else:
+        cache_control = 'private, no-cache'
+    if size is None or not can_resize():
+        response = send_media(table, key, item_id, column)
+        if isinstance(response, Response):
+            response.headers['Cache-Control'] = cache_control
+        return response
+    
+    ref = MEDIA_REF_PREFIX + digest
+    etag = f'{digest[:32]}-{size}'
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': cache_control}
+    if not is_resource_modified(request.environ, etag=etag):
+        return Response(status=304, headers=headers)
+    try:
+        path = thumbnail_cache.path(digest, str(size), lambda: resize_image(media_store.read(ref), size))
+        data = media_store.read(ref) if path is None else None
+    except FileNotFoundError:
+        return {"message": f"The {column} file is missing from the media store"}, 404
+    if path is None:
+        return Response(data, headers=headers, mimetype=guess_mimetype(data))
+    with open(path, 'rb') as f:
+        mimetype = guess_mimetype(f.read(16))
+    response = send_file(path, mimetype=mimetype, etag=False, conditional=False)
+    response.headers.update(headers)
+    return response
+
+def parse_db_timestamp(value):
+    """Turn a CURRENT_TIMESTAMP string (UTC) into an aware datetime, or None"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def conditional_get(table, key):
+    """
+    Decorator adding ETag / Last-Modified validation to a single-item GET.
+    
+    Before the handler runs, only the row's version columns are read (kept up
+    to date by the row version triggers in statements.py). If the client's
+    If-None-Match or If-Modified-Since shows it already has this version, a
+    304 is returned without loading or serializing the row; otherwise the
+    handler's 200 response gets the ETag and Last-Modified headers.
+    
+    Put it between @jwt_required() and the marshalling decorator.
+    
+    Args:
+        table (str): Row-versioned table the resource reads
+        key (str): Primary key column, also the name of the URL parameter
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with DBConnection() as connection:
+                row = connection.execute(
+                    f'SELECT rowid, created_at, last_modified, row_version FROM {table} WHERE {key} = ?',
+                    (kwargs[key],)
+                ).fetchone()
+            if row is None:
+                # Let the handler answer the 404
+                return fn(*args, **kwargs)
+            
+            # Strong validator: changes with every update, and differs for a row
+            # that was deleted and created again under the same key
+            etag = hashlib.sha1(f"{row['rowid']}:{row['created_at']}:{row['row_version']}".encode()).hexdigest()[:20]
+            last_modified = parse_db_timestamp(row['last_modified'])
+            headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+            if last_modified is not None:
+                headers['Last-Modified'] = http_date(last_modified)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                return Response(status=304, headers=headers)
+            
+            data, code, response_headers = unpack(fn(*args, **kwargs))
+            if code == 200:
+                response_headers = {**response_headers, **headers}
+            return data, code, response_headers
+        return wrapper
+    return decorator
+
+def store_media(data, *columns):
+    """
+    Move uploaded media out of a request body into the media store.
+    
+    Each base64 value in `columns` is decoded, saved in the media store (once
+    per distinct content) and replaced in `data` by its reference, so only the
+    reference is written to the database. Call it before opening a connection:
+    invalid media ends the request with a 400 response.
+    
+    Args:
+        data (dict): The parsed request body; modified in place
+        columns (str): Media fields of the body
+    """
+    for column in columns:
+        value = data.get(column)
+        if value is None:
+            continue
+        if is_media_ref(value):
+            if not media_store.exists(value):
+                abort(400, f"{column} refers to media that is not stored")
+            continue
+        try:
+            data[column] = media_store.put(decode_media(value))
+        except (ValueError, TypeError, AttributeError):
+            abort(400, f"{column} must be base64 encoded")
+
+def inline_media(item, *columns):
+    """
+    Replace media references in a single row with the base64 content, so the
+    single-item endpoints keep returning media inline as before.
+    
+    Args:
+        item (dict): The row as a dict; modified in place
+        columns (str): Media fields of the row
+        
+    Returns:
+        dict: `item`
+    """
+    for column in columns:
+        value = item.get(column)
+        if is_media_ref(value):
+            try:
+                item[column] = base64.b64encode(media_store.read(value)).decode('ascii')
+            except FileNotFoundError:
+                item[column] = None
+    return item
+
+class ImageUrl(fields.Url):
+    """
+    URL of an image endpoint, versioned with ?v= and the start of the image's
+    digest when the row has one, so clients can cache the image for good.
+    
+    Args:
+        endpoint (str): The image endpoint
+        digest (str): Row field holding the image's digest (see media.IMAGE_COLUMNS)
+    """
+    def __init__(self, endpoint, digest, **kwargs):
+        super().__init__(endpoint, **kwargs)
+        self.digest = digest
+    
+    def output(self, key, obj, **kwargs):
+        url = super().output(key, obj, **kwargs)
+        digest = obj[self.digest] if self.digest in obj.keys() else None
+        return f"{url}?v={digest[:16]}" if digest else url
+
 # ---------------------------- Authentication ----------------------------
 auth_ns = Namespace('auth', 
                    description="Authentication operations for user login and registration")
@@ -373,30 +1104,25 @@ account_model = api.model('Account', {
     'password_salt': fields.String(required=True, description="Password salt"),
     'full_name': fields.String(description="The full name"),
     'is_subscriber': fields.Boolean(description="Subscription status"),
-    'registration_date': fields.DateTime(dt_format='iso8601', description="Registration timestamp"),
+    'registration_date': SQLiteDateTime(dt_format='iso8601', description="Registration timestamp"),
     'country': fields.String(description="Country"),
     'sex': fields.String(description="Gender", enum=['Male', 'Female', 'Other', 'Prefer not to say']),
     'language': fields.String(required=True, description="Preferred language"),
     'birth_date': fields.Date(description="Date of birth (YYYY-MM-DD)"),
-    'last_login': fields.DateTime(dt_format='iso8601', description="Last login timestamp")
+    'last_login': SQLiteDateTime(dt_format='iso8601', description="Last login timestamp")
 })
 
 @account_ns.route('/')
 class AccountList(Resource):
     @jwt_required()
-    @account_ns.marshal_list_with(account_model)
+    @list_response(account_ns, account_model)
+    @account_ns.doc(params=PAGINATION_PARAMS)
     def get(self):
-        """Get all accounts"""
-        try:
-            with DBConnection() as connection:
-                accounts = connection.execute('SELECT * FROM Account').fetchall()
-                return [dict(account) for account in accounts]
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        """Get all accounts, one page at a time"""
+        page = keyset_page(['account_id'])
+        with DBConnection() as connection:
+            accounts = page.fetch(connection, 'SELECT * FROM Account')
+            return paged(page, accounts, account_model)
 
     @jwt_required()
     @account_ns.expect(account_model)
@@ -519,28 +1245,45 @@ user_model = api.model('User', {
     'favorite_genre': fields.String(description="User's preferred music genre"),
     'user_image': fields.String(description="Profile image encoded in base64 format")
 })
+user_list_model = api.clone('UserListItem', user_model, {
+    'user_image_url': ImageUrl('user_image', 'user_image_digest', readonly=True,
+                               description="Where to download the profile image (cacheable for good)")
+})
+follow_counts_model = api.model('UserFollowCounts', {
+    'user_id': fields.String(description="The user's ID"),
+    'nickname': fields.String(description="User's public display name"),
+    'follower_count': fields.Integer(description="How many users follow this user"),
+    'following_count': fields.Integer(description="How many users this user follows")
+})
+user_fields = FieldSet('User', ['user_id'], ['user_id', 'nickname', 'favorite_genre', 'user_image'],
+                       media=['user_image'], links=['user_image_url'],
+                       link_columns={'user_image_url': 'user_image_digest'})
 
 @user_ns.route('/')
 class UserList(Resource):
     """Resource for managing the collection of users"""
     
     @jwt_required()
-    @user_ns.marshal_list_with(user_model)
-    @user_ns.doc(responses={
-        200: 'Success - Returns list of users',
+    @user_ns.response(200, 'Success - Returns a page of users', [user_list_model])
+    @user_ns.doc(params={**PAGINATION_PARAMS, **FIELDS_PARAM}, responses={
+        400: 'Bad request - Invalid limit, cursor or fields',
         401: 'Unauthorized - Invalid or missing token'
     })
     def get(self):
         """
         Get all registered users
         
-        Returns a list of all users in the system with their basic profile information.
+        Returns a page of the users in the system with their basic profile information,
+        ordered by user_id. Pass the X-Next-Cursor header as ?after= to get the next page.
+        Profile images are not included unless asked for with ?fields=; user_image_url links to them.
         Requires authentication.
         """
+        page = keyset_page(['user_id'])
+        query, mask = select_fields(user_fields)
         connection = get_db_connection()
-        users = connection.execute('SELECT * FROM User').fetchall()
+        users = page.fetch(connection, query)
         connection.close()
-        return [dict(user) for user in users]
+        return paged(page, users, user_list_model, mask)
 
     @jwt_required()
     @user_ns.expect(user_model)
@@ -552,6 +1295,7 @@ class UserList(Resource):
     def post(self):
         """Create a new user"""
         data = request.json
+        store_media(data, 'user_image')
         
         # Check nickname length constraint
         if len(data.get('nickname', '')) < 3:
@@ -573,18 +1317,13 @@ class UserList(Resource):
             return {"message": "User created successfully", "user_id": data['user_id']}, 201
         except sqlite3.IntegrityError:
             return {"message": "A user with this nickname already exists"}, 409
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
 
 @user_ns.route('/<string:user_id>')
 class User(Resource):
     """Resource for managing individual user profiles"""
     
     @jwt_required()
+    @conditional_get('User', 'user_id')
     @user_ns.marshal_with(user_model)
     @user_ns.doc(responses={
         200: 'Success - Returns user details',
@@ -602,13 +1341,14 @@ class User(Resource):
         connection.close()
         if user is None:
             return {"message": "User not found"}, 404
-        return dict(user)
+        return inline_media(dict(user), 'user_image')
 
     @jwt_required()
     @user_ns.expect(user_model)
     def put(self, user_id):
         """Update a user"""
         data = request.json
+        store_media(data, 'user_image')
         connection = get_db_connection()
         connection.execute('UPDATE User SET nickname = ?, favorite_genre = ?, user_image = ? WHERE user_id = ?',
                            (data['nickname'], data.get('favorite_genre'), data.get('user_image'), user_id))
@@ -625,56 +1365,127 @@ class User(Resource):
         connection.close()
         return {"message": "User deleted successfully"}, 200
 
+@user_ns.route('/<string:user_id>/image', endpoint='user_image')
+class UserImage(Resource):
+    @jwt_required()
+    @user_ns.produces(['image/png', 'image/jpeg', 'image/gif', 'image/webp'])
+    @user_ns.doc(params=THUMBNAIL_PARAMS, responses={
+        200: 'The profile image',
+        304: 'Not modified - the cached thumbnail is still current',
+        400: 'Bad request - Unsupported size',
+        404: 'User or image not found'
+    })
+    def get(self, user_id):
+        """Download a user's profile image, optionally scaled down with ?size="""
+        return send_image('User', 'user_id', user_id, 'user_image')
+
 # get the user with nickname
 @user_ns.route('/nickname/<string:nickname>')
 class UserByNickname(Resource):
     @jwt_required()
-    @user_ns.marshal_with(user_model)
+    @user_ns.response(200, 'Success', [user_list_model])
+    @user_ns.doc(params={**PAGINATION_PARAMS, **FIELDS_PARAM})
     def get(self, nickname):
-        """Get a user by nickname"""
+        """Get users by nickname, one page at a time"""
+        page = keyset_page(['user_id'])
+        query, mask = select_fields(user_fields)
         connection = get_db_connection()
-        users = connection.execute('SELECT * FROM User WHERE nickname = ?', (nickname,)).fetchall()
+        users = page.fetch(connection, query, where='nickname = ?', params=(nickname,))
         connection.close()
         if not users:
             return {"message": "User not found"}, 404
-        return [dict(user) for user in users]
+        return paged(page, users, user_list_model, mask)
 
-# a complex query to get all users with their follower counts
+# all users with their follower counts, read from the trigger-maintained UserFollowCounts
 @user_ns.route('/follower-counts')
 class UserFollowerCounts(Resource):
     @jwt_required()
+    @list_response(user_ns, follow_counts_model)
+    @user_ns.doc(params=PAGINATION_PARAMS)
     def get(self):
-        """Get all users with their follower counts"""
+        """Get all users with their follower and following counts, one page at a time"""
+        page = keyset_page(['User.user_id'])
         connection = get_db_connection()
-        cursor = connection.cursor()
         
         query = """
-        SELECT User.user_id, User.nickname, COALESCE(f.follower_count, 0) as follower_count
+        SELECT User.user_id, User.nickname,
+               COALESCE(UserFollowCounts.follower_count, 0) AS follower_count,
+               COALESCE(UserFollowCounts.following_count, 0) AS following_count
         FROM User
-        LEFT JOIN (
-            SELECT user_id_2, COUNT(*) AS follower_count
-            FROM Follower
-            GROUP BY user_id_2
-        ) AS f
-        ON User.user_id = f.user_id_2
+        LEFT JOIN UserFollowCounts ON UserFollowCounts.user_id = User.user_id
         """
 
         try:
-            results = cursor.execute(query).fetchall()
-            follower_counts = [
-                {
-                    'user_id': row['user_id'],
-                    'nickname': row['nickname'],
-                    'follower_count': row['follower_count']
-                }
-                for row in results
-            ]
-            return follower_counts, 200
+            results = page.fetch(connection, query)
+            return paged(page, results, follow_counts_model)
         except sqlite3.Error as e:
             return {'message': f'Database error: {str(e)}'}, 500
         finally:
             connection.close()
 
+@user_ns.route('/<string:user_id>/follow-counts')
+class UserFollowCount(Resource):
+    @jwt_required()
+    @user_ns.marshal_with(follow_counts_model)
+    @user_ns.doc(responses={
+        200: "Success - Returns the user's follower and following counts",
+        404: 'User not found',
+        401: 'Unauthorized - Invalid or missing token'
+    })
+    def get(self, user_id):
+        """Get how many users follow a user and how many they follow"""
+        connection = get_db_connection()
+        try:
+            counts = connection.execute("""
+                SELECT User.user_id, User.nickname,
+                       COALESCE(UserFollowCounts.follower_count, 0) AS follower_count,
+                       COALESCE(UserFollowCounts.following_count, 0) AS following_count
+                FROM User
+                LEFT JOIN UserFollowCounts ON UserFollowCounts.user_id = User.user_id
+                WHERE User.user_id = ?
+            """, (user_id,)).fetchone()
+        finally:
+            connection.close()
+        if counts is None:
+            # abort() skips marshal_with, which would turn the message into null counts
+            abort(404, "User not found")
+        return dict(counts)
+
+@user_ns.route('/most-followed')
+class MostFollowedUsers(Resource):
+    @jwt_required()
+    @list_response(user_ns, follow_counts_model, 'Success - Returns users, most followed first')
+    @user_ns.doc(params={
+        'limit': {'description': f'Number of users (1-{MOST_FOLLOWED_MAX_LIMIT}, '
+                                 f'default {MOST_FOLLOWED_DEFAULT_LIMIT})',
+                  'type': 'integer', 'in': 'query'}
+    }, responses={
+        400: 'Bad request - Invalid limit',
+        401: 'Unauthorized - Invalid or missing token'
+    })
+    def get(self):
+        """
+        Get the most followed users
+        
+        Reads the first `limit` entries of the follower count index, so the
+        cost doesn't depend on how many users or follower relationships exist.
+        """
+        limit = limit_arg(MOST_FOLLOWED_DEFAULT_LIMIT, MOST_FOLLOWED_MAX_LIMIT)
+        
+        connection = get_db_connection()
+        try:
+            users = connection.execute("""
+                SELECT User.user_id, User.nickname,
+                       UserFollowCounts.follower_count, UserFollowCounts.following_count
+                FROM UserFollowCounts
+                JOIN User ON User.user_id = UserFollowCounts.user_id
+                ORDER BY UserFollowCounts.follower_count DESC, UserFollowCounts.user_id
+                LIMIT ?
+            """, (limit,)).fetchall()
+        finally:
+            connection.close()
+        return json_list(users, follow_counts_model)
+
 api.add_namespace(user_ns)
 
 # ---------------------------- Follower ----------------------------
@@ -688,19 +1499,14 @@ follower_model = api.model('Follower', {
 @follower_ns.route('/')
 class followerList(Resource):
     @jwt_required()
-    @follower_ns.marshal_list_with(follower_model)
+    @list_response(follower_ns, follower_model)
+    @follower_ns.doc(params=PAGINATION_PARAMS)
     def get(self):
-        """Get all follower relationships"""
-        try:
-            with DBConnection() as connection:
-                followers = connection.execute('SELECT * FROM Follower').fetchall()
-                return [dict(follower) for follower in followers]
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        """Get all follower relationships, one page at a time"""
+        page = keyset_page(['user_id_1', 'user_id_2'])
+        with DBConnection() as connection:
+            followers = page.fetch(connection, 'SELECT * FROM Follower')
+            return paged(page, followers, follower_model)
 
     @jwt_required()
     @follower_ns.expect(follower_model)
@@ -708,41 +1514,34 @@ class followerList(Resource):
         """Create a new follower relationship"""
         data = request.json
         
-        try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                
-                # Check if the follower user exists
-                follower = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (data['user_id_1'],)).fetchone()
-                if not follower:
-                    return {"message": "Follower user not found"}, 404
-                
-                # Check if the followed user exists
-                followed = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (data['user_id_2'],)).fetchone()
-                if not followed:
-                    return {"message": "Followed user not found"}, 404
-                
-                # Check if the relationship already exists
-                existing = cursor.execute(
-                    'SELECT 1 FROM Follower WHERE user_id_1 = ? AND user_id_2 = ?',
-                    (data['user_id_1'], data['user_id_2'])
-                ).fetchone()
-                
-                if existing:
-                    return {"message": "This follower relationship already exists"}, 409
-                
-                cursor.execute(
-                    'INSERT INTO Follower (user_id_1, user_id_2) VALUES (?, ?)',
-                    (data['user_id_1'], data['user_id_2'])
-                )
-                
-            return {"message": "Follower relationship created successfully"}, 201
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            
+            # Check if the follower user exists
+            follower = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (data['user_id_1'],)).fetchone()
+            if not follower:
+                return {"message": "Follower user not found"}, 404
+            
+            # Check if the followed user exists
+            followed = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (data['user_id_2'],)).fetchone()
+            if not followed:
+                return {"message": "Followed user not found"}, 404
+            
+            # Check if the relationship already exists
+            existing = cursor.execute(
+                'SELECT 1 FROM Follower WHERE user_id_1 = ? AND user_id_2 = ?',
+                (data['user_id_1'], data['user_id_2'])
+            ).fetchone()
+            
+            if existing:
+                return {"message": "This follower relationship already exists"}, 409
+            
+            cursor.execute(
+                'INSERT INTO Follower (user_id_1, user_id_2) VALUES (?, ?)',
+                (data['user_id_1'], data['user_id_2'])
+            )
+            
+        return {"message": "Follower relationship created successfully"}, 201
 
 @follower_ns.route('/<string:user_id_1>/followers/<string:user_id_2>')
 class follower(Resource):
@@ -750,50 +1549,36 @@ class follower(Resource):
     @follower_ns.marshal_with(follower_model)
     def get(self, user_id_1, user_id_2):
         """Get a specific follower relationship"""
-        try:
-            with DBConnection() as connection:
-                follower = connection.execute(
-                    'SELECT * FROM Follower WHERE user_id_1 = ? AND user_id_2 = ?',
-                    (user_id_1, user_id_2)
-                ).fetchone()
-                
-                if follower is None:
-                    return {"message": "Follower relationship not found"}, 404
-                return dict(follower)
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        with DBConnection() as connection:
+            follower = connection.execute(
+                'SELECT * FROM Follower WHERE user_id_1 = ? AND user_id_2 = ?',
+                (user_id_1, user_id_2)
+            ).fetchone()
+            
+            if follower is None:
+                return {"message": "Follower relationship not found"}, 404
+            return dict(follower)
 
     @jwt_required()
     def delete(self, user_id_1, user_id_2):
         """Delete a follower relationship"""
-        try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                
-                # Check if both users exist before attempting to delete the relationship
-                follower = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (user_id_1,)).fetchone()
-                if not follower:
-                    return {"message": "Follower user not found"}, 404
-                
-                followed = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (user_id_2,)).fetchone()
-                if not followed:
-                    return {"message": "Followed user not found"}, 404
-                
-                cursor.execute('DELETE FROM Follower WHERE user_id_1 = ? AND user_id_2 = ?', (user_id_1, user_id_2))
-                if cursor.rowcount == 0:
-                    return {"message": "Follower relationship not found"}, 404
-                
-                return {"message": "Follower relationship deleted successfully"}, 200
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            
+            # Check if both users exist before attempting to delete the relationship
+            follower = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (user_id_1,)).fetchone()
+            if not follower:
+                return {"message": "Follower user not found"}, 404
+            
+            followed = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (user_id_2,)).fetchone()
+            if not followed:
+                return {"message": "Followed user not found"}, 404
+            
+            cursor.execute('DELETE FROM Follower WHERE user_id_1 = ? AND user_id_2 = ?', (user_id_1, user_id_2))
+            if cursor.rowcount == 0:
+                return {"message": "Follower relationship not found"}, 404
+            
+            return {"message": "Follower relationship deleted successfully"}, 200
 
 api.add_namespace(follower_ns)
 
@@ -806,23 +1591,35 @@ playlist_model = api.model('Playlist', {
     'playlist_image': fields.String(description="Cover image (base64 encoded)"),
     'creator_id': fields.String(required=True, description="Who created this playlist")
 })
+playlist_list_model = api.clone('PlaylistListItem', playlist_model, {
+    'playlist_image_url': ImageUrl('playlist_image', 'playlist_image_digest', readonly=True,
+                                   description="Where to download the cover image (cacheable for good)")
+})
+playlist_fields = FieldSet('Playlist', ['playlist_id'],
+                           ['playlist_id', 'playlist_name', 'playlist_description', 'playlist_image', 'creator_id'],
+                           media=['playlist_image'], links=['playlist_image_url'],
+                           link_columns={'playlist_image_url': 'playlist_image_digest'})
 
 @playlist_ns.route('/')
 class PlaylistList(Resource):
     @jwt_required()
-    @playlist_ns.marshal_list_with(playlist_model)
+    @playlist_ns.response(200, 'Success', [playlist_list_model])
+    @playlist_ns.doc(params={**PAGINATION_PARAMS, **FIELDS_PARAM})
     def get(self):
-        """Get all available playlists"""
+        """Get all available playlists, one page at a time"""
+        page = keyset_page(['playlist_id'])
+        query, mask = select_fields(playlist_fields)
         connection = get_db_connection()
-        playlists = connection.execute('SELECT * FROM Playlist').fetchall()
+        playlists = page.fetch(connection, query)
         connection.close()
-        return [dict(playlist) for playlist in playlists]
+        return paged(page, playlists, playlist_list_model, mask)
 
     @jwt_required()
     @playlist_ns.expect(playlist_model)
     def post(self):
         """Create a new playlist"""
         data = request.json
+        store_media(data, 'playlist_image')
         connection = get_db_connection()
         cursor = connection.cursor()
         
@@ -854,6 +1651,7 @@ class PlaylistList(Resource):
 @playlist_ns.route('/<string:playlist_id>')
 class Playlist(Resource):
     @jwt_required()
+    @conditional_get('Playlist', 'playlist_id')
     @playlist_ns.marshal_with(playlist_model)
     def get(self, playlist_id):
         """Get details about a specific playlist"""
@@ -862,13 +1660,14 @@ class Playlist(Resource):
         connection.close()
         if playlist is None:
             return {"message": "Playlist not found"}, 404
-        return dict(playlist)
+        return inline_media(dict(playlist), 'playlist_image')
 
     @jwt_required()
     @playlist_ns.expect(playlist_model)
     def put(self, playlist_id):
         """Update a playlist's details"""
         data = request.json
+        store_media(data, 'playlist_image')
         connection = get_db_connection()
         cursor = connection.cursor()
         
@@ -914,6 +1713,20 @@ class Playlist(Resource):
         connection.close()
         return {"message": "Playlist deleted successfully"}, 200
 
+@playlist_ns.route('/<string:playlist_id>/image', endpoint='playlist_image')
+class PlaylistImage(Resource):
+    @jwt_required()
+    @playlist_ns.produces(['image/png', 'image/jpeg', 'image/gif', 'image/webp'])
+    @playlist_ns.doc(params=THUMBNAIL_PARAMS, responses={
+        200: 'The cover image',
+        304: 'Not modified - the cached thumbnail is still current',
+        400: 'Bad request - Unsupported size',
+        404: 'Playlist or image not found'
+    })
+    def get(self, playlist_id):
+        """Download a playlist's cover image, optionally scaled down with ?size="""
+        return send_image('Playlist', 'playlist_id', playlist_id, 'playlist_image')
+
 api.add_namespace(playlist_ns)
 
 # ---------------------------- Playlist_User ----------------------------
@@ -927,19 +1740,14 @@ playlist_user_model = api.model('PlaylistUser', {
 @playlist_user_ns.route('/')
 class PlaylistUserList(Resource):
     @jwt_required()
-    @playlist_user_ns.marshal_list_with(playlist_user_model)
+    @list_response(playlist_user_ns, playlist_user_model)
+    @playlist_user_ns.doc(params=PAGINATION_PARAMS)
     def get(self):
-        """Get all playlist-user relationships"""
-        try:
-            with DBConnection() as connection:
-                playlist_users = connection.execute('SELECT * FROM Playlist_User').fetchall()
-                return [dict(playlist_user) for playlist_user in playlist_users]
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        """Get all playlist-user relationships, one page at a time"""
+        page = keyset_page(['user_id', 'playlist_id'])
+        with DBConnection() as connection:
+            playlist_users = page.fetch(connection, 'SELECT * FROM Playlist_User')
+            return paged(page, playlist_users, playlist_user_model)
 
     @jwt_required()
     @playlist_user_ns.expect(playlist_user_model)
@@ -947,42 +1755,35 @@ class PlaylistUserList(Resource):
         """Create a new playlist-user relationship"""
         data = request.json
         
-        try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                
-                # First, verify the playlist exists
-                playlist = cursor.execute('SELECT playlist_id FROM Playlist WHERE playlist_id = ?', 
-                                        (data['playlist_id'],)).fetchone()
-                if not playlist:
-                    return {"message": "Cannot add user to a playlist that doesn't exist"}, 404
-                    
-                # Then verify the user exists
-                user = cursor.execute('SELECT user_id FROM User WHERE user_id = ?', 
-                                    (data['user_id'],)).fetchone()
-                if not user:
-                    return {"message": "Cannot add non-existent user to playlist"}, 404
-                
-                # Check if the relationship already exists
-                existing = cursor.execute(
-                    'SELECT 1 FROM Playlist_User WHERE user_id = ? AND playlist_id = ?',
-                    (data['user_id'], data['playlist_id'])
-                ).fetchone()
-                
-                if existing:
-                    return {"message": "This user is already associated with this playlist"}, 409
-                
-                # If both exist, create the relationship
-                cursor.execute('INSERT INTO Playlist_User (user_id, playlist_id) VALUES (?, ?)',
-                            (data['user_id'], data['playlist_id']))
-                
-                return {"message": "User added to playlist successfully"}, 201
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            
+            # First, verify the playlist exists
+            playlist = cursor.execute('SELECT playlist_id FROM Playlist WHERE playlist_id = ?', 
+                                    (data['playlist_id'],)).fetchone()
+            if not playlist:
+                return {"message": "Cannot add user to a playlist that doesn't exist"}, 404
+                
+            # Then verify the user exists
+            user = cursor.execute('SELECT user_id FROM User WHERE user_id = ?', 
+                                (data['user_id'],)).fetchone()
+            if not user:
+                return {"message": "Cannot add non-existent user to playlist"}, 404
+            
+            # Check if the relationship already exists
+            existing = cursor.execute(
+                'SELECT 1 FROM Playlist_User WHERE user_id = ? AND playlist_id = ?',
+                (data['user_id'], data['playlist_id'])
+            ).fetchone()
+            
+            if existing:
+                return {"message": "This user is already associated with this playlist"}, 409
+            
+            # If both exist, create the relationship
+            cursor.execute('INSERT INTO Playlist_User (user_id, playlist_id) VALUES (?, ?)',
+                        (data['user_id'], data['playlist_id']))
+            
+            return {"message": "User added to playlist successfully"}, 201
 
 @playlist_user_ns.route('/<string:user_id>/<string:playlist_id>')
 class PlaylistUser(Resource):
@@ -990,59 +1791,45 @@ class PlaylistUser(Resource):
     @playlist_user_ns.marshal_with(playlist_user_model)
     def get(self, user_id, playlist_id):
         """Get a specific playlist-user relationship"""
-        try:
-            with DBConnection() as connection:
-                playlist_user = connection.execute('SELECT * FROM Playlist_User WHERE user_id = ? AND playlist_id = ?', 
-                                                (user_id, playlist_id)).fetchone()
-                
-                if playlist_user is None:
-                    return {"message": "This user isn't associated with that playlist"}, 404
-                return dict(playlist_user)
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        with DBConnection() as connection:
+            playlist_user = connection.execute('SELECT * FROM Playlist_User WHERE user_id = ? AND playlist_id = ?', 
+                                            (user_id, playlist_id)).fetchone()
+            
+            if playlist_user is None:
+                return {"message": "This user isn't associated with that playlist"}, 404
+            return dict(playlist_user)
 
     @jwt_required()
     def delete(self, user_id, playlist_id):
         """Remove a user from a playlist"""
-        try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                
-                # Verify the playlist exists
-                playlist = cursor.execute('SELECT playlist_id FROM Playlist WHERE playlist_id = ?', 
-                                        (playlist_id,)).fetchone()
-                if not playlist:
-                    return {"message": "Playlist not found"}, 404
-                    
-                # Verify the user exists
-                user = cursor.execute('SELECT user_id FROM User WHERE user_id = ?', 
-                                    (user_id,)).fetchone()
-                if not user:
-                    return {"message": "User not found"}, 404
-                
-                # Verify the relationship exists before deletion
-                relationship = cursor.execute(
-                    'SELECT 1 FROM Playlist_User WHERE user_id = ? AND playlist_id = ?',
-                    (user_id, playlist_id)
-                ).fetchone()
-                
-                if not relationship:
-                    return {"message": "This user isn't associated with that playlist"}, 404
-                
-                cursor.execute('DELETE FROM Playlist_User WHERE user_id = ? AND playlist_id = ?', 
-                            (user_id, playlist_id))
-                
-                return {"message": "User removed from playlist successfully"}, 200
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            
+            # Verify the playlist exists
+            playlist = cursor.execute('SELECT playlist_id FROM Playlist WHERE playlist_id = ?', 
+                                    (playlist_id,)).fetchone()
+            if not playlist:
+                return {"message": "Playlist not found"}, 404
+                
+            # Verify the user exists
+            user = cursor.execute('SELECT user_id FROM User WHERE user_id = ?', 
+                                (user_id,)).fetchone()
+            if not user:
+                return {"message": "User not found"}, 404
+            
+            # Verify the relationship exists before deletion
+            relationship = cursor.execute(
+                'SELECT 1 FROM Playlist_User WHERE user_id = ? AND playlist_id = ?',
+                (user_id, playlist_id)
+            ).fetchone()
+            
+            if not relationship:
+                return {"message": "This user isn't associated with that playlist"}, 404
+            
+            cursor.execute('DELETE FROM Playlist_User WHERE user_id = ? AND playlist_id = ?', 
+                        (user_id, playlist_id))
+            
+            return {"message": "User removed from playlist successfully"}, 200
 
 api.add_namespace(playlist_user_ns)
 
@@ -1056,14 +1843,16 @@ playlist_song_model = api.model('PlaylistSong', {
 
 @playlist_song_ns.route('/')
 class PlaylistSongList(Resource):
-    @playlist_song_ns.marshal_list_with(playlist_song_model)
+    @list_response(playlist_song_ns, playlist_song_model)
+    @playlist_song_ns.doc(params=PAGINATION_PARAMS)
     @jwt_required()
     def get(self):
-        """See all songs in all playlists"""
+        """See all songs in all playlists, one page at a time"""
+        page = keyset_page(['playlist_id', 'song_id'])
         connection = get_db_connection()
-        playlist_songs = connection.execute('SELECT * FROM Playlist_Song').fetchall()
+        playlist_songs = page.fetch(connection, 'SELECT * FROM Playlist_Song')
         connection.close()
-        return [dict(playlist_song) for playlist_song in playlist_songs]
+        return paged(page, playlist_songs, playlist_song_model)
 
     @jwt_required()
     @playlist_song_ns.expect(playlist_song_model)
@@ -1071,39 +1860,32 @@ class PlaylistSongList(Resource):
         """Add a song to a playlist"""
         data = request.json
         
-        try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                
-                # First, verify the playlist exists
-                playlist = cursor.execute('SELECT playlist_id FROM Playlist WHERE playlist_id = ?', 
-                                       (data['playlist_id'],)).fetchone()
-                if not playlist:
-                    return {"message": "Cannot add songs to a playlist that doesn't exist"}, 404
-                    
-                # Then verify the song exists
-                song = cursor.execute('SELECT song_id FROM Song WHERE song_id = ?', 
-                                   (data['song_id'],)).fetchone()
-                if not song:
-                    return {"message": "Cannot add a non-existent song to a playlist"}, 404
-                    
-                # Check if the song is already in the playlist
-                existing = cursor.execute('SELECT 1 FROM Playlist_Song WHERE playlist_id = ? AND song_id = ?',
-                                       (data['playlist_id'], data['song_id'])).fetchone()
-                if existing:
-                    return {"message": "This song is already in the playlist"}, 409  # Conflict
-                
-                # If both exist and no duplicate, add the song to the playlist
-                cursor.execute('INSERT INTO Playlist_Song (playlist_id, song_id) VALUES (?, ?)',
-                            (data['playlist_id'], data['song_id']))
-                
-                return {"message": "Song added to playlist successfully"}, 201
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            
+            # First, verify the playlist exists
+            playlist = cursor.execute('SELECT playlist_id FROM Playlist WHERE playlist_id = ?', 
+                                   (data['playlist_id'],)).fetchone()
+            if not playlist:
+                return {"message": "Cannot add songs to a playlist that doesn't exist"}, 404
+                
+            # Then verify the song exists
+            song = cursor.execute('SELECT song_id FROM Song WHERE song_id = ?', 
+                               (data['song_id'],)).fetchone()
+            if not song:
+                return {"message": "Cannot add a non-existent song to a playlist"}, 404
+                
+            # Check if the song is already in the playlist
+            existing = cursor.execute('SELECT 1 FROM Playlist_Song WHERE playlist_id = ? AND song_id = ?',
+                                   (data['playlist_id'], data['song_id'])).fetchone()
+            if existing:
+                return {"message": "This song is already in the playlist"}, 409  # Conflict
+            
+            # If both exist and no duplicate, add the song to the playlist
+            cursor.execute('INSERT INTO Playlist_Song (playlist_id, song_id) VALUES (?, ?)',
+                        (data['playlist_id'], data['song_id']))
+            
+            return {"message": "Song added to playlist successfully"}, 201
 
 @playlist_song_ns.route('/<string:playlist_id>/songs/<string:song_id>')
 class PlaylistSong(Resource):
@@ -1156,13 +1938,15 @@ like_model = api.model('Like', {
 @like_ns.route('/')
 class LikeList(Resource):
     @jwt_required()
-    @like_ns.marshal_list_with(like_model)
+    @list_response(like_ns, like_model)
+    @like_ns.doc(params=PAGINATION_PARAMS)
     def get(self):
-        """Get all likes"""
+        """Get all likes, one page at a time"""
+        page = keyset_page(['user_id', 'song_id'])
         connection = get_db_connection()
-        likes = connection.execute('SELECT * FROM UserLikes').fetchall()
+        likes = page.fetch(connection, 'SELECT * FROM UserLikes')
         connection.close()
-        return [dict(like) for like in likes]
+        return paged(page, likes, like_model)
 
     @jwt_required()
     @like_ns.expect(like_model)
@@ -1170,39 +1954,32 @@ class LikeList(Resource):
         """Create a new like"""
         data = request.json
         
-        try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                
-                # Verify the user exists
-                user = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (data['user_id'],)).fetchone()
-                if not user:
-                    return {"message": "Cannot create like for non-existent user"}, 404
-                    
-                # Verify the song exists
-                song = cursor.execute('SELECT 1 FROM Song WHERE song_id = ?', (data['song_id'],)).fetchone()
-                if not song:
-                    return {"message": "Cannot like a non-existent song"}, 404
-                
-                # Check if this like already exists
-                existing = cursor.execute(
-                    'SELECT 1 FROM UserLikes WHERE user_id = ? AND song_id = ?',
-                    (data['user_id'], data['song_id'])
-                ).fetchone()
-                
-                if existing:
-                    return {"message": "This song is already liked by this user"}, 409  # Conflict
-                
-                cursor.execute('INSERT INTO UserLikes (user_id, song_id) VALUES (?, ?)',
-                           (data['user_id'], data['song_id']))
-                
-                return {"message": "Like created successfully"}, 201
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            
+            # Verify the user exists
+            user = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (data['user_id'],)).fetchone()
+            if not user:
+                return {"message": "Cannot create like for non-existent user"}, 404
+                
+            # Verify the song exists
+            song = cursor.execute('SELECT 1 FROM Song WHERE song_id = ?', (data['song_id'],)).fetchone()
+            if not song:
+                return {"message": "Cannot like a non-existent song"}, 404
+            
+            # Check if this like already exists
+            existing = cursor.execute(
+                'SELECT 1 FROM UserLikes WHERE user_id = ? AND song_id = ?',
+                (data['user_id'], data['song_id'])
+            ).fetchone()
+            
+            if existing:
+                return {"message": "This song is already liked by this user"}, 409  # Conflict
+            
+            cursor.execute('INSERT INTO UserLikes (user_id, song_id) VALUES (?, ?)',
+                       (data['user_id'], data['song_id']))
+            
+            return {"message": "Like created successfully"}, 201
 
 @like_ns.route('/<string:user_id>/songs/<string:song_id>')
 class Like(Resource):
@@ -1247,27 +2024,40 @@ song_model = api.model('Song', {
     'song_image': fields.String(description="Song artwork image encoded in base64 format"),
     'audio': fields.String(description="The audio file encoded in base64 format (for small audio files)")
 })
+song_list_model = api.clone('SongListItem', song_model, {
+    'song_image_url': ImageUrl('song_image', 'song_image_digest', readonly=True,
+                               description="Where to download the artwork (cacheable for good)"),
+    'audio_url': fields.Url('song_audio', readonly=True, description="Where to download the audio")
+})
+song_fields = FieldSet('Song', ['song_id'], ['song_id', 'song_name', 'song_time', 'song_image', 'audio'],
+                       media=['song_image', 'audio'], links=['song_image_url', 'audio_url'],
+                       link_columns={'song_image_url': 'song_image_digest'})
 
 @song_ns.route('/')
 class SongList(Resource):
     """Resource for managing the collection of songs"""
     
     @jwt_required()
-    @song_ns.marshal_list_with(song_model)
-    @song_ns.doc(responses={
-        200: 'Success - Returns list of songs',
+    @song_ns.response(200, 'Success - Returns a page of songs', [song_list_model])
+    @song_ns.doc(params={**PAGINATION_PARAMS, **FIELDS_PARAM}, responses={
+        400: 'Bad request - Invalid limit, cursor or fields',
         401: 'Unauthorized - Invalid or missing token'
     })
     def get(self):
         """
         Get all songs
         
-        Returns a list of all songs in the library with their metadata.
+        Returns a page of the songs in the library with their metadata, ordered by song_id.
+        Pass the X-Next-Cursor header as ?after= to get the next page.
+        Artwork and audio are not included unless asked for with ?fields=;
+        song_image_url and audio_url link to them.
         """
+        page = keyset_page(['song_id'])
+        query, mask = select_fields(song_fields)
         connection = get_db_connection()
-        songs = connection.execute('SELECT * FROM Song').fetchall()
+        songs = page.fetch(connection, query)
         connection.close()
-        return [dict(song) for song in songs]
+        return paged(page, songs, song_list_model, mask)
 
     @jwt_required()
     @song_ns.expect(song_model)
@@ -1292,6 +2082,7 @@ class SongList(Resource):
         - audio: Base64-encoded audio data (for small audio files)
         """
         data = request.json
+        store_media(data, 'song_image', 'audio')
         connection = get_db_connection()
         cursor = connection.cursor()
         
@@ -1309,6 +2100,7 @@ class Song(Resource):
     """Resource for managing individual songs"""
     
     @jwt_required()
+    @conditional_get('Song', 'song_id')
     @song_ns.marshal_with(song_model)
     @song_ns.doc(responses={
         200: 'Success - Returns song details',
@@ -1326,13 +2118,14 @@ class Song(Resource):
         connection.close()
         if song is None:
             return {"message": "Song not found"}, 404
-        return dict(song)
+        return inline_media(dict(song), 'song_image', 'audio')
 
     @jwt_required()
     @song_ns.expect(song_model)
     def put(self, song_id):
         """Update a song"""
         data = request.json
+        store_media(data, 'song_image', 'audio')
         connection = get_db_connection()
         connection.execute('UPDATE Song SET song_name = ?, song_time = ?, song_image = ?, audio = ? WHERE song_id = ?',
                            (data['song_name'], data['song_time'], data.get('song_image'), data.get('audio'), song_id))
@@ -1349,19 +2142,66 @@ class Song(Resource):
         connection.close()
         return {"message": "Song deleted successfully"}, 200
     
+@song_ns.route('/<string:song_id>/audio', endpoint='song_audio')
+class SongAudio(Resource):
+    @jwt_required()
+    @song_ns.produces(['audio/mpeg', 'audio/ogg', 'audio/flac', 'audio/wav'])
+    @song_ns.doc(params={'Range': {'description': 'Byte range to fetch, e.g. bytes=0-65535', 'in': 'header'}},
+                 responses={200: 'The audio file', 206: 'The requested byte range',
+                            404: 'Song or audio not found', 416: 'Range not satisfiable'})
+    def get(self, song_id):
+        """
+        Stream a song's audio
+        
+        Supports Range requests, so players can seek and start playback
+        without downloading the whole track.
+        """
+        return send_media('Song', 'song_id', song_id, 'audio')
+
+@song_ns.route('/<string:song_id>/image', endpoint='song_image')
+class SongImage(Resource):
+    @jwt_required()
+    @song_ns.produces(['image/png', 'image/jpeg', 'image/gif', 'image/webp'])
+    @song_ns.doc(params=THUMBNAIL_PARAMS, responses={
+        200: 'The artwork',
+        304: 'Not modified - the cached thumbnail is still current',
+        400: 'Bad request - Unsupported size',
+        404: 'Song or artwork not found'
+    })
+    def get(self, song_id):
+        """Download a song's artwork, optionally scaled down with ?size="""
+        return send_image('Song', 'song_id', song_id, 'song_image')
+
 # get the song with song_name
 @song_ns.route('/name/<string:song_name>')
 class SongByName(Resource):
     @jwt_required()
-    @song_ns.marshal_with(song_model)
+    @song_ns.response(200, 'Success - Best matches first', [song_list_model])
+    @song_ns.doc(params={**SEARCH_PARAMS, **FIELDS_PARAM}, responses={
+        400: 'Bad request - No words to search for, invalid limit or field',
+        404: 'No songs found with that name'
+    })
     def get(self, song_name):
-        """Get a song by name"""
+        """
+        Search songs by name, best matches first
+        
+        Every word of the search text has to match the start of a word in
+        the song name ("stair heav" finds "Stairway to Heaven"). Results are
+        ranked with the SongSearch full-text index (BM25), so only the best
+        `limit` matches are read from the Song table.
+        """
+        match, limit = search_request(song_name)
+        query, mask = select_fields(song_fields, source="""Song JOIN (
+            SELECT rowid, rank FROM SongSearch WHERE SongSearch MATCH ? ORDER BY rank LIMIT ?
+        ) AS hits ON Song.rowid = hits.rowid""")
         connection = get_db_connection()
-        songs = connection.execute('SELECT * FROM Song WHERE song_name LIKE ?', (f'%{song_name}%',)).fetchall()
-        connection.close()
+        try:
+            songs = connection.execute(query + " ORDER BY hits.rank", (match, limit)).fetchall()
+        finally:
+            connection.close()
         if not songs:
             return {"message": "No songs found with that name"}, 404
-        return [dict(song) for song in songs]
+        return json_list(songs, song_list_model, mask)
 
 api.add_namespace(song_ns)
 
@@ -1370,114 +2210,21 @@ api.add_namespace(song_ns)
 genre_ns = Namespace('genres', description="Manage genres")
 genre_model = api.model('Genre', {
     'genre_id': fields.String(description="The ID of the genre (auto-generated)"),
-    'song_id': fields.String(required=True, description="The ID of the song this genre is associated with"),
-    'genre_name': fields.String(required=True, description="The name of the genre")
-})
-
-# Migration function to update the Genre table structure
-def migrate_genre_structure():
-    """Migrate from the old SongGenre and Genre tables to the new Genre structure"""
-    try:
-        # First check if the SongGenre table exists
-        with DBConnection() as connection:
-            cursor = connection.cursor()
-            
-            # Check if SongGenre table exists
-            table_exists = cursor.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name='SongGenre'"
-            ).fetchone()
-            
-            if not table_exists:
-                # Already migrated or fresh install
-                return
-            
-            # Check if Genre table has song_id column
-            has_song_id = False
-            try:
-                cursor.execute("SELECT song_id FROM Genre LIMIT 1")
-                has_song_id = True
-            except sqlite3.OperationalError:
-                # song_id column doesn't exist yet
-                pass
-                
-            if not has_song_id:
-                # Add the song_id column to Genre table
-                cursor.execute("ALTER TABLE Genre ADD COLUMN song_id CHAR(36)")
-                
-                # Create a new index for song_id
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_genre_song_id ON Genre(song_id)")
-                
-                # Drop the UNIQUE constraint on genre_name
-                # SQLite doesn't support dropping constraints, so we need to recreate the table
-                cursor.execute(f"""
-                    CREATE TABLE IF NOT EXISTS Genre_new (
-                        genre_id CHAR(36) PRIMARY KEY DEFAULT ({uuid_default}),
-                        genre_name VARCHAR(50) NOT NULL CHECK (length(genre_name) > 0),
-                        song_id CHAR(36),
-                        FOREIGN KEY (song_id) REFERENCES Song(song_id) ON DELETE CASCADE ON UPDATE CASCADE
-                    )
-                """)
-                
-                # Copy data from old table to new table
-                cursor.execute("INSERT INTO Genre_new (genre_id, genre_name) SELECT genre_id, genre_name FROM Genre")
-                
-                # Drop the old table
-                cursor.execute("DROP TABLE Genre")
-                
-                # Rename the new table
-                cursor.execute("ALTER TABLE Genre_new RENAME TO Genre")
-                
-                # Recreate the index on genre_name
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_genre_name ON Genre(genre_name)")
-            
-            # Now migrate data from SongGenre to Genre
-            # For each song-genre pair in SongGenre, create a new Genre entry
-            rows = cursor.execute("""
-                SELECT sg.song_id, g.genre_id, g.genre_name
-                FROM SongGenre sg
-                JOIN Genre g ON sg.genre_id = g.genre_id
-            """).fetchall()
-            
-            # If we have data to migrate
-            if rows:
-                # For each song-genre relationship
-                for row in rows:
-                    song_id, genre_id, genre_name = row
-                    
-                    # Generate a new UUID for each genre entry
-                    new_genre_id = generate_uuid()
-                    
-                    # Insert a new row into Genre with the song_id
-                    cursor.execute("""
-                        INSERT INTO Genre (genre_id, genre_name, song_id)
-                        VALUES (?, ?, ?)
-                    """, (new_genre_id, genre_name, song_id))
-                
-                # After migration is done, drop the SongGenre table
-                cursor.execute("DROP TABLE IF EXISTS SongGenre")
-    
-    except Exception as e:
-        print(f"Error migrating genre structure: {str(e)}")
-        
-# Register the migration function to run at app startup
-# app.before_first_request(migrate_genre_structure)
+    'song_id': fields.String(required=True, description="The ID of the song this genre is associated with"),
+    'genre_name': fields.String(required=True, description="The name of the genre")
+})
 
 @genre_ns.route('/')
 class GenreList(Resource):
     @jwt_required()
-    @genre_ns.marshal_list_with(genre_model)
+    @list_response(genre_ns, genre_model)
+    @genre_ns.doc(params=PAGINATION_PARAMS)
     def get(self):
-        """Get all genres"""
-        try:
-            with DBConnection() as connection:
-                genres = connection.execute('SELECT * FROM Genre').fetchall()
-                return [dict(genre) for genre in genres]
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        """Get all genres, one page at a time"""
+        page = keyset_page(['song_id', 'genre_id'])
+        with DBConnection() as connection:
+            genres = page.fetch(connection, 'SELECT * FROM Genre')
+            return paged(page, genres, genre_model)
 
     @jwt_required()
     @genre_ns.expect(genre_model)
@@ -1500,12 +2247,6 @@ class GenreList(Resource):
             if "UNIQUE constraint failed" in str(e):
                 return {"message": "A genre with this name already exists"}, 409
             return {"message": f"Database integrity error: {str(e)}"}, 400
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
 
 @genre_ns.route('/<string:genre_id>')
 class Genre(Resource):
@@ -1536,50 +2277,32 @@ class Genre(Resource):
             if "UNIQUE constraint failed" in str(e):
                 return {"message": "A genre with this name already exists"}, 409
             return {"message": f"Database integrity error: {str(e)}"}, 400
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
 
     @jwt_required()
     def delete(self, genre_id):
         """Delete a genre"""
-        try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                # Check if genre exists
-                genre = cursor.execute('SELECT 1 FROM Genre WHERE genre_id = ?', (genre_id,)).fetchone()
-                if not genre:
-                    return {"message": "Genre not found"}, 404
-                
-                connection.execute('DELETE FROM Genre WHERE genre_id = ?', (genre_id,))
-                return {"message": "Genre deleted successfully"}, 200
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            # Check if genre exists
+            genre = cursor.execute('SELECT 1 FROM Genre WHERE genre_id = ?', (genre_id,)).fetchone()
+            if not genre:
+                return {"message": "Genre not found"}, 404
+            
+            connection.execute('DELETE FROM Genre WHERE genre_id = ?', (genre_id,))
+            return {"message": "Genre deleted successfully"}, 200
 
 # Add endpoints for the many-to-many relationship
 @genre_ns.route('/songs')
 class SongGenreList(Resource):
     @jwt_required()
-    @genre_ns.marshal_list_with(genre_model)
+    @list_response(genre_ns, genre_model)
+    @genre_ns.doc(params=PAGINATION_PARAMS)
     def get(self):
-        """Get all song-genre relationships"""
-        try:
-            with DBConnection() as connection:
-                genres = connection.execute('SELECT * FROM Genre').fetchall()
-                return [dict(genre) for genre in genres]
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        """Get all song-genre relationships, one page at a time"""
+        page = keyset_page(['song_id', 'genre_id'])
+        with DBConnection() as connection:
+            genres = page.fetch(connection, 'SELECT * FROM Genre')
+            return paged(page, genres, genre_model)
     
     @jwt_required()
     @genre_ns.expect(genre_model)
@@ -1587,40 +2310,33 @@ class SongGenreList(Resource):
         """Associate a song with a genre"""
         data = request.json
         
-        try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                
-                # Check if the song exists
-                song = cursor.execute('SELECT 1 FROM Song WHERE song_id = ?', (data['song_id'],)).fetchone()
-                if not song:
-                    return {"message": "Song not found"}, 404
-                
-                # Generate a UUID if not provided
-                if 'genre_id' not in data:
-                    data['genre_id'] = generate_uuid()
-                
-                # Check if this exact genre already exists for this song
-                existing = cursor.execute(
-                    'SELECT 1 FROM Genre WHERE song_id = ? AND genre_name = ?',
-                    (data['song_id'], data['genre_name'])
-                ).fetchone()
-                
-                if existing:
-                    return {"message": "This song is already associated with this genre"}, 409
-                
-                cursor.execute(
-                    'INSERT INTO Genre (genre_id, song_id, genre_name) VALUES (?, ?, ?)',
-                    (data['genre_id'], data['song_id'], data['genre_name'])
-                )
-                
-            return {"message": "Song associated with genre successfully", "genre_id": data['genre_id']}, 201
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            
+            # Check if the song exists
+            song = cursor.execute('SELECT 1 FROM Song WHERE song_id = ?', (data['song_id'],)).fetchone()
+            if not song:
+                return {"message": "Song not found"}, 404
+            
+            # Generate a UUID if not provided
+            if 'genre_id' not in data:
+                data['genre_id'] = generate_uuid()
+            
+            # Check if this exact genre already exists for this song
+            existing = cursor.execute(
+                'SELECT 1 FROM Genre WHERE song_id = ? AND genre_name = ?',
+                (data['song_id'], data['genre_name'])
+            ).fetchone()
+            
+            if existing:
+                return {"message": "This song is already associated with this genre"}, 409
+            
+            cursor.execute(
+                'INSERT INTO Genre (genre_id, song_id, genre_name) VALUES (?, ?, ?)',
+                (data['genre_id'], data['song_id'], data['genre_name'])
+            )
+            
+        return {"message": "Song associated with genre successfully", "genre_id": data['genre_id']}, 201
 
 @genre_ns.route('/songs/<string:song_id>/genres/<string:genre_id>')
 class SongGenre(Resource):
@@ -1628,80 +2344,107 @@ class SongGenre(Resource):
     @genre_ns.marshal_with(genre_model)
     def get(self, song_id, genre_id):
         """Get a specific song-genre relationship"""
-        try:
-            with DBConnection() as connection:
-                genre = connection.execute(
-                    'SELECT * FROM Genre WHERE genre_id = ? AND song_id = ?',
-                    (genre_id, song_id)
-                ).fetchone()
+        with DBConnection() as connection:
+            genre = connection.execute(
+                'SELECT * FROM Genre WHERE genre_id = ? AND song_id = ?',
+                (genre_id, song_id)
+            ).fetchone()
+            
+            if genre is None:
+                return {"message": "Song-genre relationship not found"}, 404
                 
-                if genre is None:
-                    return {"message": "Song-genre relationship not found"}, 404
-                    
-                return dict(genre)
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+            return dict(genre)
 
     @jwt_required()
     def delete(self, song_id, genre_id):
         """Delete a song-genre relationship"""
-        try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                
-                # Check if the relationship exists
-                genre = cursor.execute(
-                    'SELECT 1 FROM Genre WHERE genre_id = ? AND song_id = ?',
-                    (genre_id, song_id)
-                ).fetchone()
-                
-                if not genre:
-                    return {"message": "Song-genre relationship not found"}, 404
-                
-                cursor.execute(
-                    'DELETE FROM Genre WHERE genre_id = ? AND song_id = ?',
-                    (genre_id, song_id)
-                )
-                
-            return {"message": "Song-genre relationship deleted successfully"}, 200
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            
+            # Check if the relationship exists
+            genre = cursor.execute(
+                'SELECT 1 FROM Genre WHERE genre_id = ? AND song_id = ?',
+                (genre_id, song_id)
+            ).fetchone()
+            
+            if not genre:
+                return {"message": "Song-genre relationship not found"}, 404
+            
+            cursor.execute(
+                'DELETE FROM Genre WHERE genre_id = ? AND song_id = ?',
+                (genre_id, song_id)
+            )
+            
+        return {"message": "Song-genre relationship deleted successfully"}, 200
 
-# a complex query to get the most listened genre in the last month
-@genre_ns.route('/most-listened-last-month')
+# the most listened genres over a sliding window, summed from the hourly and daily rollups
+@genre_ns.route('/most-listened-last-month', '/most-listened')
 class MostListenedGenre(Resource):
     @jwt_required()
+    @genre_ns.doc(params={
+        'window': {'description': 'How far back to count listens (default month)',
+                   'enum': list(GENRE_LISTEN_WINDOWS), 'in': 'query'}
+    }, responses={
+        200: 'Success - Returns the 10 most listened genres with their listen counts',
+        400: 'Bad request - Unknown window',
+        401: 'Unauthorized - Invalid or missing token'
+    })
     def get(self):
-        """Get the most listened to genres in the past month"""
-        try:
-            with DBConnection() as connection:
-                # This query counts listens by genre over the last month
-                genres = connection.execute("""
-                    SELECT g.genre_name, COUNT(*) as listen_count
-                    FROM History h
-                    JOIN Genre g ON h.song_id = g.song_id
-                    WHERE h.start_time >= datetime('now', '-1 month')
-                    GROUP BY g.genre_name
-                    ORDER BY listen_count DESC
-                    LIMIT 10
-                """).fetchall()
-                
-                result = [{'genre': genre['genre_name'], 'listens': genre['listen_count']} for genre in genres]
-                return result, 200
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        """
+        Get the most listened to genres in the past hour, day, week or month
+        
+        Listens are counted from the GenreListensHourly and GenreListensDaily
+        rollups, which triggers keep up to date as History is written: whole
+        days come from daily buckets, the hours before the first whole day from
+        hourly ones, and only the part of an hour the window starts in is
+        counted from History itself. So even a month takes a few dozen rows.
+        """
+        window = request.args.get('window', 'month')
+        if window not in GENRE_LISTEN_WINDOWS:
+            abort(400, f"window must be one of: {', '.join(GENRE_LISTEN_WINDOWS)}")
+        with DBConnection() as connection:
+            # since: start of the window; hour_start/day_start: the first
+            # whole hour and whole day in it
+            genres = connection.execute("""
+                WITH window_start AS (
+                    SELECT since, hour_start, datetime(hour_start, '+86399 seconds', 'start of day') AS day_start
+                    FROM (
+                        SELECT since, strftime('%Y-%m-%d %H:00:00', since, '+3599 seconds') AS hour_start
+                        FROM (SELECT datetime('now', ?) AS since)
+                    )
+                ),
+                listens AS (
+                    SELECT g.genre_id, COUNT(*) AS listens
+                    FROM window_start w
+                    -- start_time is normalized, as the rollups do, because plays are
+                    -- stored in ISO 'T' format too; the raw lower bound (a day early,
+                    -- for times with UTC offsets) only narrows the idx_history_start_time scan
+                    JOIN History h ON h.start_time >= datetime(w.since, '-1 day')
+                                  AND datetime(h.start_time) >= w.since AND datetime(h.start_time) < w.hour_start
+                    JOIN Genre g ON g.song_id = h.song_id
+                    GROUP BY g.genre_id
+                    UNION ALL
+                    SELECT r.genre_id, SUM(r.listens)
+                    FROM window_start w
+                    JOIN GenreListensHourly r ON r.bucket_start >= w.hour_start AND r.bucket_start < w.day_start
+                    GROUP BY r.genre_id
+                    UNION ALL
+                    SELECT r.genre_id, SUM(r.listens)
+                    FROM window_start w
+                    JOIN GenreListensDaily r ON r.bucket_start >= date(w.day_start)
+                    GROUP BY r.genre_id
+                )
+                SELECT f.genre_name, SUM(l.listens) AS listen_count
+                FROM listens l
+                JOIN GenreFields f ON f.genre_id = l.genre_id
+                GROUP BY f.genre_name
+                HAVING listen_count > 0
+                ORDER BY listen_count DESC
+                LIMIT 10
+            """, (GENRE_LISTEN_WINDOWS[window],)).fetchall()
+            
+            result = [{'genre': genre['genre_name'], 'listens': genre['listen_count']} for genre in genres]
+            return result, 200
 
 api.add_namespace(genre_ns)
 
@@ -1717,27 +2460,38 @@ album_model = api.model('Album', {
     'album_image': fields.String(description="Album cover image encoded in base64 format"),
     'release_date': fields.Date(description="Album release date (YYYY-MM-DD)")
 })
+album_list_model = api.clone('AlbumListItem', album_model, {
+    'album_image_url': ImageUrl('album_image', 'album_image_digest', readonly=True,
+                                description="Where to download the cover image (cacheable for good)")
+})
+album_fields = FieldSet('Album', ['album_id'], ['album_id', 'album_name', 'about', 'album_image', 'release_date'],
+                        media=['album_image'], links=['album_image_url'],
+                        link_columns={'album_image_url': 'album_image_digest'})
 
 @album_ns.route('/')
 class AlbumList(Resource):
     """Resource for managing the collection of albums"""
     
     @jwt_required()
-    @album_ns.marshal_list_with(album_model)
-    @album_ns.doc(responses={
-        200: 'Success - Returns list of albums',
+    @album_ns.response(200, 'Success - Returns a page of albums', [album_list_model])
+    @album_ns.doc(params={**PAGINATION_PARAMS, **FIELDS_PARAM}, responses={
+        400: 'Bad request - Invalid limit, cursor or fields',
         401: 'Unauthorized - Invalid or missing token'
     })
     def get(self):
         """
         Get all albums
         
-        Returns a list of all albums in the system with their metadata.
+        Returns a page of the albums in the system with their metadata, ordered by album_id.
+        Pass the X-Next-Cursor header as ?after= to get the next page.
+        Cover images are not included unless asked for with ?fields=; album_image_url links to them.
         """
+        page = keyset_page(['album_id'])
+        query, mask = select_fields(album_fields)
         connection = get_db_connection()
-        albums = connection.execute('SELECT * FROM Album').fetchall()
+        albums = page.fetch(connection, query)
         connection.close()
-        return [dict(album) for album in albums]
+        return paged(page, albums, album_list_model, mask)
 
     @jwt_required()
     @album_ns.expect(album_model)
@@ -1754,6 +2508,7 @@ class AlbumList(Resource):
         The album_id will be auto-generated as a UUID.
         """
         data = request.json
+        store_media(data, 'album_image')
         connection = get_db_connection()
         cursor = connection.cursor()
         
@@ -1771,6 +2526,7 @@ class Album(Resource):
     """Resource for managing individual albums"""
     
     @jwt_required()
+    @conditional_get('Album', 'album_id')
     @album_ns.marshal_with(album_model)
     @album_ns.doc(responses={
         200: 'Success - Returns album details',
@@ -1788,7 +2544,7 @@ class Album(Resource):
         connection.close()
         if album is None:
             return {"message": "Album not found"}, 404
-        return dict(album)
+        return inline_media(dict(album), 'album_image')
 
     @jwt_required()
     @album_ns.expect(album_model)
@@ -1806,6 +2562,7 @@ class Album(Resource):
         All fields in the request will overwrite existing values.
         """
         data = request.json
+        store_media(data, 'album_image')
         connection = get_db_connection()
         cursor = connection.cursor()
         
@@ -1849,6 +2606,20 @@ class Album(Resource):
         return {"message": "Album deleted successfully"}, 200
 
 # a complex query to get detailed listening stats for each album
+@album_ns.route('/<string:album_id>/image', endpoint='album_image')
+class AlbumImage(Resource):
+    @jwt_required()
+    @album_ns.produces(['image/png', 'image/jpeg', 'image/gif', 'image/webp'])
+    @album_ns.doc(params=THUMBNAIL_PARAMS, responses={
+        200: 'The cover image',
+        304: 'Not modified - the cached thumbnail is still current',
+        400: 'Bad request - Unsupported size',
+        404: 'Album or image not found'
+    })
+    def get(self, album_id):
+        """Download an album's cover image, optionally scaled down with ?size="""
+        return send_image('Album', 'album_id', album_id, 'album_image')
+
 @album_ns.route('/streaming-stats')
 class AlbumStreamingStats(Resource):
     """Resource for album streaming analytics and statistics"""
@@ -1866,31 +2637,18 @@ class AlbumStreamingStats(Resource):
         Returns aggregated listening time data for each album based on user history.
         Albums are sorted by total listening time in descending order (most popular first).
         
-        The calculation joins Album, Album_Info, Song, and History tables to track
-        how much time users have spent listening to songs from each album.
+        The totals are kept in AlbumListenStats, which triggers update as History rows
+        are written and songs join or leave albums, so this is an indexed read no
+        matter how long the listening history gets.
         """
         connection = get_db_connection()
         cursor = connection.cursor()
         
         query = """
-        SELECT albums.album_name AS album_name,
-            COALESCE(SUM(stream.total_listen_time), 0) AS total_listen_time
-        FROM (
-            SELECT Album.album_id, Album.album_name, Album_Info.song_id
-            FROM Album
-            LEFT JOIN Album_Info
-            ON Album.album_id = Album_Info.album_id
-        ) AS albums
-        LEFT JOIN (
-            SELECT Song.song_id, Song.song_name,
-                SUM(History.duration) AS total_listen_time
-            FROM History
-            JOIN Song ON History.song_id = Song.song_id
-            GROUP BY Song.song_id
-        ) AS stream
-        ON albums.song_id = stream.song_id
-        GROUP BY albums.album_id, albums.album_name
-        ORDER BY total_listen_time DESC
+        SELECT Album.album_name AS album_name, AlbumListenStats.total_listen_time AS total_listen_time
+        FROM AlbumListenStats
+        JOIN Album ON Album.album_id = AlbumListenStats.album_id
+        ORDER BY AlbumListenStats.total_listen_time DESC
         """
         
         try:
@@ -1929,21 +2687,24 @@ class AlbumInfoList(Resource):
     """Resource for managing album track listings"""
     
     @jwt_required()
-    @album_info_ns.marshal_list_with(album_info_model)
-    @album_info_ns.doc(responses={
-        200: 'Success - Returns list of album-song relationships',
+    @list_response(album_info_ns, album_info_model)
+    @album_info_ns.doc(params=PAGINATION_PARAMS, responses={
+        200: 'Success - Returns a page of album-song relationships',
+        400: 'Bad request - Invalid limit or cursor',
         401: 'Unauthorized - Invalid or missing token'
     })
     def get(self):
         """
         Get all album-song connections
         
-        Returns a list of all album-song relationships (track listings) in the system.
+        Returns a page of the album-song relationships (track listings) in the system, ordered by album_id, song_id.
+        Pass the X-Next-Cursor header as ?after= to get the next page.
         """
+        page = keyset_page(['album_id', 'song_id'])
         connection = get_db_connection()
-        album_infos = connection.execute('SELECT * FROM Album_Info').fetchall()
+        album_infos = page.fetch(connection, 'SELECT * FROM Album_Info')
         connection.close()
-        return [dict(album_info) for album_info in album_infos]
+        return paged(page, album_infos, album_info_model)
 
     @jwt_required()
     @album_info_ns.expect(album_info_model)
@@ -1962,42 +2723,35 @@ class AlbumInfoList(Resource):
         """
         data = request.json
         
-        try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                
-                # Verify the album exists
-                album = cursor.execute('SELECT 1 FROM Album WHERE album_id = ?', (data['album_id'],)).fetchone()
-                if not album:
-                    return {"message": "Cannot add song to a non-existent album"}, 404
-                    
-                # Verify the song exists
-                song = cursor.execute('SELECT 1 FROM Song WHERE song_id = ?', (data['song_id'],)).fetchone()
-                if not song:
-                    return {"message": "Cannot add a non-existent song to an album"}, 404
-                    
-                # Check if this album-song relationship already exists
-                existing = cursor.execute(
-                    'SELECT 1 FROM Album_Info WHERE album_id = ? AND song_id = ?', 
-                    (data['album_id'], data['song_id'])
-                ).fetchone()
-                
-                if existing:
-                    return {"message": "This song is already in this album"}, 409  # Conflict
-                    
-                # Default track number to 1 if not provided
-                track_number = data.get('track_number', 1)
-                
-                cursor.execute('INSERT INTO Album_Info (album_id, song_id, track_number) VALUES (?, ?, ?)',
-                           (data['album_id'], data['song_id'], track_number))
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            
+            # Verify the album exists
+            album = cursor.execute('SELECT 1 FROM Album WHERE album_id = ?', (data['album_id'],)).fetchone()
+            if not album:
+                return {"message": "Cannot add song to a non-existent album"}, 404
+                
+            # Verify the song exists
+            song = cursor.execute('SELECT 1 FROM Song WHERE song_id = ?', (data['song_id'],)).fetchone()
+            if not song:
+                return {"message": "Cannot add a non-existent song to an album"}, 404
+                
+            # Check if this album-song relationship already exists
+            existing = cursor.execute(
+                'SELECT 1 FROM Album_Info WHERE album_id = ? AND song_id = ?', 
+                (data['album_id'], data['song_id'])
+            ).fetchone()
+            
+            if existing:
+                return {"message": "This song is already in this album"}, 409  # Conflict
                 
-                return {"message": "Song added to album successfully"}, 201
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+            # Default track number to 1 if not provided
+            track_number = data.get('track_number', 1)
+            
+            cursor.execute('INSERT INTO Album_Info (album_id, song_id, track_number) VALUES (?, ?, ?)',
+                       (data['album_id'], data['song_id'], track_number))
+            
+            return {"message": "Song added to album successfully"}, 201
 
 @album_info_ns.route('/<string:album_id>/songs/<string:song_id>')
 class AlbumInfo(Resource):
@@ -2069,23 +2823,35 @@ group_model = api.model('Group', {
     'creation_date': fields.Date(description="The creation date of the group (YYYY-MM-DD)"),
     'group_image': fields.String(description="Group image encoded in base64 format")
 })
+group_list_model = api.clone('GroupListItem', group_model, {
+    'group_image_url': ImageUrl('group_image', 'group_image_digest', readonly=True,
+                                description="Where to download the group image (cacheable for good)")
+})
+group_fields = FieldSet('MusicGroup', ['group_id'],
+                        ['group_id', 'group_name', 'number_of_members', 'creation_date', 'group_image'],
+                        media=['group_image'], links=['group_image_url'],
+                        link_columns={'group_image_url': 'group_image_digest'})
 
 @group_ns.route('/')
 class GroupList(Resource):
     @jwt_required()
-    @group_ns.marshal_list_with(group_model)
+    @group_ns.response(200, 'Success', [group_list_model])
+    @group_ns.doc(params={**PAGINATION_PARAMS, **FIELDS_PARAM})
     def get(self):
-        """Get all groups"""
+        """Get all groups, one page at a time"""
+        page = keyset_page(['group_id'])
+        query, mask = select_fields(group_fields)
         connection = get_db_connection()
-        groups = connection.execute('SELECT * FROM MusicGroup').fetchall()
+        groups = page.fetch(connection, query)
         connection.close()
-        return [dict(group) for group in groups]
+        return paged(page, groups, group_list_model, mask)
 
     @jwt_required()
     @group_ns.expect(group_model)
     def post(self):
         """Create a new group"""
         data = request.json
+        store_media(data, 'group_image')
         
         try:
             # Generate a UUID for the group if not provided
@@ -2102,12 +2868,6 @@ class GroupList(Resource):
             return {"message": "Group created successfully", "group_id": data['group_id']}, 201
         except sqlite3.IntegrityError:
             return {"message": "A group with this name already exists"}, 409
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
 
 @group_ns.route('/<string:group_id>')
 class Group(Resource):
@@ -2120,13 +2880,14 @@ class Group(Resource):
         connection.close()
         if group is None:
             return {"message": "Group not found"}, 404
-        return dict(group)
+        return inline_media(dict(group), 'group_image')
 
     @jwt_required()
     @group_ns.expect(group_model)
     def put(self, group_id):
         """Update a group"""
         data = request.json
+        store_media(data, 'group_image')
         connection = get_db_connection()
         connection.execute('UPDATE MusicGroup SET group_name = ?, number_of_members = ?, creation_date = ?, group_image = ? WHERE group_id = ?',
                            (data['group_name'], data.get('number_of_members'), data.get('creation_date'), data.get('group_image'), group_id))
@@ -2143,6 +2904,20 @@ class Group(Resource):
         connection.close()
         return {"message": "Group deleted successfully"}, 200
 
+@group_ns.route('/<string:group_id>/image', endpoint='group_image')
+class GroupImage(Resource):
+    @jwt_required()
+    @group_ns.produces(['image/png', 'image/jpeg', 'image/gif', 'image/webp'])
+    @group_ns.doc(params=THUMBNAIL_PARAMS, responses={
+        200: 'The group image',
+        304: 'Not modified - the cached thumbnail is still current',
+        400: 'Bad request - Unsupported size',
+        404: 'Group or image not found'
+    })
+    def get(self, group_id):
+        """Download a group's image, optionally scaled down with ?size="""
+        return send_image('MusicGroup', 'group_id', group_id, 'group_image')
+
 api.add_namespace(group_ns)
 
 # ---------------------------- Album_Group ----------------------------
@@ -2156,13 +2931,15 @@ album_group_model = api.model('AlbumGroup', {
 @album_group_ns.route('/')
 class AlbumGroupList(Resource):
     @jwt_required()
-    @album_group_ns.marshal_list_with(album_group_model)
+    @list_response(album_group_ns, album_group_model)
+    @album_group_ns.doc(params=PAGINATION_PARAMS)
     def get(self):
-        """Get all album-group relationships"""
+        """Get all album-group relationships, one page at a time"""
+        page = keyset_page(['album_id', 'group_id'])
         connection = get_db_connection()
-        album_groups = connection.execute('SELECT * FROM Album_Group').fetchall()
+        album_groups = page.fetch(connection, 'SELECT * FROM Album_Group')
         connection.close()
-        return [dict(album_group) for album_group in album_groups]
+        return paged(page, album_groups, album_group_model)
 
     @jwt_required()
     @album_group_ns.expect(album_group_model)
@@ -2170,39 +2947,32 @@ class AlbumGroupList(Resource):
         """Create a new album-group relationship"""
         data = request.json
         
-        try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                
-                # Verify the album exists
-                album = cursor.execute('SELECT 1 FROM Album WHERE album_id = ?', (data['album_id'],)).fetchone()
-                if not album:
-                    return {"message": "Cannot associate a non-existent album with a group"}, 404
-                    
-                # Verify the group exists
-                group = cursor.execute('SELECT 1 FROM MusicGroup WHERE group_id = ?', (data['group_id'],)).fetchone()
-                if not group:
-                    return {"message": "Cannot associate an album with a non-existent group"}, 404
-                
-                # Check if this relationship already exists
-                existing = cursor.execute(
-                    'SELECT 1 FROM Album_Group WHERE album_id = ? AND group_id = ?',
-                    (data['album_id'], data['group_id'])
-                ).fetchone()
-                
-                if existing:
-                    return {"message": "This album is already associated with this group"}, 409  # Conflict
-                
-                cursor.execute('INSERT INTO Album_Group (album_id, group_id) VALUES (?, ?)',
-                           (data['album_id'], data['group_id']))
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            
+            # Verify the album exists
+            album = cursor.execute('SELECT 1 FROM Album WHERE album_id = ?', (data['album_id'],)).fetchone()
+            if not album:
+                return {"message": "Cannot associate a non-existent album with a group"}, 404
                 
-                return {"message": "Album-Group relationship created successfully"}, 201
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+            # Verify the group exists
+            group = cursor.execute('SELECT 1 FROM MusicGroup WHERE group_id = ?', (data['group_id'],)).fetchone()
+            if not group:
+                return {"message": "Cannot associate an album with a non-existent group"}, 404
+            
+            # Check if this relationship already exists
+            existing = cursor.execute(
+                'SELECT 1 FROM Album_Group WHERE album_id = ? AND group_id = ?',
+                (data['album_id'], data['group_id'])
+            ).fetchone()
+            
+            if existing:
+                return {"message": "This album is already associated with this group"}, 409  # Conflict
+            
+            cursor.execute('INSERT INTO Album_Group (album_id, group_id) VALUES (?, ?)',
+                       (data['album_id'], data['group_id']))
+            
+            return {"message": "Album-Group relationship created successfully"}, 201
 
 @album_group_ns.route('/<string:album_id>/groups/<string:group_id>')
 class AlbumGroup(Resource):
@@ -2246,12 +3016,15 @@ artist_model = api.model('Artist', {
 @artist_ns.route('/')
 class ArtistList(Resource):
     @jwt_required()
-    @artist_ns.marshal_list_with(artist_model)
+    @list_response(artist_ns, artist_model)
+    @artist_ns.doc(params=PAGINATION_PARAMS)
     def get(self):
-        """Get all artists"""
+        """Get all artists, one page at a time"""
+        page = keyset_page(['artist_id'])
         connection = get_db_connection()
-        artists = connection.execute('SELECT * FROM Artist').fetchall()
-        return [dict(artist) for artist in artists]
+        artists = page.fetch(connection, 'SELECT * FROM Artist')
+        connection.close()
+        return paged(page, artists, artist_model)
 
     @jwt_required()
     @artist_ns.expect(artist_model)
@@ -2296,7 +3069,7 @@ history_ns = Namespace('histories',
 
 history_model = api.model('History', {
     'user_id': fields.String(required=True, description="ID of the user who listened to the song"),
-    'start_time': fields.DateTime(required=True, description="When the listening session started", dt_format='iso8601'),
+    'start_time': SQLiteDateTime(required=True, description="When the listening session started", dt_format='iso8601'),
     'duration': fields.Integer(description="Length of the listening session in seconds"),
     'song_id': fields.String(required=True, description="ID of the song that was played")
 })
@@ -2306,9 +3079,10 @@ class HistoryList(Resource):
     """Resource for managing the collection of listening history records"""
     
     @jwt_required()
-    @history_ns.marshal_list_with(history_model)
-    @history_ns.doc(responses={
-        200: 'Success - Returns list of history records',
+    @list_response(history_ns, history_model)
+    @history_ns.doc(params=PAGINATION_PARAMS, responses={
+        200: 'Success - Returns a page of history records',
+        400: 'Bad request - Invalid limit or cursor',
         401: 'Unauthorized - Invalid or missing token',
         503: 'Service unavailable - Database is locked'
     })
@@ -2316,28 +3090,25 @@ class HistoryList(Resource):
         """
         Get all listening history
         
-        Returns a complete list of all user listening activity.
+        Returns all user listening activity one page at a time, ordered by
+        user_id and start_time (the History primary key).
         This can be used for analytics and recommendation systems.
         """
-        try:
-            with DBConnection() as connection:
-                history_records = connection.execute('SELECT * FROM History').fetchall()
-                return [dict(history) for history in history_records]
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        page = keyset_page(['user_id', 'start_time'])
+        with DBConnection() as connection:
+            history_records = page.fetch(connection, 'SELECT * FROM History')
+            return paged(page, history_records, history_model)
 
     @jwt_required()
     @history_ns.expect(history_model)
     @history_ns.doc(responses={
         201: 'History record created successfully',
+        202: 'History record queued (async ingestion)',
         400: 'Bad request - Invalid data',
         401: 'Unauthorized - Invalid or missing token',
         404: 'User or song not found',
-        503: 'Service unavailable - Database is locked'
+        409: 'A session for this user already starts at that time',
+        503: 'Service unavailable - Database is locked, ingest buffer is full or the write timed out'
     })
     def post(self):
         """
@@ -2345,47 +3116,117 @@ class HistoryList(Resource):
         
         Logs when a user listens to a song, including how long they listened.
         The start_time will default to the current server time if not specified.
+        
+        With buffered ingestion enabled, plays are group-committed in batches.
+        In 'async' durability mode the response is 202 as soon as the play is queued.
         """
         data = request.json
         
+        if HISTORY_INGEST_BUFFERED:
+            return self._post_buffered(data)
+        
+        with DBConnection() as connection:
+            cursor = connection.cursor()
+            
+            # Verify the user exists
+            user = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (data['user_id'],)).fetchone()
+            if not user:
+                return {"message": "Cannot log history for non-existent user"}, 404
+                
+            # Verify the song exists
+            song = cursor.execute('SELECT 1 FROM Song WHERE song_id = ?', (data['song_id'],)).fetchone()
+            if not song:
+                return {"message": "Cannot log history for non-existent song"}, 404
+                
+            # Use explicit start_time if provided, otherwise use CURRENT_TIMESTAMP
+            if 'start_time' in data:
+                cursor.execute('INSERT INTO History (user_id, start_time, duration, song_id) VALUES (?, ?, ?, ?)',
+                              (data['user_id'], data['start_time'], data['duration'], data['song_id']))
+            else:
+                cursor.execute('INSERT INTO History (user_id, duration, song_id) VALUES (?, ?, ?)',
+                              (data['user_id'], data['duration'], data['song_id']))
+        
         try:
-            with DBConnection() as connection:
-                cursor = connection.cursor()
-                
-                # Verify the user exists
-                user = cursor.execute('SELECT 1 FROM User WHERE user_id = ?', (data['user_id'],)).fetchone()
-                if not user:
-                    return {"message": "Cannot log history for non-existent user"}, 404
-                    
-                # Verify the song exists
-                song = cursor.execute('SELECT 1 FROM Song WHERE song_id = ?', (data['song_id'],)).fetchone()
-                if not song:
-                    return {"message": "Cannot log history for non-existent song"}, 404
-                    
-                # Use explicit start_time if provided, otherwise use CURRENT_TIMESTAMP
-                if 'start_time' in data:
-                    cursor.execute('INSERT INTO History (user_id, start_time, duration, song_id) VALUES (?, ?, ?, ?)',
-                                  (data['user_id'], data['start_time'], data['duration'], data['song_id']))
-                else:
-                    cursor.execute('INSERT INTO History (user_id, duration, song_id) VALUES (?, ?, ?)',
-                                  (data['user_id'], data['duration'], data['song_id']))
-                    
-            return {"message": "Listening session recorded!"}, 201
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+            count_chart_plays([PlayEvent(data['user_id'], data.get('start_time') or current_timestamp(),
+                                         data['duration'], data['song_id'])])
+        except Exception:
+            # The play is recorded; the charts only miss it
+            app.logger.exception("Counting the play in the charts failed")
+        return {"message": "Listening session recorded!"}, 201
+
+    def _post_buffered(self, data):
+        """Validate a play against the read pool, then hand it to the group-commit ingestor"""
+        try:
+            # The existence checks only read, so they don't queue for the writer
+            connection = db_reader.acquire()
+            try:
+                user = connection.execute('SELECT 1 FROM User WHERE user_id = ?', (data['user_id'],)).fetchone()
+                song = connection.execute('SELECT 1 FROM Song WHERE song_id = ?', (data['song_id'],)).fetchone()
+            finally:
+                connection.close()
+            if not user:
+                return {"message": "Cannot log history for non-existent user"}, 404
+            if not song:
+                return {"message": "Cannot log history for non-existent song"}, 404
+            
+            event = history_ingestor.submit(data['user_id'], data['duration'], data['song_id'],
+                                            start_time=data.get('start_time'))
+        except (IngestBufferFull, IngestTimeout) as e:
+            return {"message": str(e)}, 503
+        
+        if history_ingestor.durability == 'async':
+            return {"message": "Listening session queued!"}, 202
+        if isinstance(event.error, sqlite3.IntegrityError):
+            return {"message": "A listening session for this user already starts at that time"}, 409
+        if isinstance(event.error, sqlite3.OperationalError):
+            # Busy -> 503, anything else -> 500 (see handle_operational_error)
+            raise event.error
+        if event.error is not None:
+            return {"message": f"Database error: {str(event.error)}"}, 500
+        return {"message": "Listening session recorded!"}, 201
+
+@history_ns.route('/export')
+class HistoryExport(Resource):
+    """Resource for exporting listening history in one streamed response"""
+
+    @jwt_required()
+    @history_ns.produces(['application/json', 'application/x-ndjson'])
+    @history_ns.response(200, 'Success - Streams history records', [history_model])
+    @history_ns.doc(params={
+        'format': {'description': 'json (one JSON array) or ndjson (one record per line)',
+                   'enum': ['json', 'ndjson'], 'in': 'query'},
+        'user_id': {'description': "Only export this user's history", 'in': 'query'},
+        'after': PAGINATION_PARAMS['after']
+    }, responses={
+        400: 'Bad request - Invalid format or cursor',
+        401: 'Unauthorized - Invalid or missing token'
+    })
+    def get(self):
+        """
+        Export listening history
+
+        Streams every history record, ordered by user_id and start_time, without
+        building the whole result in memory. Use it instead of paging through
+        /histories/ for analytics exports. A cursor from /histories/ can be passed
+        as ?after= to export the rest of the history from that point.
+        """
+        user_id = request.args.get('user_id')
+        if user_id:
+            page = keyset_page(['start_time'])
+            return streamed(page, 'SELECT * FROM History', history_model,
+                            where='user_id = ?', params=(user_id,))
+        page = keyset_page(['user_id', 'start_time'])
+        return streamed(page, 'SELECT * FROM History', history_model)
 
 @history_ns.route('/<string:user_id>')
 class UserHistory(Resource):
     """Resource for managing a specific user's listening history"""
     
     @jwt_required()
-    @history_ns.marshal_list_with(history_model)
-    @history_ns.doc(responses={
-        200: 'Success - Returns user history records or specific record',
+    @list_response(history_ns, history_model)
+    @history_ns.doc(params=PAGINATION_PARAMS, responses={
+        200: 'Success - Returns a page of user history records or specific record',
+        400: 'Bad request - Invalid limit or cursor',
         404: 'User or listening session not found',
         401: 'Unauthorized - Invalid or missing token'
     })
@@ -2393,11 +3234,12 @@ class UserHistory(Resource):
         """
         Get listening history for a specific user
         
-        Returns a user's listening history, sorted by time.
+        Returns a user's listening history one page at a time, newest first.
         Can filter for a specific listening session if start_time is provided as a query parameter.
         """
         # Get the start_time from query parameters if provided
         start_time = request.args.get('start_time')
+        page = keyset_page(['start_time'], descending=True)
         
         connection = get_db_connection()
         # First verify the user exists
@@ -2418,13 +3260,11 @@ class UserHistory(Resource):
                 return {"message": "Couldn't find that listening session"}, 404
             return dict(history)
         else:
-            # If no start_time, get all history for the user
-            history_records = connection.execute(
-                'SELECT * FROM History WHERE user_id = ? ORDER BY start_time DESC',
-                (user_id,)
-            ).fetchall()
+            # If no start_time, get the user's history newest first
+            history_records = page.fetch(connection, 'SELECT * FROM History',
+                                         where='user_id = ?', params=(user_id,))
             connection.close()
-            return [dict(record) for record in history_records]
+            return paged(page, history_records, history_model)
 
     @jwt_required()
     @history_ns.doc(responses={
@@ -2482,19 +3322,14 @@ genrefields_model = api.model('GenreFields', {
 @genrefields_ns.route('/')
 class GenreFieldsList(Resource):
     @jwt_required()
-    @genrefields_ns.marshal_list_with(genrefields_model)
+    @list_response(genrefields_ns, genrefields_model)
+    @genrefields_ns.doc(params=PAGINATION_PARAMS)
     def get(self):
-        """Get all genre fields"""
-        try:
-            with DBConnection() as connection:
-                genres = connection.execute('SELECT * FROM GenreFields').fetchall()
-                return [dict(genre) for genre in genres]
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
+        """Get all genre fields, one page at a time"""
+        page = keyset_page(['genre_id'])
+        with DBConnection() as connection:
+            genres = page.fetch(connection, 'SELECT * FROM GenreFields')
+            return paged(page, genres, genrefields_model)
 
     @jwt_required()
     @genrefields_ns.expect(genrefields_model)
@@ -2511,12 +3346,6 @@ class GenreFieldsList(Resource):
             if "UNIQUE constraint failed" in str(e):
                 return {"message": "A genre with this name already exists"}, 409
             return {"message": f"Database integrity error: {str(e)}"}, 400
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                return {"message": "Database is currently busy, please try again"}, 503
-            return {"message": f"Database error: {str(e)}"}, 500
-        except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
 
 group_artist_ns = Namespace('group_artists', description="Manage group-artist relationships")
 
@@ -2528,12 +3357,14 @@ group_artist_model = api.model('GroupArtist', {
 @group_artist_ns.route('/')
 class GroupArtistList(Resource):
     @jwt_required()
-    @group_artist_ns.marshal_list_with(group_artist_model)
+    @list_response(group_artist_ns, group_artist_model)
+    @group_artist_ns.doc(params=PAGINATION_PARAMS)
     def get(self):
-        """Get all group-artist relationships"""
+        """Get all group-artist relationships, one page at a time"""
+        page = keyset_page(['group_id', 'artist_id'])
         with DBConnection() as connection:
-            relationships = connection.execute('SELECT * FROM GroupArtist').fetchall()
-            return [dict(rel) for rel in relationships]
+            relationships = page.fetch(connection, 'SELECT * FROM GroupArtist')
+            return paged(page, relationships, group_artist_model)
 
     @jwt_required()
     @group_artist_ns.expect(group_artist_model)
@@ -2556,7 +3387,337 @@ class GroupArtistList(Resource):
 
 api.add_namespace(group_artist_ns)
 
+# ---------------------------- Catalog Search ----------------------------
+
+search_ns = Namespace('search', description="Search songs, albums, groups, artists and playlists at once")
+
+search_hit_model = search_ns.model('SearchHit', {
+    'id': fields.String(description="ID of the song, album, group, artist or playlist"),
+    'name': fields.String(description="Its name"),
+    'url': fields.String(description="Where to get its details")
+})
+
+search_results_model = search_ns.model('SearchResults', {
+    f'{kind}s': fields.List(fields.Nested(search_hit_model),
+                             description=f"Best matching {kind}s (null if not among ?types)")
+    for kind in CATALOG_KINDS
+})
+
+def detail_url(kind, item_id):
+    """Return the URL of the details of a search result"""
+    # Where the details of each type live
+    resource, key = {
+        'song': (Song, 'song_id'),
+        'album': (Album, 'album_id'),
+        'group': (Group, 'group_id'),
+        'artist': (ArtistById, 'artist_id'),
+        'playlist': (Playlist, 'playlist_id'),
+        'user': (User, 'user_id')
+    }[kind]
+    return api.url_for(resource, **{key: item_id})
+
+@search_ns.route('/')
+class CatalogSearch(Resource):
+    @jwt_required()
+    @search_ns.marshal_with(search_results_model)
+    @search_ns.doc(params={
+        'q': {'description': 'Search text; every word has to match the start of a word in the name',
+              'type': 'string', 'in': 'query', 'required': True},
+        'limit': {'description': f'Maximum number of results per type (1-{SEARCH_MAX_LIMIT}, '
+                                 f'default {CATALOG_SEARCH_DEFAULT_LIMIT})',
+                  'type': 'integer', 'in': 'query'},
+        'types': {'description': f"Comma separated types to search ({', '.join(CATALOG_KINDS)}); default all",
+                  'type': 'string', 'in': 'query'}
+    }, responses={
+        400: 'Bad request - No words to search for, invalid limit or type',
+        401: 'Unauthorized - Invalid or missing token'
+    })
+    def get(self):
+        """
+        Search the whole catalog, best matches first
+        
+        Looks up songs, albums, groups, artists and playlists by name in the
+        CatalogSearch full-text index and returns the best `limit` matches of
+        each type (BM25 ranking), all from one query.
+        """
+        match, limit = search_request(request.args.get('q'), CATALOG_SEARCH_DEFAULT_LIMIT)
+        kinds = search_kinds(CATALOG_KINDS)
+        
+        connection = get_db_connection()
+        try:
+            hits = connection.execute(catalog_search_sql(kinds), (match, limit)).fetchall()
+        finally:
+            connection.close()
+        
+        results = {f'{kind}s': [] for kind in kinds}
+        for kind, item_id, name in hits:
+            results[f'{kind}s'].append({'id': item_id, 'name': name, 'url': detail_url(kind, item_id)})
+        return results
+
+suggestion_model = search_ns.model('Suggestion', {
+    'type': fields.String(description=f"What was found ({', '.join(SUGGEST_KINDS)})"),
+    'id': fields.String(description="Its ID"),
+    'name': fields.String(description="Its name (a nickname for users)"),
+    'plays': fields.Integer(description="Times it was played (songs, albums, groups) or listened (users)"),
+    'url': fields.String(description="Where to get its details")
+})
+
+@search_ns.route('/suggest')
+class SearchSuggestions(Resource):
+    @jwt_required()
+    @search_ns.response(200, 'Success - Returns suggestions, most played first', [suggestion_model])
+    @search_ns.doc(params={
+        'q': {'description': 'What was typed so far; matched against the start of any word of a name',
+              'type': 'string', 'in': 'query', 'required': True},
+        'limit': {'description': f'Maximum number of suggestions (1-{SEARCH_MAX_LIMIT}, '
+                                 f'default {SUGGEST_DEFAULT_LIMIT})',
+                  'type': 'integer', 'in': 'query'},
+        'types': {'description': f"Comma separated types to suggest ({', '.join(SUGGEST_KINDS)}); default all",
+                  'type': 'string', 'in': 'query'}
+    }, responses={
+        400: 'Bad request - No letters or digits typed, invalid limit or type',
+        401: 'Unauthorized - Invalid or missing token'
+    })
+    def get(self):
+        """
+        Suggest songs, albums, groups and users as the user types
+        
+        Answered from an in-memory prefix index rather than the database, fast
+        enough to call on every keystroke. Names are ranked by play count. The
+        index picks up catalog changes within about a second.
+        """
+        text = request.args.get('q')
+        _, limit = search_request(text, SUGGEST_DEFAULT_LIMIT)
+        kinds = search_kinds(SUGGEST_KINDS)
+        
+        suggest_index.refresh(get_db_connection)
+        suggestions = suggest_index.suggest(text, kinds if kinds != SUGGEST_KINDS else None, limit)
+        return json_list([{'type': kind, 'id': item_id, 'name': name, 'plays': plays,
+                           'url': detail_url(kind, item_id)}
+                          for kind, item_id, name, plays in suggestions])
+
+api.add_namespace(search_ns)
+
+# ---------------------------- Analytics ----------------------------
+
+analytics_ns = Namespace('analytics', description="Listening statistics over any time range")
+
+analytics_model = analytics_ns.model('ListeningTotals', {
+    'id': fields.String(description="ID of the song, album, genre or user"),
+    'name': fields.String(description="Its name (a nickname for users)"),
+    'plays': fields.Integer(description="Plays in the time range"),
+    'listen_time': fields.Integer(description="Seconds listened in the time range")
+})
+
+def time_arg(name):
+    """
+    Read an ISO 8601 date/time query parameter (UTC unless it has an offset);
+    an unparseable one ends the request with a 400 response.
+    
+    Returns:
+        datetime: The aware datetime, or None if the parameter is missing
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, f"{name} must be an ISO 8601 date or date and time")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+@analytics_ns.route('/top/<string:dimension>')
+@analytics_ns.doc(params={'dimension': f"What to total plays by ({', '.join(ANALYTICS_DIMENSIONS)})"})
+class TopListening(Resource):
+    @jwt_required()
+    @analytics_ns.response(200, 'Success - Returns totals, highest first', [analytics_model])
+    @analytics_ns.doc(params={
+        'since': {'description': 'Only plays starting at or after this (ISO 8601, UTC by default)',
+                  'type': 'string', 'in': 'query'},
+        'until': {'description': 'Only plays starting before this (ISO 8601, UTC by default)',
+                  'type': 'string', 'in': 'query'},
+        'by': {'description': 'Rank by seconds listened (default) or number of plays',
+               'enum': list(ANALYTICS_METRICS), 'in': 'query'},
+        'limit': {'description': f'Number of results (1-{ANALYTICS_MAX_LIMIT}, default {ANALYTICS_DEFAULT_LIMIT})',
+                  'type': 'integer', 'in': 'query'}
+    }, responses={
+        400: 'Bad request - Invalid time, ranking or limit',
+        404: 'Unknown dimension',
+        401: 'Unauthorized - Invalid or missing token'
+    })
+    def get(self, dimension):
+        """
+        Get the songs, albums, genres or users with the most listening in a time range
+        
+        A play counts for its song, every album and genre of that song, and its user.
+        With numpy installed the totals come from an in-memory columnar copy of
+        History (vectorized group-bys, milliseconds over millions of plays) that
+        picks up new plays within a few seconds; without it they are computed
+        with SQL.
+        """
+        if dimension not in ANALYTICS_DIMENSIONS:
+            abort(404, f"dimension must be one of: {', '.join(ANALYTICS_DIMENSIONS)}")
+        metric = request.args.get('by', 'listen_time')
+        if metric not in ANALYTICS_METRICS:
+            abort(400, f"by must be one of: {', '.join(ANALYTICS_METRICS)}")
+        limit = limit_arg(ANALYTICS_DEFAULT_LIMIT, ANALYTICS_MAX_LIMIT)
+        since, until = time_arg('since'), time_arg('until')
+        
+        if can_analyze():
+            listening_analytics.refresh(get_db_connection)
+            top = listening_analytics.top(dimension,
+                                          int(since.timestamp()) if since else None,
+                                          int(until.timestamp()) if until else None,
+                                          limit, metric)
+        
+        table, key, name, code = ANALYTICS_DIMENSIONS[dimension]
+        connection = get_db_connection()
+        try:
+            if not can_analyze():
+                # top_sql() compares the bounds with datetime(start_time), so they
+                # use its format (a bound that looked like a number would be
+                # compared as one: keep them timestamps)
+                bounds = (since.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S') if since else '',
+                          until.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                          if until else '9999-12-31 23:59:59')
+                top = connection.execute(top_sql(dimension, metric), (*bounds, limit)).fetchall()
+            codes = [row[0] for row in top]
+            placeholders = ', '.join('?' * len(codes))
+            names = {row[0]: (row[1], row[2]) for row in connection.execute(
+                f"SELECT {code}, {key}, {name} FROM {table} WHERE {code} IN ({placeholders})", codes)}
+        finally:
+            connection.close()
+        
+        results = []
+        for item_code, plays, listen_time in top:
+            if item_code in names:
+                item_id, item_name = names[item_code]
+                results.append({'id': str(item_id), 'name': item_name, 'plays': plays,
+                                'listen_time': listen_time})
+        return json_list(results)
+
+api.add_namespace(analytics_ns)
+
+# ---------------------------- Charts ----------------------------
+
+charts_ns = Namespace('charts', description="Trending songs and groups, approximated in real time")
+
+chart_entry_model = charts_ns.model('ChartEntry', {
+    'rank': fields.Integer(description="Position in the chart, from 1"),
+    'id': fields.String(description="ID of the song or group"),
+    'name': fields.String(description="Its name"),
+    'plays': fields.Integer(description="Estimated plays in the window (never too low)"),
+    'url': fields.String(description="Where to get the song or group")
+})
+
+chart_model = charts_ns.model('Chart', {
+    'window': fields.String(description="The window charted"),
+    'type': fields.String(description="song or group"),
+    'since': fields.String(description="Start of the window (UTC)"),
+    'total_plays': fields.Integer(description="All plays in the window"),
+    'max_overcount': fields.Integer(
+        description="How much any estimate may be too high (exceeded with a probability of e^-depth)"),
+    'items': fields.List(fields.Nested(chart_entry_model))
+})
+
+@charts_ns.route('/<string:window>/<string:kind>')
+@charts_ns.doc(params={'window': f"Time window ({', '.join(CHART_WINDOWS)})",
+                       'kind': f"What to chart ({', '.join(CHART_KINDS)})"})
+class TrendingChart(Resource):
+    @jwt_required()
+    @charts_ns.response(200, 'Success - Returns the chart, most played first', chart_model)
+    @charts_ns.doc(params={
+        'limit': {'description': f'Chart length (1-{CHART_TOP_K}, default {CHART_DEFAULT_LIMIT})',
+                  'type': 'integer', 'in': 'query'}
+    }, responses={
+        400: 'Bad request - Invalid limit',
+        404: 'Unknown window or kind',
+        401: 'Unauthorized - Invalid or missing token'
+    })
+    def get(self, window, kind):
+        """
+        Get the most played songs or groups of the last hour, day or week
+        
+        A play counts for its song and for every group with an album containing
+        the song. Plays are counted into Count-Min sketches as they are written,
+        so a chart never runs a GROUP BY over History; the counts are estimates
+        that can be up to `max_overcount` too high, never too low. Charts slide
+        in steps of 5 minutes (hour), an hour (day) or 6 hours (week).
+        """
+        if window not in CHART_WINDOWS:
+            abort(404, f"window must be one of: {', '.join(CHART_WINDOWS)}")
+        if kind not in CHART_KINDS:
+            abort(404, f"kind must be one of: {', '.join(CHART_KINDS)}")
+        limit = limit_arg(CHART_DEFAULT_LIMIT, CHART_TOP_K)
+        
+        trending_charts.refresh(get_db_connection)
+        chart = trending_charts.top(window, kind, limit)
+        table, key, name = ('Song', 'song_id', 'song_name') if kind == 'song' else \
+                           ('MusicGroup', 'group_id', 'group_name')
+        item_ids = [item_id for item_id, _ in chart['items']]
+        placeholders = ', '.join('?' * len(item_ids))
+        connection = get_db_connection()
+        try:
+            names = dict(connection.execute(
+                f"SELECT {key}, {name} FROM {table} WHERE {key} IN ({placeholders})", item_ids).fetchall())
+        finally:
+            connection.close()
+        
+        # Deleted songs and groups drop out of the chart
+        items = [{'id': item_id, 'name': names[item_id], 'plays': plays, 'url': detail_url(kind, item_id)}
+                 for item_id, plays in chart['items'] if item_id in names]
+        for rank, item in enumerate(items, 1):
+            item['rank'] = rank
+        return {
+            'window': window,
+            'type': kind,
+            'since': datetime.fromtimestamp(chart['since'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'total_plays': chart['total'],
+            'max_overcount': chart['max_overcount'],
+            'items': items
+        }, 200
+
+api.add_namespace(charts_ns)
+
+# ---------------------------- Database Stats ----------------------------
+
+db_ns = Namespace('db', description="Database connection and contention metrics")
+
+@db_ns.route('/stats')
+class DatabaseStats(Resource):
+    @jwt_required()
+    @db_ns.doc(responses={
+        200: 'Success - Returns connection pool and writer queue metrics',
+        401: 'Unauthorized - Invalid or missing token'
+    })
+    def get(self):
+        """
+        Get connection pool and writer queue metrics
+        
+        `reader_pool` describes the shared read-only connections. `writer` describes the
+        single writer connection: `waiting` is the current write queue depth and
+        `avg_wait_ms`/`max_wait_ms` show how long writers queued for it.
+        `history_ingest` shows the group-commit buffer depth and batch sizes.
+        `busy_retry` counts retries of busy/locked errors and requests that gave up.
+        `autocomplete` shows the size of the in-memory suggestion index,
+        `analytics` the size of the in-memory History columns and `charts` the
+        size of the trending sketches and when they were last saved.
+        """
+        return {
+            'reader_pool': db_reader.stats(),
+            'writer': db_writer.stats(),
+            'history_ingest': history_ingestor.stats(),
+            'busy_retry': busy_retry.stats(),
+            'autocomplete': suggest_index.stats(),
+            'analytics': listening_analytics.stats(),
+            'charts': trending_charts.stats()
+        }, 200
+
+api.add_namespace(db_ns)
+
 if __name__ == '__main__':
-    init_db()
-    insert_dummy_data(DATABASE)
+    # Prepare the database before the development server starts taking requests
+    prepare_database()
     app.run(debug=True)
\ No newline at end of file
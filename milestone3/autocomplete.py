@@ -0,0 +1,320 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+# Names offered as suggestions: (kind, table, key column, name column)
+SUGGEST_SOURCES = [
+    ('song', 'Song', 'song_id', 'song_name'),
+    ('album', 'Album', 'album_id', 'album_name'),
+    ('group', 'MusicGroup', 'group_id', 'group_name'),
+    ('user', 'User', 'user_id', 'nickname'),
+]
+SUGGEST_KINDS = [kind for kind, *_ in SUGGEST_SOURCES]
+_SOURCES = {kind: (table, key, name) for kind, table, key, name in SUGGEST_SOURCES}
+
+# SuggestChanges keeps this many entries; an index that fell further behind
+# reloads everything instead
+CHANGE_LOG_SIZE = 10000
+
+_WORD = re.compile(r'\w+')
+
+# Sorts after every character a name can contain
+_HIGHEST = '\U0010ffff'
+
+
+def normalize(text):
+    """
+    Fold text the way names are indexed: lowercased, accents removed and
+    punctuation turned into single spaces, so "beyonce halo" finds "Beyoncé - Halo".
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(_WORD.findall(stripped.casefold()))
+
+
+def suggest_change_triggers():
+    """Return the statements logging every added, renamed or deleted name in SuggestChanges"""
+    triggers = []
+    for kind, table, key, name in SUGGEST_SOURCES:
+        triggers += [
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{kind}_suggest_insert AFTER INSERT ON {table}
+                BEGIN
+                    INSERT INTO SuggestChanges(kind, item_id) VALUES ('{kind}', NEW.{key});
+                END""",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{kind}_suggest_delete AFTER DELETE ON {table}
+                BEGIN
+                    INSERT INTO SuggestChanges(kind, item_id) VALUES ('{kind}', OLD.{key});
+                END""",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{kind}_suggest_update AFTER UPDATE OF {name}, {key} ON {table}
+                BEGIN
+                    INSERT INTO SuggestChanges(kind, item_id) VALUES ('{kind}', OLD.{key});
+                    INSERT INTO SuggestChanges(kind, item_id)
+                        SELECT '{kind}', NEW.{key} WHERE NEW.{key} IS NOT OLD.{key};
+                END""",
+        ]
+    triggers.append(
+        f"""CREATE TRIGGER IF NOT EXISTS trg_suggest_changes_prune AFTER INSERT ON SuggestChanges
+            BEGIN
+                DELETE FROM SuggestChanges WHERE seq <= NEW.seq - {CHANGE_LOG_SIZE};
+            END""")
+    return triggers
+
+
+def _credit(plays, song_id, count, song_albums, album_groups):
+    """Add plays of a song to the song, its albums and their groups"""
+    plays[('song', song_id)] += count
+    groups = set()
+    for album_id in song_albums.get(song_id, ()):
+        plays[('album', album_id)] += count
+        groups.update(album_groups.get(album_id, ()))
+    for group_id in groups:
+        plays[('group', group_id)] += count
+
+
+class AutocompleteIndex:
+    """
+    In-memory prefix index of catalog names for search-as-you-type.
+
+    Each name is stored once for every word it contains, as the rest of the
+    name from that word on ("stairway to heaven", "to heaven", "heaven"), in
+    one sorted array. The entries starting with a prefix are then one slice of
+    it, found with two binary searches, so a lookup never touches the database.
+    Suggestions are ranked by play count: History plays of a song, of the songs
+    of an album or group, or by a user.
+
+    The index follows the database through the SuggestChanges log, which
+    triggers fill whenever a name is added, renamed or deleted: refresh() only
+    re-reads the logged names. Plays are counted as the history ingestor writes
+    them (see add_plays()). Everything, including plays written by other
+    processes and album membership, is reloaded every `rebuild_interval` seconds.
+
+    Args:
+        refresh_interval (float): Seconds between checks of the change log
+        rebuild_interval (float): Seconds between full reloads
+        max_words (int): How many words of a name a suggestion can start at
+        cache_min_matches (int): Results for prefixes matching more entries than
+                                 this (one or two letters, typically) are cached
+        cache_ttl (float): Seconds a cached result is served; they don't
+                           reflect changes made in the meantime
+    """
+    def __init__(self, refresh_interval=1.0, rebuild_interval=900.0, max_words=8,
+                 cache_min_matches=2000, cache_ttl=30.0):
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.max_words = max_words
+        self.cache_min_matches = cache_min_matches
+        self.cache_ttl = cache_ttl
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._terms = []
+        self._refs = []
+        self._names = {}
+        self._plays = Counter()
+        self._song_albums = {}
+        self._album_groups = {}
+        self._cache = {}
+        self._last_seq = 0
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    def _terms_of(self, name):
+        words = normalize(name).split()
+        return {' '.join(words[i:]) for i in range(min(len(words), self.max_words))}
+
+    def refresh(self, connect, force=False):
+        """
+        Bring the index up to date if it hasn't been checked for `refresh_interval` seconds.
+
+        Only the first call waits for the index to load; later calls return at
+        once while another thread refreshes it.
+
+        Args:
+            connect (callable): Returns a database connection (closed afterwards)
+            force (bool): Check now, however recently the index was checked
+        """
+        if not force and time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            now = time.monotonic()
+            if not force and now - self._checked_at < self.refresh_interval:
+                return
+            connection = connect()
+            try:
+                if not self._loaded or now - self._loaded_at >= self.rebuild_interval:
+                    self._load(connection)
+                elif not self._apply_changes(connection):
+                    self._load(connection)
+            finally:
+                connection.close()
+            self._checked_at = now
+        finally:
+            self._refresh_lock.release()
+
+    def _load(self, connection):
+        """Build the whole index from the database"""
+        # Read the log position first: changes made while loading are applied
+        # again by the next refresh, which does no harm
+        last_seq = connection.execute("SELECT COALESCE(MAX(seq), 0) FROM SuggestChanges").fetchone()[0]
+        names = {}
+        for kind, table, key, name in SUGGEST_SOURCES:
+            for item_id, value in connection.execute(
+                    f"SELECT {key}, {name} FROM {table} WHERE {name} IS NOT NULL"):
+                names[(kind, item_id)] = value
+
+        song_albums = defaultdict(list)
+        for album_id, song_id in connection.execute("SELECT album_id, song_id FROM Album_Info"):
+            song_albums[song_id].append(album_id)
+        album_groups = defaultdict(list)
+        for album_id, group_id in connection.execute("SELECT album_id, group_id FROM Album_Group"):
+            album_groups[album_id].append(group_id)
+        plays = Counter()
+        # Song plays are kept up to date in SongListenStats (see aggregates.py)
+        for song_id, count in connection.execute("SELECT song_id, play_count FROM SongListenStats WHERE play_count > 0"):
+            _credit(plays, song_id, count, song_albums, album_groups)
+        for user_id, count in connection.execute("SELECT user_id, COUNT(*) FROM History GROUP BY user_id"):
+            plays[('user', user_id)] += count
+
+        entries = sorted((term, ref) for ref, name in names.items() for term in self._terms_of(name))
+        with self._lock:
+            self._terms = [term for term, _ in entries]
+            self._refs = [ref for _, ref in entries]
+            self._names = names
+            self._plays = plays
+            self._song_albums = dict(song_albums)
+            self._album_groups = dict(album_groups)
+            self._cache = {}
+            self._last_seq = last_seq
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+
+    def _apply_changes(self, connection):
+        """
+        Re-read the names logged in SuggestChanges since the last refresh.
+
+        Returns:
+            bool: False if the index has to be reloaded instead (it fell
+                  behind the log, or too much changed to patch it)
+        """
+        changes = connection.execute(
+            "SELECT seq, kind, item_id FROM SuggestChanges WHERE seq > ? ORDER BY seq",
+            (self._last_seq,)).fetchall()
+        if not changes:
+            return True
+        # Each insert shifts the arrays, so past this a rebuild is cheaper
+        if changes[0][0] != self._last_seq + 1 or len(changes) > CHANGE_LOG_SIZE // 10:
+            return False
+
+        changed = defaultdict(set)
+        for _, kind, item_id in changes:
+            if kind in _SOURCES:
+                changed[kind].add(item_id)
+        current = {}
+        for kind, item_ids in changed.items():
+            table, key, name = _SOURCES[kind]
+            item_ids = list(item_ids)
+            for i in range(0, len(item_ids), 500):
+                chunk = item_ids[i:i + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                for item_id, value in connection.execute(
+                        f"SELECT {key}, {name} FROM {table} WHERE {key} IN ({placeholders})", chunk):
+                    current[(kind, item_id)] = value
+
+        with self._lock:
+            for kind, item_ids in changed.items():
+                for item_id in item_ids:
+                    ref = (kind, item_id)
+                    self._remove(ref)
+                    if current.get(ref) is not None:
+                        self._add(ref, current[ref])
+            self._last_seq = changes[-1][0]
+        return True
+
+    def _add(self, ref, name):
+        self._names[ref] = name
+        for term in self._terms_of(name):
+            i = bisect_left(self._terms, term)
+            self._terms.insert(i, term)
+            self._refs.insert(i, ref)
+
+    def _remove(self, ref):
+        name = self._names.pop(ref, None)
+        if name is None:
+            return
+        for term in self._terms_of(name):
+            i = bisect_left(self._terms, term)
+            while i < len(self._terms) and self._terms[i] == term:
+                if self._refs[i] == ref:
+                    del self._terms[i]
+                    del self._refs[i]
+                    break
+                i += 1
+
+    def add_plays(self, events):
+        """
+        Count freshly written plays (a HistoryIngestor listener).
+
+        Args:
+            events (list): PlayEvents of one committed batch
+        """
+        with self._lock:
+            for event in events:
+                _credit(self._plays, event.song_id, 1, self._song_albums, self._album_groups)
+                self._plays[('user', event.user_id)] += 1
+
+    def suggest(self, text, kinds=None, limit=10):
+        """
+        Return the most played names containing a word that starts with `text`.
+
+        The text is matched as typed from the start of any word of a name, so
+        "to hea" suggests "Stairway to Heaven" but "stair heav" doesn't.
+
+        Args:
+            text (str): What the user typed so far
+            kinds (list): Kinds (see SUGGEST_KINDS) to suggest, None for all
+            limit (int): Maximum number of suggestions
+
+        Returns:
+            list: (kind, item id, name, plays) tuples, most played first
+        """
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        kinds = tuple(kinds) if kinds else None
+        key = (prefix, kinds, limit)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+            start = bisect_left(self._terms, prefix)
+            end = bisect_left(self._terms, prefix + _HIGHEST, start)
+            refs = set(self._refs[start:end])
+            if kinds is not None:
+                refs = [ref for ref in refs if ref[0] in kinds]
+            plays, names = self._plays, self._names
+            best = heapq.nsmallest(limit, refs, key=lambda ref: (-plays[ref], len(names[ref]), names[ref]))
+            results = [(kind, item_id, names[(kind, item_id)], plays[(kind, item_id)])
+                       for kind, item_id in best]
+            if end - start > self.cache_min_matches:
+                if len(self._cache) >= 1000:
+                    self._cache = {}
+                self._cache[key] = (now + self.cache_ttl, results)
+        return results
+
+    def stats(self):
+        """Return the size of the index and how current it is"""
+        with self._lock:
+            return {
+                'names': len(self._names),
+                'entries': len(self._terms),
+                'cached_prefixes': len(self._cache),
+                'change_seq': self._last_seq,
+                'loaded_seconds_ago': round(time.monotonic() - self._loaded_at, 1) if self._loaded else None
+            }
@@ -0,0 +1,471 @@
+import hashlib
+import heapq
+import json
+import math
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+
+# Sliding windows charted: window -> (bucket length in seconds, number of buckets).
+# A window holds the current bucket and the ones before it, so "week" covers the
+# last 6 days 18 hours to 7 days depending on how far into its bucket we are.
+CHART_WINDOWS = {
+    'hour': (5 * 60, 12),
+    'day': (60 * 60, 24),
+    'week': (6 * 60 * 60, 28),
+}
+# What is charted: a play counts for its song and for every group with an album
+# containing the song
+CHART_KINDS = ('song', 'group')
+
+# Bumped whenever the hashing changes, so older checkpoints are not reused
+_HASH_VERSION = 2
+# Rows of a sketch each take 4 bytes of one BLAKE2b digest (at most 64 bytes)
+MAX_SKETCH_DEPTH = 16
+
+_SONG_GROUPS_SQL = """
+    SELECT DISTINCT Album_Info.song_id, Album_Group.group_id
+    FROM Album_Info JOIN Album_Group ON Album_Group.album_id = Album_Info.album_id
+"""
+
+
+def _epoch(start_time):
+    """Epoch seconds of a History start_time (UTC unless it says otherwise), None if unreadable"""
+    try:
+        moment = datetime.fromisoformat(str(start_time))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def _slots(key, width, depth):
+    """Counter positions of a key in a width x depth sketch, one per row"""
+    # An independent hash per row: with positions derived from one pair of
+    # hashes (h1 + row * h2), two keys colliding in one row collide in all of
+    # them about 2 / width ** 2 of the time, far more often than the bound allows
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * depth).digest()
+    return [row * width + int.from_bytes(digest[4 * row:4 * row + 4], 'little') % width
+            for row in range(depth)]
+
+
+def _timestamp(epoch):
+    """Format epoch seconds like History.start_time"""
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch: approximate counts of any number of keys in fixed memory.
+
+    `depth` rows of `width` counters; a key adds to one counter per row and
+    its count is read back as the smallest of them. Other keys sharing a
+    counter can only make it larger, so estimates never undercount and, with
+    width = ceil(e / epsilon) and depth = ceil(ln(1 / delta)), overcount by
+    more than epsilon * total with probability at most delta. Counters are
+    updated conservatively (only those below the new estimate are raised),
+    which keeps the overcount well under that bound in practice.
+
+    Args:
+        width (int): Counters per row
+        depth (int): Number of rows (independent hashes)
+        counters (bytes): Counters of a checkpointed sketch to start from
+    """
+    def __init__(self, width, depth, counters=None):
+        self.width = width
+        self.depth = depth
+        if not 1 <= depth <= MAX_SKETCH_DEPTH:
+            raise ValueError(f"Sketch depth must be between 1 and {MAX_SKETCH_DEPTH}")
+        self.counters = array('I', bytes(counters) if counters else bytes(4 * width * depth))
+        if len(self.counters) != width * depth:
+            raise ValueError("Sketch counters don't match its width and depth")
+
+    def slots(self, key):
+        """Return the counter positions of a key, one per row"""
+        return _slots(key, self.width, self.depth)
+
+    def add(self, slots, count=1):
+        """Count a key (given by its slots()) and return its new estimate"""
+        counters = self.counters
+        estimate = min(counters[slot] for slot in slots) + count
+        for slot in slots:
+            if counters[slot] < estimate:
+                counters[slot] = estimate
+        return estimate
+
+    def estimate(self, slots):
+        """Return the estimated count of a key (given by its slots())"""
+        return min(self.counters[slot] for slot in slots)
+
+
+class _Bucket:
+    """Plays of one kind in one time bucket: a sketch plus its `top_k` heaviest keys"""
+    __slots__ = ('sketch', 'total', 'top', '_heap')
+
+    def __init__(self, sketch, total=0, top=None):
+        self.sketch = sketch
+        self.total = total
+        self.top = dict(top or {})
+        self._heap = [(estimate, key) for key, estimate in self.top.items()]
+        heapq.heapify(self._heap)
+
+    def add(self, key, slots, top_k, count=1):
+        estimate = self.sketch.add(slots, count)
+        self.total += count
+        top = self.top
+        if key in top:
+            # Its heap entry goes stale; it is fixed when it reaches the top
+            top[key] = estimate
+            return
+        if len(top) < top_k:
+            top[key] = estimate
+            heapq.heappush(self._heap, (estimate, key))
+            return
+        heap = self._heap
+        while heap[0][0] != top[heap[0][1]]:
+            _, stale = heapq.heappop(heap)
+            heapq.heappush(heap, (top[stale], stale))
+        if estimate > heap[0][0]:
+            _, evicted = heapq.heapreplace(heap, (estimate, key))
+            del top[evicted]
+            top[key] = estimate
+
+
+class TrendingCharts:
+    """
+    Approximate most-played songs and groups over sliding windows, in bounded memory.
+
+    Each window (see CHART_WINDOWS) is a ring of time buckets, and each bucket
+    holds a Count-Min sketch of the plays in it plus the `top_k` keys it
+    estimates highest. A chart merges the live buckets of its window: the
+    candidates are the buckets' top keys and each is estimated as the smallest
+    row sum of its counters across the buckets. Memory is fixed by the
+    configuration (width * depth * 4 bytes per bucket), not by the number of
+    plays or songs, and a play costs a few counter updates instead of a
+    GROUP BY over History at query time.
+
+    Counts can only be too high, by at most epsilon (e / width) of the plays in
+    the window, with probability 1 - delta (delta = e ** -depth). Plays deleted
+    from History stay counted until their bucket expires.
+
+    Plays are counted as the history ingestor writes them (see add_plays()).
+    checkpoint() saves the buckets to ChartSketches so the charts survive a
+    restart; plays written since the last checkpoint are lost on a crash. With
+    no usable checkpoint the charts are rebuilt from History once. Callers
+    that count plays on a request path use start_checkpoints() so the save
+    happens on a background thread instead.
+
+    Args:
+        width (int): Counters per sketch row
+        depth (int): Sketch rows
+        top_k (int): Heaviest keys remembered per bucket; charts are cut to this
+        checkpoint_interval (float): Minimum seconds between checkpoints
+        membership_interval (float): Seconds between reloads of which songs belong to which groups
+        cache_ttl (float): Seconds a chart is served before it is merged again
+    """
+    def __init__(self, width=2048, depth=5, top_k=100, checkpoint_interval=60.0,
+                 membership_interval=900.0, cache_ttl=1.0):
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.checkpoint_interval = checkpoint_interval
+        self.membership_interval = membership_interval
+        self.cache_ttl = cache_ttl
+        self.epsilon = math.e / width
+        self.delta = math.exp(-depth)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        # (window, kind) -> {bucket start (epoch seconds): _Bucket}
+        self._buckets = {(window, kind): {} for window in CHART_WINDOWS for kind in CHART_KINDS}
+        self._dirty = set()
+        self._song_groups = {}
+        self._cache = {}
+        self._loaded = False
+        self._membership_loaded_at = 0.0
+        self._checkpointed_at = time.monotonic()
+        self._checkpoints = 0
+        self._checkpointer = None
+
+    def _current_start(self, window, now):
+        span, _ = CHART_WINDOWS[window]
+        return int(now) // span * span
+
+    def _oldest_start(self, window, now):
+        span, count = CHART_WINDOWS[window]
+        return self._current_start(window, now) - (count - 1) * span
+
+    def ensure_loaded(self, connect):
+        """
+        Restore the buckets from the last checkpoint (or History) on first use.
+
+        Args:
+            connect (callable): Returns a database connection (closed afterwards)
+
+        Returns:
+            bool: True if this call rebuilt the charts from History, which
+                  already holds every committed play
+        """
+        if self._loaded:
+            return False
+        with self._load_lock:
+            if self._loaded:
+                return False
+            connection = connect()
+            try:
+                self._load_song_groups(connection)
+                restored = self._restore(connection)
+                if not restored:
+                    self._replay_history(connection)
+            finally:
+                connection.close()
+            self._loaded = True
+            return not restored
+
+    def _load_song_groups(self, connection):
+        song_groups = {}
+        for song_id, group_id in connection.execute(_SONG_GROUPS_SQL):
+            song_groups.setdefault(song_id, []).append(group_id)
+        with self._lock:
+            self._song_groups = {song_id: tuple(groups) for song_id, groups in song_groups.items()}
+            self._membership_loaded_at = time.monotonic()
+
+    def _restore(self, connection):
+        """Load the checkpointed buckets; False if there are none usable"""
+        now = time.time()
+        buckets = {chart: {} for chart in self._buckets}
+        for window, kind, start, width, depth, version, total, counters, top in connection.execute(
+                "SELECT window_name, kind, bucket_start, width, depth, hash_version, total, counters, top_keys "
+                "FROM ChartSketches"):
+            if (width, depth, version) != (self.width, self.depth, _HASH_VERSION):
+                return False
+            if (window, kind) in buckets and start >= self._oldest_start(window, now):
+                buckets[(window, kind)][start] = _Bucket(CountMinSketch(width, depth, counters),
+                                                         total, json.loads(top))
+        if not any(buckets.values()):
+            return False
+        with self._lock:
+            self._buckets = buckets
+        return True
+
+    def _replay_history(self, connection):
+        """Count the plays of the longest window straight from History"""
+        now = time.time()
+        since = min(self._oldest_start(window, now) for window in CHART_WINDOWS)
+        cursor = connection.execute("SELECT song_id, start_time FROM History WHERE start_time >= ?",
+                                    (_timestamp(since),))
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            with self._lock:
+                for song_id, start_time in rows:
+                    self._count(song_id, start_time, now)
+        with self._lock:
+            self._dirty = set(self._bucket_keys())
+
+    def _bucket_keys(self):
+        return [(window, kind, start) for (window, kind), buckets in self._buckets.items()
+                for start in buckets]
+
+    def _count(self, song_id, start_time, now):
+        """Count one play in every window (callers hold the lock)"""
+        played = _epoch(start_time)
+        if played is None:
+            played = int(now)
+        keys = [('song', song_id)] + [('group', group_id) for group_id in self._song_groups.get(song_id, ())]
+        slots = {key: _slots(key, self.width, self.depth) for _, key in keys}
+        for window in CHART_WINDOWS:
+            if played < self._oldest_start(window, now):
+                continue
+            # Plays stamped in the future count as happening now
+            start = min(self._current_start(window, played), self._current_start(window, now))
+            for kind, key in keys:
+                buckets = self._buckets[(window, kind)]
+                bucket = buckets.get(start)
+                if bucket is None:
+                    bucket = buckets[start] = _Bucket(CountMinSketch(self.width, self.depth))
+                bucket.add(key, slots[key], self.top_k)
+                self._dirty.add((window, kind, start))
+
+    def add_plays(self, events, connect):
+        """
+        Count freshly written plays (wrapped as a HistoryIngestor listener).
+
+        Args:
+            events (list): PlayEvents of one committed batch
+            connect (callable): Returns a read connection, used to load the
+                                charts on first use and look up new songs' groups
+        """
+        if self.ensure_loaded(connect):
+            return
+        unknown = {event.song_id for event in events} - self._song_groups.keys()
+        if unknown:
+            self._look_up_groups(unknown, connect)
+        now = time.time()
+        with self._lock:
+            for event in events:
+                self._count(event.song_id, event.start_time, now)
+
+    def _look_up_groups(self, song_ids, connect):
+        """Fetch the groups of songs added since membership was loaded"""
+        song_groups = {song_id: [] for song_id in song_ids}
+        placeholders = ', '.join('?' * len(song_groups))
+        connection = connect()
+        try:
+            for song_id, group_id in connection.execute(
+                    f"SELECT * FROM ({_SONG_GROUPS_SQL}) WHERE song_id IN ({placeholders})", list(song_groups)):
+                song_groups[song_id].append(group_id)
+        finally:
+            connection.close()
+        with self._lock:
+            # Songs without groups are remembered too, until the next reload
+            self._song_groups.update((song_id, tuple(groups)) for song_id, groups in song_groups.items())
+
+    def refresh(self, connect):
+        """
+        Load the charts on first use and reload group membership every `membership_interval` seconds.
+
+        Args:
+            connect (callable): Returns a database connection (closed afterwards)
+        """
+        if self.ensure_loaded(connect):
+            return
+        if time.monotonic() - self._membership_loaded_at >= self.membership_interval:
+            connection = connect()
+            try:
+                self._load_song_groups(connection)
+            finally:
+                connection.close()
+
+    def _expire(self, now):
+        """Drop the buckets that slid out of their window (callers hold the lock)"""
+        for (window, kind), buckets in self._buckets.items():
+            oldest = self._oldest_start(window, now)
+            for start in [start for start in buckets if start < oldest]:
+                del buckets[start]
+                self._dirty.discard((window, kind, start))
+
+    def top(self, window, kind, limit=10):
+        """
+        Return the most played songs or groups of a window.
+
+        Args:
+            window (str): One of CHART_WINDOWS
+            kind (str): One of CHART_KINDS
+            limit (int): How many to return (at most `top_k`)
+
+        Returns:
+            dict: 'since' (epoch seconds the window starts at), 'total' (plays
+                  in the window), 'max_overcount' (how much any estimate may
+                  be too high, with probability 1 - delta) and 'items', a list
+                  of (key, estimated plays) tuples, most played first
+        """
+        now = time.time()
+        cache_key = (window, kind, limit)
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1]
+            self._expire(now)
+            buckets = list(self._buckets[(window, kind)].values())
+            total = sum(bucket.total for bucket in buckets)
+            candidates = set()
+            for bucket in buckets:
+                candidates.update(bucket.top)
+            estimates = []
+            for key in candidates:
+                slots = _slots(key, self.width, self.depth)
+                estimate = min(sum(bucket.sketch.counters[slot] for bucket in buckets) for slot in slots)
+                estimates.append((estimate, key))
+            best = sorted(estimates, key=lambda item: (-item[0], item[1]))[:min(limit, self.top_k)]
+            chart = {
+                'since': self._oldest_start(window, now),
+                'total': total,
+                'max_overcount': math.ceil(self.epsilon * total),
+                'items': [(key, estimate) for estimate, key in best]
+            }
+            self._cache[cache_key] = (time.monotonic() + self.cache_ttl, chart)
+        return chart
+
+    def start_checkpoints(self, connect):
+        """
+        Checkpoint every `checkpoint_interval` seconds on a background thread
+        (started once; later calls do nothing).
+
+        Args:
+            connect (callable): Returns a write connection (closed afterwards)
+        """
+        with self._lock:
+            if self._checkpointer is not None:
+                return
+            self._checkpointer = threading.Thread(target=self._checkpoint_loop, args=(connect,),
+                                                  name='chart-checkpoints', daemon=True)
+            self._checkpointer.start()
+
+    def _checkpoint_loop(self, connect):
+        while True:
+            time.sleep(self.checkpoint_interval)
+            self.checkpoint(connect)
+
+    def checkpoint(self, connect, force=False):
+        """
+        Save the buckets changed since the last checkpoint to ChartSketches.
+
+        Does nothing until `checkpoint_interval` seconds have passed since the
+        last one, unless forced.
+
+        Args:
+            connect (callable): Returns a write connection (closed afterwards)
+            force (bool): Checkpoint now, however recent the last one is
+        """
+        if not self._loaded:
+            return
+        if not force and time.monotonic() - self._checkpointed_at < self.checkpoint_interval:
+            return
+        with self._lock:
+            self._checkpointed_at = time.monotonic()
+            now = time.time()
+            self._expire(now)
+            rows = []
+            for window, kind, start in self._dirty:
+                bucket = self._buckets[(window, kind)][start]
+                rows.append((window, kind, start, self.width, self.depth, _HASH_VERSION, bucket.total,
+                             bucket.sketch.counters.tobytes(), json.dumps(bucket.top)))
+            dirty, self._dirty = self._dirty, set()
+            oldest = {window: self._oldest_start(window, now) for window in CHART_WINDOWS}
+        try:
+            connection = connect()
+            try:
+                with connection:
+                    for window, start in oldest.items():
+                        connection.execute("DELETE FROM ChartSketches WHERE window_name = ? AND bucket_start < ?",
+                                           (window, start))
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO ChartSketches (window_name, kind, bucket_start, width, depth, "
+                        "hash_version, total, counters, top_keys) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            finally:
+                connection.close()
+        except Exception:
+            # Try these buckets again next time
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        with self._lock:
+            self._checkpoints += 1
+
+    def stats(self):
+        """Return the size of the sketches and when they were last saved"""
+        with self._lock:
+            buckets = sum(len(buckets) for buckets in self._buckets.values())
+            return {
+                'buckets': buckets,
+                'bytes': buckets * self.width * self.depth * 4,
+                'epsilon': round(self.epsilon, 6),
+                'delta': round(self.delta, 6),
+                'songs_with_groups': sum(1 for groups in self._song_groups.values() if groups),
+                'unsaved_buckets': len(self._dirty),
+                'checkpoints': self._checkpoints,
+                'checkpointed_seconds_ago': round(time.monotonic() - self._checkpointed_at, 1)
+            }
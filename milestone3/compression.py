@@ -0,0 +1,215 @@
+import zlib
+
+from media import DerivedMediaCache
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; without it only gzip and deflate are offered
+    brotli = None
+
+# Content types worth compressing (besides text/*). JPEG, PNG, MP3 and the
+# like are compressed already and only cost CPU to compress again.
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+    'image/bmp',
+    'audio/wav',
+}
+
+
+def is_compressible(mimetype):
+    """Return True if a response of this content type is worth compressing"""
+    if not mimetype:
+        return False
+    return (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES
+            or mimetype.endswith('+json') or mimetype.endswith('+xml'))
+
+
+class _ZlibEncoder:
+    def __init__(self, wbits, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def new_encoder(encoding, level=6, brotli_quality=5):
+    """
+    Create an incremental encoder for a Content-Encoding.
+
+    Args:
+        encoding (str): 'gzip', 'deflate' or 'br'
+        level (int): zlib compression level (1-9) for gzip and deflate
+        brotli_quality (int): Brotli quality (0-11)
+
+    Returns:
+        An object with compress(data), flush() and finish() methods, each
+        returning the compressed bytes produced so far
+    """
+    if encoding == 'gzip':
+        return _ZlibEncoder(16 + zlib.MAX_WBITS, level)
+    if encoding == 'deflate':
+        # HTTP "deflate" is the zlib format, not a raw deflate stream
+        return _ZlibEncoder(zlib.MAX_WBITS, level)
+    if encoding == 'br' and brotli is not None:
+        return _BrotliEncoder(brotli_quality)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def compress_bytes(data, encoding, level=6, brotli_quality=5):
+    """Compress a complete payload in one go"""
+    encoder = new_encoder(encoding, level, brotli_quality)
+    return encoder.compress(data) + encoder.finish()
+
+
+def compress_chunks(chunks, encoding, level=6, brotli_quality=5):
+    """
+    Compress a streamed body chunk by chunk.
+
+    Every chunk is flushed, so the client gets each part as soon as it is
+    produced instead of when the compressor's window fills up. Closing the
+    generator closes `chunks`, so a streamed query still releases its connection.
+    """
+    encoder = new_encoder(encoding, level, brotli_quality)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                data = encoder.compress(chunk) + encoder.flush()
+                if data:
+                    yield data
+        yield encoder.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+class ResponseCompressor:
+    """
+    Content-Encoding negotiation for Flask responses.
+
+    Used as an after_request hook: picks the best encoding the client accepts
+    (brotli if installed, then gzip, then deflate), compresses buffered bodies
+    of at least `min_size` bytes and compresses streamed bodies incrementally.
+    Responses that are already encoded, partial (206), sent from a file, or of
+    a content type that doesn't compress are left alone.
+
+    Args:
+        min_size (int): Smallest buffered body worth compressing (bytes)
+        level (int): zlib compression level for gzip and deflate
+        brotli_quality (int): Brotli quality
+    """
+    def __init__(self, min_size=1024, level=6, brotli_quality=5):
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.encodings = (['br'] if brotli is not None else []) + ['gzip', 'deflate']
+
+    def choose(self, accept_encodings):
+        """
+        Pick the encoding for a request.
+
+        Args:
+            accept_encodings (werkzeug.datastructures.Accept): request.accept_encodings
+
+        Returns:
+            str: The best encoding both sides support, or None for identity
+        """
+        return accept_encodings.best_match(self.encodings)
+
+    def __call__(self, request, response):
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+        if 'Content-Encoding' in response.headers or not is_compressible(response.mimetype):
+            return response
+        if 'no-transform' in response.headers.get('Cache-Control', ''):
+            return response
+        # Caches must keep compressed and uncompressed copies apart
+        response.vary.add('Accept-Encoding')
+        if response.direct_passthrough:
+            return response
+        encoding = self.choose(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_chunks(response.response, encoding,
+                                                self.level, self.brotli_quality)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            compressed = compress_bytes(data, encoding, self.level, self.brotli_quality)
+            if len(compressed) >= len(data):
+                return response
+            response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+
+        # The compressed body is a different byte sequence, so a strong ETag of
+        # the uncompressed one only holds as a weak validator now
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+class PrecompressedCache(DerivedMediaCache):
+    """
+    Compressed copies of media store files, made once and served with
+    send_file like the originals. Payloads that don't get smaller are
+    remembered as not worth compressing.
+
+    Args:
+        root (str): Directory the compressed copies live under
+        level (int): zlib level (defaults to the smallest output, it's only paid once)
+        brotli_quality (int): Brotli quality
+    """
+    def __init__(self, root, level=9, brotli_quality=11):
+        super().__init__(root)
+        self.level = level
+        self.brotli_quality = brotli_quality
+
+    def path(self, key, encoding, load):
+        """
+        Return the path of the compressed copy of a payload, making it if needed.
+
+        Args:
+            key (str): Content hash identifying the payload
+            encoding (str): Content-Encoding of the copy
+            load (callable): Returns the uncompressed payload, only called on a miss
+
+        Returns:
+            str: Path of the compressed file, or None if compressing doesn't pay off
+        """
+        def derive():
+            data = load()
+            compressed = compress_bytes(data, encoding, self.level, self.brotli_quality)
+            return compressed if len(compressed) < len(data) else None
+        return super().path(key, encoding, derive)
@@ -0,0 +1,39 @@
+import pytest
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The API running against an empty database and media directories under tmp_path"""
+    import api
+
+    database = str(tmp_path / 'supertify.db')
+    monkeypatch.setattr(api, 'DATABASE', database)
+    for pool in (api.db_reader, api.db_writer):
+        pool.close_all()
+        monkeypatch.setattr(pool, 'database', database)
+    for name, cache in (('media', api.media_store), ('media_cache', api.media_cache),
+                        ('thumbnails', api.thumbnail_cache)):
+        monkeypatch.setattr(cache, 'root', str(tmp_path / name))
+    # Plays counted by a test must not be checkpointed into another database,
+    # so its charts never checkpoint in the background either
+    monkeypatch.setattr(api, 'trending_charts', api.TrendingCharts(
+        width=api.CHART_SKETCH_WIDTH, depth=api.CHART_SKETCH_DEPTH, top_k=api.CHART_TOP_K,
+        checkpoint_interval=24 * 60 * 60))
+    api.prepare_database(with_dummy_data=False)
+    yield api
+    # Write out queued plays while the pools still point at this test's database
+    api.history_ingestor.close()
+    for pool in (api.db_reader, api.db_writer):
+        pool.close_all()
+
+
+@pytest.fixture
+def client(app):
+    """Test client sending a valid JWT with every request"""
+    from flask_jwt_extended import create_access_token
+
+    with app.app.app_context():
+        token = create_access_token(identity='tester')
+    client = app.app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client
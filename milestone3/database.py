@@ -0,0 +1,383 @@
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+from queue import LifoQueue, Empty
+
+# Error messages SQLite uses for transient lock contention
+BUSY_MESSAGES = ('database is locked', 'database is busy', 'database table is locked')
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes available in time."""
+
+
+def is_busy_error(error):
+    """Return True if `error` is a transient SQLITE_BUSY/SQLITE_LOCKED failure worth retrying"""
+    if not isinstance(error, sqlite3.OperationalError) or isinstance(error, PoolTimeout):
+        return False
+    message = str(error).lower()
+    return any(busy in message for busy in BUSY_MESSAGES)
+
+
+class BusyRetry:
+    """
+    Retries a callable when SQLite reports the database as busy or locked.
+
+    busy_timeout already makes SQLite wait for a lock, but some conflicts
+    (e.g. a WAL reader trying to upgrade to a writer) fail immediately and
+    other processes can hold the lock longer than the timeout. This layer
+    retries those with full-jitter exponential backoff until `deadline`
+    seconds have passed, and only then lets the error through. Time spent
+    inside a failed attempt (including SQLite's own busy_timeout wait) counts
+    against the deadline, so keep busy_timeout short compared to it.
+
+    Only wrap work that is safe to run twice, i.e. one whole transaction.
+    Can be used directly (`busy_retry.call(fn, ...)`) or as a decorator.
+
+    Args:
+        deadline (float): Total time budget (seconds) for all attempts
+        base_delay (float): Backoff before the first retry (seconds)
+        max_delay (float): Upper bound for a single backoff (seconds)
+        on_retry (callable): Called with no arguments before every retry,
+            e.g. to roll back and release connections the failed attempt held
+    """
+    def __init__(self, deadline=5.0, base_delay=0.01, max_delay=0.5, on_retry=None):
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_retry = on_retry
+        self._lock = threading.Lock()
+        self._retries = 0
+        self._recovered = 0
+        self._gave_up = 0
+
+    def call(self, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs), retrying transient busy errors until the deadline"""
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                result = fn(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e):
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                if time.monotonic() + delay >= deadline:
+                    with self._lock:
+                        self._gave_up += 1
+                    raise
+                with self._lock:
+                    self._retries += 1
+                if self.on_retry is not None:
+                    self.on_retry()
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if attempt:
+                with self._lock:
+                    self._recovered += 1
+            return result
+
+    def __call__(self, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self.call(fn, *args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        """Return retry counters: retries made, calls that recovered, calls that gave up"""
+        with self._lock:
+            return {
+                'retries': self._retries,
+                'recovered': self._recovered,
+                'gave_up': self._gave_up,
+                'deadline_s': self.deadline
+            }
+
+
+class RetryingCursor(sqlite3.Cursor):
+    """
+    Cursor that retries busy errors of statements that start a transaction.
+
+    A statement run while no transaction is open is either a transaction of
+    its own (autocommit reads) or the first write of a new one, so nothing
+    has happened yet that a retry could repeat. Statements inside an open
+    transaction are never retried; their busy errors propagate to the caller.
+    """
+    def _retry(self):
+        if self.connection.in_transaction:
+            return None
+        return getattr(self.connection, '_retry', None)
+
+    def _first_statement(self, execute, sql, parameters):
+        try:
+            return execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            # The implicit BEGIN may have gone through before the write
+            # failed; roll it back so the next attempt starts clean
+            if is_busy_error(e) and self.connection.in_transaction:
+                self.connection.rollback()
+            raise
+
+    def execute(self, sql, parameters=()):
+        retry = self._retry()
+        if retry is None:
+            return super().execute(sql, parameters)
+        return retry.call(self._first_statement, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        retry = self._retry()
+        if retry is None:
+            return super().executemany(sql, seq_of_parameters)
+        # A generator can only be consumed once
+        seq_of_parameters = list(seq_of_parameters)
+        return retry.call(self._first_statement, super().executemany, sql, seq_of_parameters)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    A sqlite3 connection that belongs to a ConnectionPool.
+
+    Calling close() hands the connection back to its pool instead of closing
+    it, so existing code that does `connection.close()` keeps working unchanged.
+    Statements go through RetryingCursor, so the pool's busy retry policy
+    applies to every statement that opens a transaction.
+    """
+    def cursor(self, factory=RetryingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        pool = getattr(self, '_pool', None)
+        if pool is None:
+            super().close()
+        else:
+            pool.release(self)
+
+    def _really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    """
+    A small thread-safe pool of SQLite connections.
+
+    Connections are created lazily up to `size`, reused most-recently-used
+    first so the page cache stays warm, and pinned to the borrowing thread
+    while it holds them: borrowing again from the same thread returns the
+    same connection (reference counted) until the last borrow is released.
+
+    A pool of size 1 doubles as the single serialized writer: every borrower
+    queues for the one connection, and the wait is recorded in stats().
+
+    Args:
+        database (str): Path to the SQLite database file
+        size (int): Maximum number of open connections
+        timeout (float): SQLite busy timeout for each connection, in seconds
+        health_check_interval (float): Connections idle for longer than this
+            many seconds are pinged with `SELECT 1` before being handed out
+        pragmas (dict): PRAGMA name -> value pairs applied to every new connection
+        retry (BusyRetry): Optional retry policy for busy errors of statements
+            that open a transaction (see RetryingCursor)
+    """
+    def __init__(self, database, size=8, timeout=30.0, health_check_interval=30.0, pragmas=None,
+                 retry=None):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pragmas = pragmas or {}
+        self.retry = retry
+        self._idle = LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Contention metrics
+        self._waiting = 0
+        self._acquired = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _connect(self):
+        """Open a brand new pooled connection"""
+        connection = sqlite3.connect(self.database, timeout=self.timeout,
+                                     check_same_thread=False, factory=PooledConnection)
+        connection.row_factory = sqlite3.Row
+        try:
+            for name, value in self.pragmas.items():
+                connection.execute(f"PRAGMA {name} = {value}")
+        except sqlite3.Error:
+            connection._really_close()
+            raise
+        connection._pool = self
+        connection._retry = self.retry
+        connection._last_used = time.monotonic()
+        connection._checked_out = False
+        return connection
+
+    def _is_healthy(self, connection):
+        """Ping connections that sat idle for a while; fresh ones are trusted"""
+        if time.monotonic() - connection._last_used < self.health_check_interval:
+            return True
+        try:
+            connection.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, connection):
+        """Close a connection for good and free up its slot"""
+        try:
+            connection._really_close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self, timeout=30.0):
+        """
+        Borrow a connection from the pool.
+
+        Args:
+            timeout (float): How long to wait for a free connection when the
+                pool is exhausted
+
+        Returns:
+            PooledConnection: A connection with row_factory set to sqlite3.Row
+
+        Raises:
+            PoolTimeout: If no connection became available within `timeout`
+        """
+        held = getattr(self._local, 'connection', None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._lock:
+            self._waiting += 1
+        try:
+            connection = self._checkout(deadline)
+        finally:
+            waited = time.monotonic() - started
+            with self._lock:
+                self._waiting -= 1
+                self._acquired += 1
+                self._total_wait += waited
+                self._max_wait = max(self._max_wait, waited)
+
+        connection._checked_out = True
+        self._local.connection = connection
+        self._local.depth = 1
+        return connection
+
+    def _checkout(self, deadline):
+        """Take an idle connection, open a new one, or wait until `deadline`"""
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except Empty:
+                connection = None
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        connection = self._connect()
+                    except sqlite3.Error:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout("Timed out waiting for a database connection")
+                    try:
+                        connection = self._idle.get(timeout=remaining)
+                    except Empty:
+                        raise PoolTimeout("Timed out waiting for a database connection")
+
+            if self._is_healthy(connection):
+                return connection
+            self._discard(connection)
+
+    def release(self, connection):
+        """
+        Return a borrowed connection to the pool.
+
+        Any transaction the caller left open is rolled back so the next
+        borrower always starts from a clean state. Releasing a connection
+        that is already back in the pool is a no-op.
+        """
+        if not connection._checked_out:
+            return
+        if getattr(self._local, 'connection', None) is connection:
+            self._local.depth -= 1
+            if self._local.depth > 0:
+                return
+            self._local.connection = None
+
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error:
+            connection._checked_out = False
+            self._discard(connection)
+            return
+        connection._checked_out = False
+        connection._last_used = time.monotonic()
+        self._idle.put(connection)
+
+    def release_thread(self):
+        """
+        Return whatever the current thread still holds, no matter how many
+        times it was borrowed. Used at the end of a request so a handler that
+        forgot to close its connection cannot leak a pool slot.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            self._local.depth = 1
+            self.release(connection)
+
+    def close_all(self):
+        """Close every idle connection (used on shutdown and in maintenance scripts)"""
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(connection)
+
+    def stats(self):
+        """
+        Return a snapshot of pool usage and contention.
+
+        `waiting` is the current queue depth (threads blocked in acquire()),
+        and the wait times are measured from asking for a connection to getting one.
+        """
+        with self._lock:
+            created = self._created
+            waiting = self._waiting
+            acquired = self._acquired
+            total_wait = self._total_wait
+            max_wait = self._max_wait
+        idle = self._idle.qsize()
+        return {
+            'size': self.size,
+            'open': created,
+            'idle': idle,
+            'in_use': created - idle,
+            'waiting': waiting,
+            'acquired': acquired,
+            'avg_wait_ms': round(total_wait / acquired * 1000, 3) if acquired else 0.0,
+            'max_wait_ms': round(max_wait * 1000, 3)
+        }
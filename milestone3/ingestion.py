@@ -0,0 +1,240 @@
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from queue import Queue, Empty, Full
+
+
+class IngestBufferFull(Exception):
+    """Raised when the play buffer stays full for longer than the enqueue timeout."""
+
+
+class IngestTimeout(Exception):
+    """Raised when a 'sync' play's batch hasn't committed within the commit timeout."""
+
+
+class PlayEvent:
+    """A single listening session waiting to be written to History"""
+    __slots__ = ('user_id', 'start_time', 'duration', 'song_id', 'done', 'error')
+
+    def __init__(self, user_id, start_time, duration, song_id):
+        self.user_id = user_id
+        self.start_time = start_time
+        self.duration = duration
+        self.song_id = song_id
+        self.done = threading.Event()
+        self.error = None
+
+    def params(self):
+        return (self.user_id, self.start_time, self.duration, self.song_id)
+
+
+def current_timestamp():
+    """Same format and timezone (UTC) as SQLite's CURRENT_TIMESTAMP"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class HistoryIngestor:
+    """
+    Group-commit ingestion for listening History.
+
+    Play events are put on a bounded buffer and a background thread writes
+    them in batches: a batch is flushed when it reaches `batch_size` events or
+    when `flush_interval` seconds have passed since its first event, so many
+    plays share one transaction (and one fsync) on the writer connection.
+
+    Args:
+        writer (ConnectionPool): Pool the flusher borrows its write connection from
+        batch_size (int): Maximum number of events written per transaction
+        flush_interval (float): Maximum time (seconds) an event waits for its batch
+        max_buffer (int): Number of events that may be queued before submit() blocks
+        enqueue_timeout (float): How long submit() waits for room in a full buffer
+            before raising IngestBufferFull (back-pressure)
+        commit_timeout (float): How long a 'sync' submit() waits for the event's
+            batch to commit before raising IngestTimeout
+        durability (str): 'sync' makes submit() wait until the event's batch has
+            committed; 'async' returns as soon as the event is buffered, trading
+            up to one batch of plays on a crash for lower latency
+        retry (BusyRetry): Optional retry policy for batches that hit a busy database
+        logger (logging.Logger): Where failing listeners and batches are reported
+    """
+    INSERT_SQL = 'INSERT INTO History (user_id, start_time, duration, song_id) VALUES (?, ?, ?, ?)'
+
+    def __init__(self, writer, batch_size=500, flush_interval=0.05, max_buffer=10000,
+                 enqueue_timeout=1.0, commit_timeout=10.0, durability='sync', retry=None,
+                 logger=None):
+        if durability not in ('sync', 'async'):
+            raise ValueError("durability must be 'sync' or 'async'")
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.commit_timeout = commit_timeout
+        self.durability = durability
+        self.retry = retry
+        self.logger = logger or logging.getLogger(__name__)
+        self._buffer = Queue(maxsize=max_buffer)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._listeners = []
+        # Metrics
+        self._batches = 0
+        self._written = 0
+        self._failed = 0
+        self._rejected = 0
+        self._last_flush_ms = 0.0
+
+    def start(self):
+        """Start the background flusher if it isn't running yet"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name='history-ingestor', daemon=True)
+                self._thread.start()
+
+    def add_listener(self, callback):
+        """
+        Register a callback called with the list of PlayEvents of every batch
+        right after it commits (only events that were actually written).
+        """
+        self._listeners.append(callback)
+
+    def submit(self, user_id, duration, song_id, start_time=None):
+        """
+        Queue a play event for the next batch.
+
+        Args:
+            user_id (str): The listening user
+            duration (int): Listening time in seconds
+            song_id (str): The song that was played
+            start_time (str): When the session started; defaults to now (UTC)
+
+        Returns:
+            PlayEvent: The queued event. In 'sync' mode it has already been
+                written (or carries the error that prevented it).
+
+        Raises:
+            IngestBufferFull: If the buffer stayed full for `enqueue_timeout` seconds
+            IngestTimeout: If a 'sync' event wasn't written within `commit_timeout`
+                seconds; it stays queued and may still be written later
+        """
+        self.start()
+        event = PlayEvent(user_id, start_time or current_timestamp(), duration, song_id)
+        try:
+            self._buffer.put(event, timeout=self.enqueue_timeout)
+        except Full:
+            with self._lock:
+                self._rejected += 1
+            raise IngestBufferFull("Listening history buffer is full, please try again")
+        if self.durability == 'sync' and not event.done.wait(self.commit_timeout):
+            raise IngestTimeout("Timed out waiting for the listening history to be written")
+        return event
+
+    def _run(self):
+        while not self._stopping or not self._buffer.empty():
+            try:
+                first = self._buffer.get(timeout=0.5)
+            except Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                # Don't hold a batch back for stragglers once close() was called
+                if remaining <= 0 or self._stopping:
+                    break
+                try:
+                    batch.append(self._buffer.get(timeout=min(remaining, 0.5)))
+                except Empty:
+                    break
+            self._flush(batch)
+
+    def _write_batch(self, connection, batch):
+        """
+        Write one batch in a single transaction, isolating rows that fail.
+
+        Returns:
+            list: The events that were written
+        """
+        try:
+            try:
+                connection.executemany(self.INSERT_SQL, [event.params() for event in batch])
+                connection.commit()
+                return batch
+            except sqlite3.IntegrityError:
+                # One bad row (e.g. a duplicate user/start_time) must not sink
+                # the whole batch: retry row by row in one transaction instead
+                connection.rollback()
+                written = []
+                for event in batch:
+                    try:
+                        connection.execute(self.INSERT_SQL, event.params())
+                        event.error = None
+                        written.append(event)
+                    except sqlite3.IntegrityError as e:
+                        event.error = e
+                connection.commit()
+                return written
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+
+    def _flush(self, batch):
+        """Write a batch on the writer connection and wake up everyone waiting on it"""
+        started = time.monotonic()
+        written = []
+        try:
+            connection = self.writer.acquire()
+            try:
+                if self.retry is not None:
+                    written = self.retry.call(self._write_batch, connection, batch)
+                else:
+                    written = self._write_batch(connection, batch)
+            finally:
+                connection.close()
+        except Exception as e:
+            # Whatever went wrong, the waiting requests must be woken up and
+            # the flusher thread must keep running for the next batch
+            if not isinstance(e, sqlite3.Error):
+                self.logger.exception("Writing a batch of %d plays failed", len(batch))
+            written = []
+            for event in batch:
+                event.error = e
+
+        with self._lock:
+            self._batches += 1
+            self._written += len(written)
+            self._failed += len(batch) - len(written)
+            self._last_flush_ms = round((time.monotonic() - started) * 1000, 3)
+        for event in batch:
+            event.done.set()
+        if written:
+            for callback in self._listeners:
+                try:
+                    callback(written)
+                except Exception:
+                    self.logger.exception("History ingest listener failed")
+
+    def close(self, timeout=5.0):
+        """Flush everything still buffered and stop the flusher"""
+        self._stopping = True
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Return a snapshot of buffer depth and batching metrics"""
+        with self._lock:
+            batches = self._batches
+            return {
+                'durability': self.durability,
+                'buffered': self._buffer.qsize(),
+                'max_buffer': self._buffer.maxsize,
+                'batches': batches,
+                'written': self._written,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'avg_batch_size': round(self._written / batches, 2) if batches else 0.0,
+                'last_flush_ms': self._last_flush_ms
+            }
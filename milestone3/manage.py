@@ -0,0 +1,157 @@
+"""
+Management commands for the SUPERTIFY database.
+
+Run these once before starting the API workers so that no worker has to
+create tables or migrate data while serving live traffic:
+
+    python manage.py setup                   # create tables, migrate, load sample data
+    python manage.py setup --no-dummy-data   # same, without the sample data
+    python manage.py setup --force           # redo every step even if the schema is current
+    python manage.py check-schema            # full (slow) schema and row count report
+    python manage.py migrate                 # apply pending versioned migrations only
+    python manage.py migrate --list          # show applied and pending migrations
+    python manage.py externalize-media       # move inline images/audio into the media store
+    python manage.py gc-media                # delete stored media no row refers to
+    python manage.py rebuild-search          # rebuild the full-text search indexes (after VACUUM)
+    python manage.py rebuild-stats           # recompute the trigger-maintained listening totals
+
+`migrate` can run while the API is serving: large copies are done in small
+batches (--batch-size rows per transaction, --pause seconds between them).
+`externalize-media` works the same way and can be stopped and rerun at any time.
+"""
+import argparse
+import sqlite3
+
+from api import (prepare_database, check_db_schema, migration_runner, media_store, media_cache,
+                 thumbnail_cache, DATABASE, MEDIA_COLUMNS, SEARCH_INDEXES, STATS_TABLES)
+from media import externalize_column, collect_garbage, MEDIA_REF_PREFIX
+
+
+def setup(args):
+    """Create the schema, run migrations and (optionally) insert the sample data"""
+    prepare_database(with_dummy_data=not args.no_dummy_data, force=args.force)
+    print("Database is ready - API workers can be started now.")
+
+
+def check_schema(args):
+    """Print every table's columns, foreign keys and row count (scans every table)"""
+    check_db_schema()
+
+
+def migrate(args):
+    """Apply (or list) the versioned migrations"""
+    runner = migration_runner(batch_size=args.batch_size, pause=args.pause)
+    if args.list:
+        applied = runner.applied_versions()
+        for migration in runner.migrations:
+            if migration.version in applied:
+                print(f"  [x] {migration.version:4d} {migration.name} (applied {applied[migration.version][1]})")
+            else:
+                print(f"  [ ] {migration.version:4d} {migration.name}")
+        return
+    done = runner.run()
+    print(f"Applied {len(done)} migration(s).")
+
+
+def externalize_media(args):
+    """Move media stored inline in rows into the media store, leaving references behind"""
+    connection = sqlite3.connect(DATABASE, timeout=30.0)
+    try:
+        for table, (_, columns) in MEDIA_COLUMNS.items():
+            for column in columns:
+                moved, skipped = externalize_column(connection, media_store, table, column, args.batch_size)
+                print(f"{table}.{column}: moved {moved}, skipped {skipped} undecodable value(s)")
+    finally:
+        connection.close()
+
+
+def gc_media(args):
+    """Delete media files that are no longer referenced by any row, and their cached copies"""
+    connection = sqlite3.connect(DATABASE, timeout=30.0)
+    try:
+        columns = {table: table_columns for table, (_, table_columns) in MEDIA_COLUMNS.items()}
+        deleted, freed = collect_garbage(connection, media_store, columns, min_age=args.min_age)
+        print(f"Deleted {deleted} unreferenced media file(s), freed {freed} bytes.")
+        is_live = lambda key: media_store.exists(MEDIA_REF_PREFIX + key)
+        pruned = media_cache.prune(is_live) + thumbnail_cache.prune(is_live)
+        print(f"Deleted {pruned} cached compressed file(s) and thumbnail(s) of removed media.")
+    finally:
+        connection.close()
+
+
+def rebuild_search(args):
+    """Rebuild the full-text search indexes from their tables"""
+    connection = sqlite3.connect(DATABASE, timeout=30.0)
+    try:
+        for index, steps in SEARCH_INDEXES.items():
+            # One transaction per index, so searches never see it half rebuilt
+            with connection:
+                for sql in steps:
+                    connection.execute(sql)
+            print(f"Rebuilt {index}.")
+    finally:
+        connection.close()
+
+
+def rebuild_stats(args):
+    """Recompute the running totals kept by triggers from their source tables"""
+    connection = sqlite3.connect(DATABASE, timeout=30.0)
+    try:
+        for tables, steps in STATS_TABLES.items():
+            # One transaction each, so readers never see half recomputed totals
+            with connection:
+                for sql in steps:
+                    connection.execute(sql)
+            print(f"Rebuilt {tables}.")
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SUPERTIFY database management")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    setup_parser = commands.add_parser('setup', help="Prepare the database before starting the API")
+    setup_parser.add_argument('--no-dummy-data', action='store_true',
+                              help="Skip inserting the sample data set")
+    setup_parser.add_argument('--force', action='store_true',
+                              help="Run every step even if the schema fingerprint matches")
+    setup_parser.set_defaults(func=setup)
+
+    check_parser = commands.add_parser('check-schema',
+                                       help="Print a full schema and row count report (slow on big databases)")
+    check_parser.set_defaults(func=check_schema)
+
+    migrate_parser = commands.add_parser('migrate', help="Apply pending versioned migrations")
+    migrate_parser.add_argument('--list', action='store_true', help="Only list applied and pending migrations")
+    migrate_parser.add_argument('--batch-size', type=int, default=None,
+                                help="Rows copied per transaction by chunked steps")
+    migrate_parser.add_argument('--pause', type=float, default=None,
+                                help="Seconds to wait between batches")
+    migrate_parser.set_defaults(func=migrate)
+
+    externalize_parser = commands.add_parser('externalize-media',
+                                             help="Move inline images/audio into the media store")
+    externalize_parser.add_argument('--batch-size', type=int, default=500,
+                                    help="Rows rewritten per transaction")
+    externalize_parser.set_defaults(func=externalize_media)
+
+    gc_parser = commands.add_parser('gc-media', help="Delete media files no row refers to any more")
+    gc_parser.add_argument('--min-age', type=float, default=3600,
+                           help="Keep files younger than this many seconds (uploads still in flight)")
+    gc_parser.set_defaults(func=gc_media)
+
+    search_parser = commands.add_parser('rebuild-search',
+                                        help="Rebuild the full-text search indexes (run after VACUUM)")
+    search_parser.set_defaults(func=rebuild_search)
+
+    stats_parser = commands.add_parser('rebuild-stats',
+                                       help="Recompute the listening totals kept up to date by triggers")
+    stats_parser.set_defaults(func=rebuild_stats)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
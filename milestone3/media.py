@@ -0,0 +1,450 @@
+import base64
+import binascii
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+
+# Leading bytes of the media formats we expect to store, used to pick a Content-Type
+MEDIA_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'ID3', 'audio/mpeg'),
+    (b'\xff\xfb', 'audio/mpeg'),
+    (b'\xff\xf3', 'audio/mpeg'),
+    (b'\xff\xf2', 'audio/mpeg'),
+    (b'OggS', 'audio/ogg'),
+    (b'fLaC', 'audio/flac'),
+    (b'<svg', 'image/svg+xml'),
+    (b'BM', 'image/bmp'),
+]
+
+
+def decode_media(value):
+    """
+    Turn a stored media value into raw bytes.
+
+    Media columns hold either raw BLOBs or base64 text (optionally as a
+    `data:<type>;base64,` URI), depending on how the client uploaded them.
+
+    Raises:
+        ValueError: If a text value is not valid base64
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    text = value.strip()
+    if text.startswith('data:') and ',' in text:
+        text = text.split(',', 1)[1]
+    try:
+        return base64.b64decode(text, validate=True)
+    except binascii.Error:
+        raise ValueError("Stored media is not valid base64")
+
+
+def guess_mimetype(data, default='application/octet-stream'):
+    """Guess the Content-Type of media bytes from their signature"""
+    for signature, mimetype in MEDIA_SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        return 'audio/wav'
+    return default
+
+
+# Media columns hold 'sha256:<hex digest>' references to files in the media store
+MEDIA_REF_PREFIX = 'sha256:'
+
+
+def write_file_atomic(path, data):
+    """Write `data` to a temporary file next to `path` and rename it into place"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def is_media_ref(value):
+    """Return True if a stored media value is a media store reference"""
+    if not isinstance(value, str) or not value.startswith(MEDIA_REF_PREFIX):
+        return False
+    digest = value[len(MEDIA_REF_PREFIX):]
+    return len(digest) == 64 and all(c in '0123456789abcdef' for c in digest)
+
+
+# Image columns of every table: table -> image column. Each has a
+# <column>_digest column next to it holding the SHA-256 of the image, so image
+# URLs and revalidations never read the image itself.
+IMAGE_COLUMNS = {
+    'User': 'user_image',
+    'Playlist': 'playlist_image',
+    'Song': 'song_image',
+    'Album': 'album_image',
+    'MusicGroup': 'group_image',
+}
+
+
+def ref_digest_sql(value):
+    """SQL expression giving the digest of a media store reference, NULL for any other value"""
+    return (f"CASE WHEN {value} LIKE '{MEDIA_REF_PREFIX}%' AND length({value}) = {len(MEDIA_REF_PREFIX) + 64} "
+            f"THEN substr({value}, {len(MEDIA_REF_PREFIX) + 1}) END")
+
+
+def image_digest_triggers():
+    """
+    Return the triggers setting every <image>_digest column from its image
+    column: the digest of a media store reference, or NULL for an image still
+    stored inline (send_image() moves those to the store when first asked for).
+    """
+    triggers = []
+    for table, column in IMAGE_COLUMNS.items():
+        digest = f"""UPDATE {table} SET {column}_digest = {ref_digest_sql(f'NEW.{column}')}
+                WHERE rowid = NEW.rowid;"""
+        triggers += [
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{table.lower()}_image_digest_insert AFTER INSERT ON {table}
+            FOR EACH ROW WHEN NEW.{column} IS NOT NULL
+            BEGIN
+                {digest}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{table.lower()}_image_digest_update AFTER UPDATE OF {column} ON {table}
+            FOR EACH ROW WHEN NEW.{column} IS NOT OLD.{column}
+            BEGIN
+                {digest}
+            END""",
+        ]
+    return triggers
+
+
+class FileSystemMediaStore:
+    """
+    Content-addressed media files on the local filesystem.
+
+    Every file is named by the SHA-256 of its content (fanned out over two
+    directory levels), so storing the same image or audio twice keeps a single
+    copy, and a reference never goes stale because content never changes in place.
+    Files are written to a temporary name and renamed, so readers never see
+    a half-written file.
+
+    Any object with the same methods (put, path, read, exists, delete, refs)
+    can be used instead, e.g. one backed by object storage.
+
+    Args:
+        root (str): Directory the media files live under
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, ref):
+        if not is_media_ref(ref):
+            raise ValueError(f"Not a media reference: {ref!r}")
+        digest = ref[len(MEDIA_REF_PREFIX):]
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, data):
+        """
+        Store media bytes (if not stored already).
+
+        Returns:
+            str: The reference to keep in the database row
+        """
+        ref = MEDIA_REF_PREFIX + hashlib.sha256(data).hexdigest()
+        path = self._path(ref)
+        if not os.path.exists(path):
+            write_file_atomic(path, data)
+        return ref
+
+    def path(self, ref):
+        """
+        Return the file path of a stored reference (for send_file).
+
+        Raises:
+            FileNotFoundError: If the media is not in the store
+        """
+        path = self._path(ref)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return path
+
+    def read(self, ref):
+        """Return the content of a stored reference through a read-only memory map"""
+        with open(self.path(ref), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:]
+
+    def exists(self, ref):
+        return is_media_ref(ref) and os.path.exists(self._path(ref))
+
+    def delete(self, ref):
+        try:
+            os.unlink(self._path(ref))
+        except FileNotFoundError:
+            pass
+
+    def refs(self, min_age=0):
+        """
+        Yield (reference, size) for every stored file.
+
+        Args:
+            min_age (float): Skip files modified less than this many seconds ago
+        """
+        now = time.time()
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                ref = MEDIA_REF_PREFIX + name
+                if not is_media_ref(ref):
+                    continue
+                stat = os.stat(os.path.join(directory, name))
+                if now - stat.st_mtime >= min_age:
+                    yield ref, stat.st_size
+
+
+class DerivedMediaCache:
+    """
+    Files derived from stored media (compressed copies, thumbnails, ...), made
+    once and kept on disk.
+
+    Entries are keyed by the SHA-256 of the original content plus a variant
+    name, so they can never go stale: new content has a new key. A derivation
+    that isn't worth keeping (returns None) is remembered with an empty
+    marker file, so it isn't attempted again on every request.
+
+    Args:
+        root (str): Directory the derived files live under
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key, variant):
+        return os.path.join(self.root, key[:2], f"{key}.{variant}")
+
+    def path(self, key, variant, derive):
+        """
+        Return the path of a derived file, making it if needed.
+
+        Args:
+            key (str): SHA-256 hex digest of the original content
+            variant (str): Name of the derivation (e.g. 'gzip', '128')
+            derive (callable): Returns the derived bytes or None; only called on a miss
+
+        Returns:
+            str: Path of the derived file, or None if there is nothing worth serving
+        """
+        path = self._path(key, variant)
+        if not os.path.exists(path):
+            write_file_atomic(path, derive() or b'')
+        return path if os.path.getsize(path) > 0 else None
+
+    def prune(self, is_live):
+        """
+        Delete the derived files of originals that no longer exist.
+
+        Args:
+            is_live (callable): Takes a key, returns False if its files can go
+
+        Returns:
+            int: Number of files deleted
+        """
+        deleted = 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                key = name.split('.', 1)[0]
+                if name.startswith('.tmp-') or is_live(key):
+                    continue
+                try:
+                    os.unlink(os.path.join(directory, name))
+                    deleted += 1
+                except FileNotFoundError:
+                    pass
+        return deleted
+
+
+def externalize_column(connection, store, table, column, batch_size=500):
+    """
+    Move inline media values of one column into the store, replacing them
+    with references. Runs in rowid batches, one short transaction each, so it
+    can run next to the API and be interrupted and restarted at any time.
+
+    Returns:
+        tuple: (values moved, values skipped because they could not be decoded)
+    """
+    moved = skipped = 0
+    last_rowid = 0
+    while True:
+        rows = connection.execute(
+            f"SELECT rowid, {column} FROM {table} WHERE rowid > ? AND {column} IS NOT NULL "
+            f"ORDER BY rowid LIMIT ?", (last_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            return moved, skipped
+        updates = []
+        for rowid, value in rows:
+            last_rowid = rowid
+            if is_media_ref(value):
+                continue
+            try:
+                updates.append((store.put(decode_media(value)), rowid, value))
+            except ValueError:
+                skipped += 1
+        if updates:
+            # Only replace values nobody changed in the meantime
+            cursor = connection.executemany(
+                f"UPDATE {table} SET {column} = ? WHERE rowid = ? AND {column} = ?", updates)
+            connection.commit()
+            moved += cursor.rowcount
+
+
+def externalize_value(connection, store, table, column, rowid):
+    """
+    Move one row's inline media value into the store, replacing it with its
+    reference (see externalize_column()). The caller commits.
+
+    Returns:
+        str: The media store reference of the value, or None if the row has none
+
+    Raises:
+        ValueError: If the value is not valid base64
+    """
+    row = connection.execute(f"SELECT {column} FROM {table} WHERE rowid = ?", (rowid,)).fetchone()
+    if row is None or row[0] is None:
+        return None
+    value = row[0]
+    if is_media_ref(value):
+        return value
+    ref = store.put(decode_media(value))
+    # Only replace the value if nobody changed it in the meantime
+    connection.execute(f"UPDATE {table} SET {column} = ? WHERE rowid = ? AND {column} = ?", (ref, rowid, value))
+    return ref
+
+
+def collect_garbage(connection, store, columns, min_age=3600):
+    """
+    Delete stored media that no row references any more.
+
+    Args:
+        connection (sqlite3.Connection): Database connection
+        store (FileSystemMediaStore): The media store
+        columns (dict): table -> list of media columns
+        min_age (float): Leave files younger than this many seconds alone, so
+            media uploaded by a request that hasn't committed yet survives
+
+    Returns:
+        tuple: (files deleted, bytes freed)
+    """
+    referenced = set()
+    for table, table_columns in columns.items():
+        for column in table_columns:
+            referenced.update(value for (value,) in connection.execute(
+                f"SELECT DISTINCT {column} FROM {table} WHERE {column} LIKE '{MEDIA_REF_PREFIX}%'"))
+    deleted = freed = 0
+    for ref, size in list(store.refs(min_age)):
+        if ref not in referenced:
+            store.delete(ref)
+            deleted += 1
+            freed += size
+    return deleted, freed
+
+
+class InlineMedia:
+    """
+    Byte-range access to media stored inline in a database row.
+
+    Reads go through SQLite incremental blob I/O (Connection.blobopen), so
+    only the bytes of the requested range are read from the database file.
+    Raw BLOBs are sliced directly; base64 text is decoded on the fly from the
+    4-character groups that cover the range.
+
+    Args:
+        blob (sqlite3.Blob): Open handle on the media column of the row
+        is_text (bool): Whether the column holds base64 text rather than raw bytes
+    """
+    def __init__(self, blob, is_text):
+        self.blob = blob
+        self.is_text = is_text
+        self.offset = 0
+        if not is_text:
+            self.size = len(blob)
+            return
+        head = blob[0:min(len(blob), 256)]
+        if head.startswith(b'data:') and b',' in head:
+            self.offset = head.index(b',') + 1
+        # Leave out trailing whitespace (base64 text often ends in a newline)
+        end = len(blob)
+        tail = blob[max(self.offset, end - 64):end]
+        end -= len(tail) - len(tail.rstrip())
+        encoded = end - self.offset
+        padding = blob[end - 2:end].count(b'=') if encoded >= 4 else 0
+        self.size = encoded // 4 * 3 - padding
+
+    def read(self, start, stop):
+        """Return the decoded bytes [start, stop)"""
+        stop = min(stop, self.size)
+        if start >= stop:
+            return b''
+        if not self.is_text:
+            return self.blob[start:stop]
+        first, last = start // 3, -(-stop // 3)
+        encoded = self.blob[self.offset + first * 4:self.offset + last * 4]
+        try:
+            data = base64.b64decode(encoded, validate=True)
+        except binascii.Error:
+            raise ValueError("Stored media is not valid base64")
+        return data[start - first * 3:stop - first * 3]
+
+    def iter_range(self, start, stop, chunk_size=65536):
+        """Yield the bytes [start, stop) in chunks of about `chunk_size` bytes"""
+        chunk_size = max(3, chunk_size - chunk_size % 3)
+        position = start
+        while position < stop:
+            end = min(stop, position + chunk_size)
+            yield self.read(position, end)
+            position = end
+
+
+def read_media_ref(blob):
+    """Return the media store reference held in a blob handle, or None for inline media"""
+    if len(blob) != len(MEDIA_REF_PREFIX) + 64:
+        return None
+    value = blob[0:len(blob)].decode('ascii', errors='replace')
+    return value if is_media_ref(value) else None
+
+
+def stream_inline_media(connect, table, column, rowid, is_text, start, stop, chunk_size=65536):
+    """
+    Generate the bytes [start, stop) of inline media for a streamed response.
+
+    The connection is borrowed when the first chunk is produced and handed back
+    when the last one has been sent (or the client goes away). If the row is
+    changed while streaming, SQLite expires the blob handle and the stream ends
+    with an error instead of mixing old and new content.
+
+    Args:
+        connect (callable): Returns a connection; its close() is called at the end
+        table (str): Table holding the media
+        column (str): Media column
+        rowid (int): rowid of the row
+        is_text (bool): Whether the column holds base64 text
+        start (int): First byte to send
+        stop (int): Byte after the last one to send
+        chunk_size (int): Bytes read from the database per chunk
+    """
+    connection = connect()
+    try:
+        with connection.blobopen(table, column, rowid, readonly=True) as blob:
+            yield from InlineMedia(blob, is_text).iter_range(start, stop, chunk_size)
+    finally:
+        connection.close()
@@ -0,0 +1,387 @@
+import re
+import sqlite3
+import time
+
+from statements import statements
+from media import IMAGE_COLUMNS, MEDIA_REF_PREFIX, ref_digest_sql
+from search import catalog_rebuild_statements
+from aggregates import (listen_stats_triggers, listen_stats_rebuild_statements, genre_rollup_rebuild_statements,
+                        follow_count_rebuild_statements)
+
+# Bookkeeping tables for the migration runner
+MIGRATION_TABLES = [
+    """CREATE TABLE IF NOT EXISTS SchemaMigrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""",
+    # Where an interrupted migration stopped, so it can resume instead of starting over
+    """CREATE TABLE IF NOT EXISTS SchemaMigrationProgress (
+        version INTEGER PRIMARY KEY,
+        step INTEGER NOT NULL,
+        last_rowid INTEGER NOT NULL DEFAULT 0
+    )"""
+]
+
+
+def create_statement(table):
+    """Return the CREATE TABLE statement for `table` from statements.py"""
+    for statement in statements:
+        if f"CREATE TABLE IF NOT EXISTS {table} (" in statement:
+            return statement
+    raise KeyError(table)
+
+
+def table_columns(connection, table):
+    """Return the column names of `table` (empty if it doesn't exist)"""
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def trigger_statement(name):
+    """Return the CREATE TRIGGER statement for `name` from statements.py"""
+    for statement in statements:
+        if f"CREATE TRIGGER IF NOT EXISTS {name} " in statement:
+            return statement
+    raise KeyError(name)
+
+
+def recreate_triggers(triggers):
+    """
+    Return statements (for one transaction) replacing existing triggers with
+    the given CREATE TRIGGER IF NOT EXISTS statements, which on their own
+    would leave an older definition in place.
+    """
+    names = [re.search(r"CREATE TRIGGER IF NOT EXISTS (\w+)", trigger).group(1) for trigger in triggers]
+    return tuple(f"DROP TRIGGER IF EXISTS {name}" for name in names) + tuple(triggers)
+
+
+def table_exists(connection, table):
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+class ChunkedCopy:
+    """
+    A set-based INSERT ... SELECT (or UPDATE) that is run in rowid ranges of the source table.
+
+    Each range is its own short transaction, so copying a large table never
+    holds the write lock for more than one batch and other writers get in
+    between batches.
+
+    Args:
+        source (str): Table whose rowids drive the batching
+        sql (str): INSERT ... SELECT or UPDATE statement reading `source` as `src`
+            and restricted with `src.rowid > :lo AND src.rowid <= :hi`
+    """
+    def __init__(self, source, sql):
+        self.source = source
+        self.sql = sql
+
+    def __repr__(self):
+        return f"ChunkedCopy({self.source})"
+
+
+class Migration:
+    """
+    One versioned schema/data migration.
+
+    Args:
+        version (int): Unique, increasing version number
+        name (str): Short description recorded in SchemaMigrations
+        steps (list or callable): Steps, or a function taking a connection and
+            returning them. A step is an SQL string, a tuple of SQL strings
+            run in one transaction, or a ChunkedCopy
+        applies (callable): Optional check taking a connection; if it returns
+            False the migration is recorded as applied without running anything
+        phase (str): 'pre' migrations run before the tables in statements.py are
+            created (for rewriting legacy layouts), 'post' ones after
+    """
+    def __init__(self, version, name, steps, applies=None, phase='post'):
+        self.version = version
+        self.name = name
+        self._steps = steps
+        self.applies = applies
+        self.phase = phase
+
+    def steps(self, connection):
+        return self._steps(connection) if callable(self._steps) else self._steps
+
+
+class MigrationRunner:
+    """
+    Applies pending migrations in version order and records each one in
+    SchemaMigrations so it is never evaluated again.
+
+    Every plain SQL step runs in its own transaction together with a progress
+    update, and ChunkedCopy steps commit after every batch, so a migration can
+    run while the API is serving and can resume where it stopped if interrupted.
+    The last step commits together with the SchemaMigrations row.
+
+    Args:
+        database (str): Path to the SQLite database file
+        migrations (list): Migration objects
+        batch_size (int): Rows per ChunkedCopy transaction
+        pause (float): Seconds to sleep between batches to let other writers in
+        timeout (float): SQLite busy timeout, in seconds
+    """
+    def __init__(self, database, migrations, batch_size=5000, pause=0.0, timeout=30.0):
+        self.database = database
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+        self.batch_size = batch_size
+        self.pause = pause
+        self.timeout = timeout
+
+    def _connect(self):
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        connection = sqlite3.connect(self.database, timeout=self.timeout, isolation_level=None)
+        for statement in MIGRATION_TABLES:
+            connection.execute(statement)
+        return connection
+
+    def applied_versions(self):
+        """Return {version: (name, applied_at)} for every recorded migration"""
+        connection = self._connect()
+        try:
+            rows = connection.execute("SELECT version, name, applied_at FROM SchemaMigrations").fetchall()
+            return {version: (name, applied_at) for version, name, applied_at in rows}
+        finally:
+            connection.close()
+
+    def pending(self, phase=None):
+        """Return the migrations that have not been applied yet"""
+        applied = self.applied_versions()
+        return [m for m in self.migrations
+                if m.version not in applied and (phase is None or m.phase == phase)]
+
+    def run(self, phase=None):
+        """
+        Apply every pending migration (optionally only those of one phase).
+
+        Returns:
+            list: The migrations that were applied
+        """
+        done = []
+        for migration in self.pending(phase):
+            self.apply(migration)
+            done.append(migration)
+        return done
+
+    def apply(self, migration):
+        connection = self._connect()
+        try:
+            if migration.applies is not None and not migration.applies(connection):
+                self._record(connection, migration)
+                print(f"Migration {migration.version} ({migration.name}): nothing to do")
+                return
+
+            print(f"Applying migration {migration.version} ({migration.name})...")
+            steps = migration.steps(connection)
+            progress = connection.execute(
+                "SELECT step, last_rowid FROM SchemaMigrationProgress WHERE version = ?",
+                (migration.version,)
+            ).fetchone()
+            start_step, last_rowid = progress if progress else (0, 0)
+
+            for index in range(start_step, len(steps)):
+                step = steps[index]
+                is_last = index == len(steps) - 1
+                if isinstance(step, ChunkedCopy):
+                    self._copy(connection, migration, index, step, last_rowid)
+                    last_rowid = 0
+                    if is_last:
+                        connection.execute("BEGIN IMMEDIATE")
+                        self._record(connection, migration, in_transaction=True)
+                        connection.execute("COMMIT")
+                else:
+                    connection.execute("BEGIN IMMEDIATE")
+                    try:
+                        for statement in ((step,) if isinstance(step, str) else step):
+                            connection.execute(statement)
+                        if is_last:
+                            self._record(connection, migration, in_transaction=True)
+                        else:
+                            self._save_progress(connection, migration, index + 1, 0)
+                        connection.execute("COMMIT")
+                    except sqlite3.Error:
+                        connection.execute("ROLLBACK")
+                        raise
+            if not steps:
+                self._record(connection, migration)
+            print(f"Migration {migration.version} ({migration.name}) applied.")
+        finally:
+            connection.close()
+
+    def _copy(self, connection, migration, index, step, last_rowid):
+        """Run a ChunkedCopy one rowid range (and one transaction) at a time"""
+        max_rowid = connection.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {step.source}").fetchone()[0]
+        lo = last_rowid
+        while lo < max_rowid:
+            hi = lo + self.batch_size
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(step.sql, {'lo': lo, 'hi': hi})
+                self._save_progress(connection, migration, index, hi)
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                connection.execute("ROLLBACK")
+                raise
+            lo = hi
+            if self.pause:
+                time.sleep(self.pause)
+        # Step finished: the next run starts at the following step
+        connection.execute("BEGIN IMMEDIATE")
+        self._save_progress(connection, migration, index + 1, 0)
+        connection.execute("COMMIT")
+
+    def _save_progress(self, connection, migration, step, last_rowid):
+        connection.execute(
+            "INSERT OR REPLACE INTO SchemaMigrationProgress (version, step, last_rowid) VALUES (?, ?, ?)",
+            (migration.version, step, last_rowid)
+        )
+
+    def _record(self, connection, migration, in_transaction=False):
+        if not in_transaction:
+            connection.execute("BEGIN IMMEDIATE")
+        connection.execute("INSERT OR REPLACE INTO SchemaMigrations (version, name) VALUES (?, ?)",
+                           (migration.version, migration.name))
+        connection.execute("DELETE FROM SchemaMigrationProgress WHERE version = ?", (migration.version,))
+        if not in_transaction:
+            connection.execute("COMMIT")
+
+
+# ---------------------------- Migrations ----------------------------
+
+def _genre_has_inline_names(connection):
+    """Old layout: Genre holds one row per song with the genre name inline"""
+    columns = table_columns(connection, 'Genre')
+    return 'song_id' in columns and ('genre' in columns or 'genre_name' in columns)
+
+
+def _inline_genre_steps(connection):
+    name_column = 'genre' if 'genre' in table_columns(connection, 'Genre') else 'genre_name'
+    return [
+        create_statement('GenreFields'),
+        f"""INSERT INTO GenreFields (genre_name)
+            SELECT DISTINCT {name_column} FROM Genre
+            WHERE {name_column} IS NOT NULL
+              AND {name_column} NOT IN (SELECT genre_name FROM GenreFields)""",
+        create_statement('Genre').replace("EXISTS Genre (", "EXISTS Genre_new ("),
+        ChunkedCopy('Genre', f"""
+            INSERT OR IGNORE INTO Genre_new (song_id, genre_id)
+            SELECT src.song_id, (SELECT MIN(f.genre_id) FROM GenreFields f WHERE f.genre_name = src.{name_column})
+            FROM Genre AS src
+            WHERE src.rowid > :lo AND src.rowid <= :hi
+              AND src.song_id IS NOT NULL AND src.{name_column} IS NOT NULL"""),
+        # Swap the tables in one transaction (DDL is transactional in SQLite)
+        ("""DROP TABLE Genre""",
+         """ALTER TABLE Genre_new RENAME TO Genre""",
+         """CREATE INDEX IF NOT EXISTS idx_genre_song_id ON Genre(song_id)""")
+    ]
+
+
+def _has_song_genre_table(connection):
+    """Old layout: SongGenre(song_id, genre_id) links songs to a Genre(genre_id, genre_name) lookup"""
+    return table_exists(connection, 'SongGenre') and 'genre_name' in table_columns(connection, 'Genre')
+
+
+_song_genre_steps = [
+    create_statement('GenreFields'),
+    """INSERT INTO GenreFields (genre_name)
+       SELECT DISTINCT genre_name FROM Genre
+       WHERE genre_name IS NOT NULL
+         AND genre_name NOT IN (SELECT genre_name FROM GenreFields)""",
+    create_statement('Genre').replace("EXISTS Genre (", "EXISTS Genre_new ("),
+    ChunkedCopy('SongGenre', """
+        INSERT OR IGNORE INTO Genre_new (song_id, genre_id)
+        SELECT src.song_id, (SELECT MIN(f.genre_id) FROM GenreFields f WHERE f.genre_name = g.genre_name)
+        FROM SongGenre AS src
+        JOIN Genre g ON g.genre_id = src.genre_id
+        WHERE src.rowid > :lo AND src.rowid <= :hi"""),
+    ("""DROP TABLE SongGenre""",
+     """DROP TABLE Genre""",
+     """ALTER TABLE Genre_new RENAME TO Genre""",
+     """CREATE INDEX IF NOT EXISTS idx_genre_song_id ON Genre(song_id)""")
+]
+
+
+def _missing_row_version(table):
+    return lambda connection: 'row_version' not in table_columns(connection, table)
+
+
+def _row_version_steps(table, add_last_modified=True):
+    """
+    Add the row_version (and last_modified) columns used for ETags to an
+    existing table. ALTER TABLE can't add a column defaulting to
+    CURRENT_TIMESTAMP, so last_modified starts out as created_at.
+    """
+    steps = [f"ALTER TABLE {table} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0"]
+    if add_last_modified:
+        steps += [
+            f"ALTER TABLE {table} ADD COLUMN last_modified DATETIME",
+            # Setting last_modified explicitly keeps the row version trigger out of the way
+            ChunkedCopy(table, f"""
+                UPDATE {table} AS src SET last_modified = COALESCE(src.created_at, CURRENT_TIMESTAMP)
+                WHERE src.rowid > :lo AND src.rowid <= :hi""")
+        ]
+    return steps
+
+
+def _image_digest_column_steps(connection):
+    """
+    Add the <image>_digest columns to existing tables. This runs before the
+    tables in statements.py are created, because the row version triggers
+    created there read the digest columns.
+    """
+    return [f"ALTER TABLE {table} ADD COLUMN {column}_digest CHAR(64)"
+            for table, column in IMAGE_COLUMNS.items()
+            if table_exists(connection, table) and f'{column}_digest' not in table_columns(connection, table)]
+
+
+# Replace the row version triggers (so setting a digest doesn't count as a
+# change of the row), then fill in the digests of images already in the media store
+_image_digest_steps = [
+    recreate_triggers([trigger_statement(f"trg_{table.lower()}_row_version")
+                       for table in IMAGE_COLUMNS if table != 'MusicGroup']),
+    *(ChunkedCopy(table, f"""
+        UPDATE {table} AS src SET {column}_digest = {ref_digest_sql(f'src.{column}')}
+        WHERE src.rowid > :lo AND src.rowid <= :hi AND src.{column} LIKE '{MEDIA_REF_PREFIX}%'""")
+      for table, column in IMAGE_COLUMNS.items())
+]
+
+
+MIGRATIONS = [
+    # Replaces migrate_genre_data(): Genre(song_id, genre) -> GenreFields + Genre link rows
+    Migration(1, 'genre_inline_names_to_genre_fields', _inline_genre_steps,
+              applies=_genre_has_inline_names, phase='pre'),
+    # Replaces migrate_genre_structure(): SongGenre + Genre lookup -> GenreFields + Genre link rows
+    Migration(2, 'song_genre_to_genre_fields', _song_genre_steps,
+              applies=_has_song_genre_table, phase='pre'),
+    # Row versions for ETag / Last-Modified conditional GETs
+    Migration(3, 'user_row_version', _row_version_steps('User'), applies=_missing_row_version('User')),
+    Migration(4, 'playlist_row_version', _row_version_steps('Playlist', add_last_modified=False),
+              applies=_missing_row_version('Playlist')),
+    Migration(5, 'song_row_version', _row_version_steps('Song'), applies=_missing_row_version('Song')),
+    Migration(6, 'album_row_version', _row_version_steps('Album'), applies=_missing_row_version('Album')),
+    # Index the songs that existed before the SongSearch full-text index
+    Migration(7, 'song_search_index', ["INSERT INTO SongSearch(SongSearch) VALUES ('rebuild')"]),
+    # Index the catalog that existed before the CatalogSearch full-text index
+    Migration(8, 'catalog_search_index', [catalog_rebuild_statements()]),
+    # Fill the listening totals behind /albums/streaming-stats from the existing History
+    Migration(9, 'listen_stats', [listen_stats_rebuild_statements()]),
+    # Fill the hourly and daily genre rollups from the existing History
+    Migration(10, 'genre_rollups', [genre_rollup_rebuild_statements()]),
+    # Count the followers and followings that existed before UserFollowCounts
+    Migration(11, 'follow_counts', [follow_count_rebuild_statements()]),
+    # Song deletes take the song's plays off its albums even without foreign key cascades
+    Migration(12, 'listen_stats_song_delete',
+              [recreate_triggers(listen_stats_triggers()) + listen_stats_rebuild_statements()]),
+    # Stamp rows inserted into migrated tables before they got a last_modified trigger
+    Migration(13, 'last_modified_backfill', [
+        tuple(f"UPDATE {table} SET last_modified = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE last_modified IS NULL"
+              for table in ('User', 'Song', 'Album'))
+    ]),
+    # Digests of stored images, for versioned image URLs
+    Migration(14, 'image_digest_columns', _image_digest_column_steps, phase='pre'),
+    Migration(15, 'image_digests', _image_digest_steps),
+]
@@ -0,0 +1,130 @@
+import base64
+import json
+
+
+class InvalidPageRequest(ValueError):
+    """Raised when the `limit` or `after` query parameters cannot be used."""
+
+
+def encode_cursor(values):
+    """Turn the key values of the last row on a page into an opaque cursor string"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    Turn a cursor produced by encode_cursor() back into key values.
+
+    Args:
+        cursor (str): The cursor sent back by the client
+        size (int): Number of key columns the cursor must hold
+
+    Raises:
+        InvalidPageRequest: If the cursor is malformed or belongs to another listing
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidPageRequest("Invalid pagination cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidPageRequest("Invalid pagination cursor")
+    return tuple(values)
+
+
+class KeysetPage:
+    """
+    One page of a keyset (cursor) paginated listing.
+
+    Rows are ordered by `keys` (the table's primary key, or a timestamp that
+    is unique within the filtered rows) and each page continues strictly after
+    the key of the previous page's last row, so the database seeks straight to
+    the page through the key's index and only ever reads `limit + 1` rows,
+    however deep into the listing the client is.
+
+    Args:
+        keys (list): Ordering columns, optionally table-qualified ('User.user_id');
+            together they must be unique
+        limit (int): Maximum number of rows on the page
+        after (tuple): Key values of the last row of the previous page
+        descending (bool): Walk the keys from highest to lowest
+    """
+    def __init__(self, keys, limit, after=None, descending=False):
+        self.keys = list(keys)
+        self.limit = limit
+        self.after = after
+        self.descending = descending
+        self.next_cursor = None
+
+    @classmethod
+    def from_args(cls, keys, args, default_limit, max_limit, descending=False):
+        """
+        Build a page from the `limit` and `after` request arguments.
+
+        Raises:
+            InvalidPageRequest: If `limit` is not between 1 and `max_limit`
+                or `after` is not a valid cursor
+        """
+        limit = args.get('limit', default_limit)
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise InvalidPageRequest("limit must be an integer")
+        if not 1 <= limit <= max_limit:
+            raise InvalidPageRequest(f"limit must be between 1 and {max_limit}")
+        after = args.get('after')
+        if after:
+            after = decode_cursor(after, len(keys))
+        return cls(keys, limit, after or None, descending)
+
+    def _sql(self, query, where, params, limit):
+        """Add the keyset condition, ordering and (optional) LIMIT to `query`"""
+        conditions = [f"({where})"] if where else []
+        params = list(params)
+        if self.after is not None:
+            operator = '<' if self.descending else '>'
+            conditions.append(f"({', '.join(self.keys)}) {operator} ({', '.join('?' * len(self.keys))})")
+            params.extend(self.after)
+        direction = ' DESC' if self.descending else ''
+        sql = query
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY ' + ', '.join(key + direction for key in self.keys)
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return sql, params
+
+    def fetch(self, connection, query, where=None, params=()):
+        """
+        Run `query` restricted to this page.
+
+        Args:
+            connection (sqlite3.Connection): Connection to read from
+            query (str): SELECT ... FROM ... without WHERE, ORDER BY or LIMIT;
+                the key columns must be part of its result
+            where (str): Optional filter, combined with the keyset condition
+            params (tuple): Parameters for `where`
+
+        Returns:
+            list: The rows of the page; `next_cursor` is set when more rows follow
+        """
+        sql, params = self._sql(query, where, params, self.limit + 1)
+        rows = connection.execute(sql, params).fetchall()
+        self.next_cursor = None
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            last = rows[-1]
+            self.next_cursor = encode_cursor(last[key.split('.')[-1]] for key in self.keys)
+        return rows
+
+    def execute(self, connection, query, where=None, params=()):
+        """
+        Run `query` for every row after this page's cursor, ignoring the limit.
+
+        Returns:
+            sqlite3.Cursor: An open cursor in key order, meant to be read with fetchmany()
+        """
+        sql, params = self._sql(query, where, params, None)
+        return connection.execute(sql, params)
@@ -0,0 +1,69 @@
+class InvalidFieldSet(ValueError):
+    """Raised when the `fields` query parameter names a field that doesn't exist."""
+
+
+class FieldSet:
+    """
+    The fields a list endpoint can return, and the columns it reads for them.
+
+    `?fields=a,b` selects a sparse fieldset: only those columns (plus the key
+    columns) end up in the SELECT, so a listing never reads a BLOB it doesn't
+    return. Without it the default projection leaves the `media` columns out
+    and returns their `links` (URL fields) instead.
+
+    Args:
+        table (str): Table the listing reads from
+        keys (list): Key columns, always selected (needed for cursors and URLs)
+        columns (list): Selectable table columns
+        media (list): Columns left out of the default projection (BLOBs)
+        links (list): Computed URL fields, which need no column of their own
+        link_columns (dict): Small columns some URL fields read (e.g. the
+            digest versioning an image URL), selected along with them
+    """
+    def __init__(self, table, keys, columns, media=(), links=(), link_columns=None):
+        self.table = table
+        self.keys = list(keys)
+        self.columns = list(columns)
+        self.media = list(media)
+        self.links = list(links)
+        self.link_columns = dict(link_columns or {})
+
+    @property
+    def names(self):
+        """Every field name `?fields=` accepts"""
+        return self.columns + self.links
+
+    @property
+    def default(self):
+        return [name for name in self.names if name not in self.media]
+
+    def select(self, requested=None, source=None):
+        """
+        Work out the query and output mask for a `fields` parameter.
+
+        Args:
+            requested (str): Comma separated field names, or None for the default
+            source (str): FROM clause to use instead of the table, e.g. a join;
+                the columns are then qualified with the table name
+
+        Returns:
+            tuple: (`SELECT ... FROM table` for KeysetPage.fetch(), mask string
+                for flask_restx.marshal())
+
+        Raises:
+            InvalidFieldSet: If an unknown field is requested
+        """
+        if requested:
+            names = [name.strip() for name in requested.split(',') if name.strip()]
+            unknown = [name for name in names if name not in self.names]
+            if unknown:
+                raise InvalidFieldSet(f"Unknown field(s): {', '.join(unknown)}. "
+                                      f"Available fields: {', '.join(self.names)}")
+        else:
+            names = self.default
+        names = self.keys + [name for name in names if name not in self.keys]
+        columns = [name for name in names if name in self.columns]
+        columns += [self.link_columns[name] for name in names if name in self.link_columns]
+        if source is not None:
+            columns = [f"{self.table}.{column}" for column in columns]
+        return f"SELECT {', '.join(columns)} FROM {source or self.table}", ','.join(names)
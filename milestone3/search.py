@@ -0,0 +1,96 @@
+import re
+
+# What the unicode61 tokenizer of the search indexes treats as a word
+_WORD = re.compile(r'\w+')
+
+
+def fts_query(text, prefix=True):
+    """
+    Turn search text typed by a user into an FTS5 MATCH expression.
+
+    Every word has to match (implicit AND), as the start of an indexed word
+    when `prefix` is set, so "stair heav" finds "Stairway to Heaven". Each word
+    is quoted, so FTS5 syntax in the input (quotes, AND/OR/NOT, column filters,
+    ...) is searched for as text instead of being interpreted.
+
+    Args:
+        text (str): The search text
+        prefix (bool): Match words by prefix
+
+    Returns:
+        str: The MATCH expression, or None if the text has no words
+    """
+    words = _WORD.findall(text)
+    if not words:
+        return None
+    suffix = '*' if prefix else ''
+    return ' '.join(f'"{word}"{suffix}' for word in words)
+
+
+# Tables indexed by CatalogSearch: (kind, code, table, key column, name column).
+# An entry's rowid is the source row's rowid * 8 + code, so the triggers can
+# find it without a lookup.
+CATALOG_SOURCES = [
+    ('song', 1, 'Song', 'song_id', 'song_name'),
+    ('album', 2, 'Album', 'album_id', 'album_name'),
+    ('group', 3, 'MusicGroup', 'group_id', 'group_name'),
+    ('artist', 4, 'Artist', 'artist_id', 'full_name'),
+    ('playlist', 5, 'Playlist', 'playlist_id', 'playlist_name'),
+]
+CATALOG_KINDS = [kind for kind, *_ in CATALOG_SOURCES]
+
+
+def catalog_search_triggers():
+    """Return the CREATE TRIGGER statements keeping CatalogSearch in sync with its tables"""
+    triggers = []
+    for kind, code, table, key, name in CATALOG_SOURCES:
+        entry = f"(NEW.rowid * 8 + {code}, NEW.{name}, '{kind}', NEW.{key})"
+        triggers += [
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{kind}_catalog_insert AFTER INSERT ON {table}
+                WHEN NEW.{name} IS NOT NULL
+                BEGIN
+                    INSERT INTO CatalogSearch(rowid, name, kind, item_id) VALUES {entry};
+                END""",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{kind}_catalog_delete AFTER DELETE ON {table}
+                BEGIN
+                    DELETE FROM CatalogSearch WHERE rowid = OLD.rowid * 8 + {code};
+                END""",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{kind}_catalog_update AFTER UPDATE OF {name}, {key} ON {table}
+                BEGIN
+                    DELETE FROM CatalogSearch WHERE rowid = OLD.rowid * 8 + {code};
+                    INSERT INTO CatalogSearch(rowid, name, kind, item_id)
+                        SELECT NEW.rowid * 8 + {code}, NEW.{name}, '{kind}', NEW.{key}
+                        WHERE NEW.{name} IS NOT NULL;
+                END""",
+        ]
+    return triggers
+
+
+def catalog_rebuild_statements():
+    """Return the statements (for one transaction) that refill CatalogSearch from its tables"""
+    return ("DELETE FROM CatalogSearch",) + tuple(
+        f"""INSERT INTO CatalogSearch(rowid, name, kind, item_id)
+            SELECT rowid * 8 + {code}, {name}, '{kind}', {key} FROM {table} WHERE {name} IS NOT NULL"""
+        for kind, code, table, key, name in CATALOG_SOURCES)
+
+
+def catalog_search_sql(kinds):
+    """
+    Return the query for the best matches of each kind in one pass over CatalogSearch.
+
+    Parameters: the MATCH expression, then the number of results per kind.
+
+    Args:
+        kinds (list): Kinds (see CATALOG_KINDS) to return results for
+    """
+    kind_list = ', '.join(f"'{kind}'" for kind in kinds if kind in CATALOG_KINDS)
+    return f"""
+        SELECT kind, item_id, name FROM (
+            SELECT kind, item_id, name, rank,
+                   row_number() OVER (PARTITION BY kind ORDER BY rank) AS position
+            FROM CatalogSearch
+            WHERE CatalogSearch MATCH ? AND kind IN ({kind_list})
+        )
+        WHERE position <= ?
+        ORDER BY kind, position
+    """
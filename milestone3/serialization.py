@@ -0,0 +1,178 @@
+import json
+from datetime import date, datetime
+from functools import partial
+
+from flask_restx import fields
+from flask_restx.mask import Mask
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; the standard json module is used without it
+    orjson = None
+
+
+class SQLiteDateTime(fields.DateTime):
+    """
+    DateTime field that also reads SQLite's CURRENT_TIMESTAMP format
+    ('YYYY-MM-DD HH:MM:SS', UTC), which fields.DateTime rejects.
+    """
+    def parse(self, value):
+        if isinstance(value, str) and len(value) > 10 and value[10] == ' ':
+            value = value[:10] + 'T' + value[11:]
+        return super().parse(value)
+
+
+# Field types compiled into plain expressions; any other field is output by itself
+FAST_FIELDS = (fields.String, fields.Integer, fields.Float, fields.Boolean, fields.DateTime, SQLiteDateTime,
+               fields.Date)
+
+
+def dumps(obj):
+    """Encode an object as compact JSON bytes (with orjson when it is installed)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def mask_fields(mask):
+    """
+    Turn a flat field mask ('a,b' or '{a,b}', as used by ?fields= and the
+    X-Fields header) into a tuple of field names.
+
+    Raises:
+        flask_restx.mask.ParseError: If the mask is malformed
+    """
+    if not mask:
+        return None
+    return tuple(Mask(mask).keys())
+
+
+def _datetime_converter(field):
+    if field.dt_format != 'iso8601':
+        return field.format
+    separators = ('T', ' ') if isinstance(field, SQLiteDateTime) else ('T',)
+
+    def convert(value):
+        # datetime.fromisoformat() gives the same result as the field's own
+        # parser for ISO strings, at a fraction of the cost
+        if value.__class__ is str and len(value) > 10 and value[10] in separators:
+            try:
+                return datetime.fromisoformat(value).isoformat()
+            except ValueError:
+                pass
+        return field.format(value)
+    return convert
+
+
+def _date_converter(field):
+    def convert(value):
+        if value.__class__ is str and len(value) == 10:
+            try:
+                return date.fromisoformat(value).isoformat()
+            except ValueError:
+                pass
+        return field.format(value)
+    return convert
+
+
+class ModelSerializer:
+    """
+    Compiled serializer for the rows of one flask-restx model.
+
+    marshal() looks up and formats every field of every row through several
+    layers of Python calls. This class generates one function per combination
+    of query columns and field mask that builds the output dict in a single
+    expression, reading the row by position and formatting only values that
+    aren't already of the output type. The result is the same as
+    marshal(dict(row), model); field types it has no fast path for (Url,
+    Nested, ...) go through the field's own output().
+
+    Args:
+        model (flask_restx.Model): The model the rows are documented with
+    """
+    def __init__(self, model):
+        self.model = model
+        self._compiled = {}
+
+    def converter(self, columns, mask=None):
+        """
+        Return the function turning one row into the model's output dict.
+
+        Args:
+            columns (list): Column names of the rows, in order
+            mask (str): Fields to output (see mask_fields()), None for all of them
+
+        Returns:
+            callable: Takes a sqlite3.Row (or any row indexable by position and name)
+        """
+        names = mask_fields(mask)
+        key = (tuple(columns), names)
+        convert = self._compiled.get(key)
+        if convert is None:
+            convert = self._compiled[key] = self._compile(columns, names)
+        return convert
+
+    def _compile(self, columns, names):
+        positions = {column: i for i, column in enumerate(columns)}
+        env = {}
+        entries = []
+        for i, (name, field) in enumerate(self.model.items()):
+            if names is not None and name not in names:
+                continue
+            if isinstance(field, type):
+                field = field()
+            source = field.attribute if field.attribute is not None else name
+            default = field.default
+            fast = (type(field) in FAST_FIELDS and isinstance(source, str) and '.' not in source
+                    and not callable(default) and not field.mask)
+            if not fast:
+                # Anything unusual gets the field's own (slow but exact) output()
+                env[f'c{i}'] = partial(field.output, name)
+                entries.append(f"{name!r}: c{i}(row)")
+                continue
+            env[f'n{i}'] = field.format(default) if default else default
+            if source not in positions:
+                # Column not selected: marshal() outputs the default
+                entries.append(f"{name!r}: n{i}")
+                continue
+            if isinstance(field, fields.DateTime):
+                env[f'c{i}'] = _datetime_converter(field)
+            elif type(field) is fields.Date:
+                env[f'c{i}'] = _date_converter(field)
+            else:
+                env[f'c{i}'] = field.format
+            value = f"row[{positions[source]}]"
+            if type(field) is fields.String:
+                entries.append(f"{name!r}: (v if (v := {value}).__class__ is str "
+                               f"else n{i} if v is None else c{i}(v))")
+            elif type(field) is fields.Integer:
+                entries.append(f"{name!r}: (v if (v := {value}).__class__ is int "
+                               f"else n{i} if v is None else c{i}(v))")
+            else:
+                entries.append(f"{name!r}: (n{i} if (v := {value}) is None else c{i}(v))")
+        code = "def convert(row):\n    return {" + ", ".join(entries) + "}\n"
+        exec(compile(code, f"<serializer {self.model.name}>", 'exec'), env)
+        return env['convert']
+
+    def to_dicts(self, rows, mask=None):
+        """Convert rows (all with the same columns) into output dicts"""
+        if not rows:
+            return []
+        convert = self.converter(rows[0].keys(), mask)
+        return [convert(row) for row in rows]
+
+    def dumps(self, rows, mask=None):
+        """Encode rows as a JSON array (bytes)"""
+        return dumps(self.to_dicts(rows, mask))
+
+
+_serializers = {}
+
+
+def serializer_for(model):
+    """Return the (shared) ModelSerializer of a model"""
+    serializer = _serializers.get(model.name)
+    if serializer is None or serializer.model is not model:
+        serializer = _serializers[model.name] = ModelSerializer(model)
+    return serializer
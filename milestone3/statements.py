@@ -1,3 +1,8 @@
+from search import catalog_search_triggers
+from autocomplete import suggest_change_triggers
+from aggregates import listen_stats_triggers, genre_rollup_triggers, follow_count_triggers
+from media import image_digest_triggers
+
 uuid_default = (
     "lower(hex(randomblob(4))) || '-' || "
     "lower(hex(randomblob(2))) || '-4' || substr(lower(hex(randomblob(2))),2) || '-' || "
@@ -30,10 +35,28 @@ statements = [
         nickname VARCHAR(50) NOT NULL CHECK (length(nickname) >= 3),
         favorite_genre VARCHAR(50),
         user_image BLOB,
+        user_image_digest CHAR(64),
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_modified DATETIME DEFAULT CURRENT_TIMESTAMP,
+        row_version INTEGER NOT NULL DEFAULT 0,
         FOREIGN KEY (user_id) REFERENCES Account(account_id) ON DELETE CASCADE ON UPDATE CASCADE
     )""",
     """CREATE INDEX IF NOT EXISTS idx_user_nickname ON User(nickname)""",
+    # Bump the row version (used for ETags) on every change, unless the UPDATE sets last_modified itself
+    # (or only the image digest, which the image digest trigger sets after every image change)
+    """CREATE TRIGGER IF NOT EXISTS trg_user_row_version AFTER UPDATE ON User
+        FOR EACH ROW WHEN NEW.row_version IS OLD.row_version AND NEW.last_modified IS OLD.last_modified
+                      AND NEW.user_image_digest IS OLD.user_image_digest
+        BEGIN
+            UPDATE User SET row_version = OLD.row_version + 1, last_modified = CURRENT_TIMESTAMP
+            WHERE rowid = NEW.rowid;
+        END""",
+    # Columns added by a migration have no default, so stamp new rows here
+    """CREATE TRIGGER IF NOT EXISTS trg_user_last_modified AFTER INSERT ON User
+        FOR EACH ROW WHEN NEW.last_modified IS NULL
+        BEGIN
+            UPDATE User SET last_modified = CURRENT_TIMESTAMP WHERE rowid = NEW.rowid;
+        END""",
 
     # Follower table and its indexes
     """CREATE TABLE IF NOT EXISTS Follower (
@@ -54,13 +77,22 @@ statements = [
         playlist_name VARCHAR(50) NOT NULL CHECK (length(playlist_name) > 0),
         playlist_description VARCHAR(300),
         playlist_image BLOB,
+        playlist_image_digest CHAR(64),
         creator_id CHAR(36),
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         last_modified DATETIME DEFAULT CURRENT_TIMESTAMP,
+        row_version INTEGER NOT NULL DEFAULT 0,
         FOREIGN KEY (creator_id) REFERENCES User(user_id) ON DELETE SET NULL ON UPDATE CASCADE
     )""",
     """CREATE INDEX IF NOT EXISTS idx_playlist_creator_id ON Playlist(creator_id)""",
     """CREATE INDEX IF NOT EXISTS idx_playlist_name ON Playlist(playlist_name)""",
+    """CREATE TRIGGER IF NOT EXISTS trg_playlist_row_version AFTER UPDATE ON Playlist
+        FOR EACH ROW WHEN NEW.row_version IS OLD.row_version AND NEW.last_modified IS OLD.last_modified
+                      AND NEW.playlist_image_digest IS OLD.playlist_image_digest
+        BEGIN
+            UPDATE Playlist SET row_version = OLD.row_version + 1, last_modified = CURRENT_TIMESTAMP
+            WHERE rowid = NEW.rowid;
+        END""",
 
     # Song table and its index
     f"""CREATE TABLE IF NOT EXISTS Song (
@@ -68,10 +100,47 @@ statements = [
         song_name VARCHAR(50) NOT NULL CHECK (length(song_name) > 0),
         song_time INTEGER NOT NULL CHECK (song_time > 0 AND song_time <= 7200), -- Duration in seconds (max 2 hours)
         song_image BLOB,
+        song_image_digest CHAR(64),
         audio BLOB,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_modified DATETIME DEFAULT CURRENT_TIMESTAMP,
+        row_version INTEGER NOT NULL DEFAULT 0
     )""",
     """CREATE INDEX IF NOT EXISTS idx_song_name ON Song(song_name)""",
+    """CREATE TRIGGER IF NOT EXISTS trg_song_row_version AFTER UPDATE ON Song
+        FOR EACH ROW WHEN NEW.row_version IS OLD.row_version AND NEW.last_modified IS OLD.last_modified
+                      AND NEW.song_image_digest IS OLD.song_image_digest
+        BEGIN
+            UPDATE Song SET row_version = OLD.row_version + 1, last_modified = CURRENT_TIMESTAMP
+            WHERE rowid = NEW.rowid;
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_song_last_modified AFTER INSERT ON Song
+        FOR EACH ROW WHEN NEW.last_modified IS NULL
+        BEGIN
+            UPDATE Song SET last_modified = CURRENT_TIMESTAMP WHERE rowid = NEW.rowid;
+        END""",
+    # Full-text index of song names for /songs/name/<q>. It reads the names from
+    # Song itself (external content, keyed by Song's rowid), so only the index is
+    # stored; the triggers below keep it in sync. Prefixes of 2 and 3 characters
+    # are indexed too, for fast prefix queries.
+    """CREATE VIRTUAL TABLE IF NOT EXISTS SongSearch USING fts5(
+        song_name,
+        content='Song', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS trg_song_search_insert AFTER INSERT ON Song
+        BEGIN
+            INSERT INTO SongSearch(rowid, song_name) VALUES (NEW.rowid, NEW.song_name);
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_song_search_delete AFTER DELETE ON Song
+        BEGIN
+            INSERT INTO SongSearch(SongSearch, rowid, song_name) VALUES ('delete', OLD.rowid, OLD.song_name);
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_song_search_update AFTER UPDATE OF song_name ON Song
+        BEGIN
+            INSERT INTO SongSearch(SongSearch, rowid, song_name) VALUES ('delete', OLD.rowid, OLD.song_name);
+            INSERT INTO SongSearch(rowid, song_name) VALUES (NEW.rowid, NEW.song_name);
+        END""",
 
     # Playlist_User table
     """CREATE TABLE IF NOT EXISTS Playlist_User (
@@ -122,11 +191,26 @@ statements = [
         album_name VARCHAR(50) NOT NULL UNIQUE CHECK (length(album_name) > 0),
         about VARCHAR(250),
         album_image BLOB,
+        album_image_digest CHAR(64),
         release_date DATE DEFAULT CURRENT_DATE,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_modified DATETIME DEFAULT CURRENT_TIMESTAMP,
+        row_version INTEGER NOT NULL DEFAULT 0
     )""",
     """CREATE INDEX IF NOT EXISTS idx_album_name ON Album(album_name)""",
     """CREATE INDEX IF NOT EXISTS idx_album_release_date ON Album(release_date)""",
+    """CREATE TRIGGER IF NOT EXISTS trg_album_row_version AFTER UPDATE ON Album
+        FOR EACH ROW WHEN NEW.row_version IS OLD.row_version AND NEW.last_modified IS OLD.last_modified
+                      AND NEW.album_image_digest IS OLD.album_image_digest
+        BEGIN
+            UPDATE Album SET row_version = OLD.row_version + 1, last_modified = CURRENT_TIMESTAMP
+            WHERE rowid = NEW.rowid;
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_album_last_modified AFTER INSERT ON Album
+        FOR EACH ROW WHEN NEW.last_modified IS NULL
+        BEGIN
+            UPDATE Album SET last_modified = CURRENT_TIMESTAMP WHERE rowid = NEW.rowid;
+        END""",
 
     # Album_Info table
     """CREATE TABLE IF NOT EXISTS Album_Info (
@@ -145,6 +229,7 @@ statements = [
         number_of_members INTEGER CHECK (number_of_members > 0),
         creation_date DATE,
         group_image BLOB,
+        group_image_digest CHAR(64),
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )""",
     """CREATE INDEX IF NOT EXISTS idx_music_group_name ON MusicGroup(group_name)""",
@@ -192,5 +277,94 @@ statements = [
         PRIMARY KEY (group_id, artist_id),
         FOREIGN KEY (group_id) REFERENCES MusicGroup(group_id) ON DELETE CASCADE ON UPDATE CASCADE,
         FOREIGN KEY (artist_id) REFERENCES Artist(artist_id) ON DELETE CASCADE ON UPDATE CASCADE
-    )"""
+    )""",
+
+    # One full-text index over the names of songs, albums, groups, artists and
+    # playlists for /search (see search.CATALOG_SOURCES), kept in sync by triggers
+    """CREATE VIRTUAL TABLE IF NOT EXISTS CatalogSearch USING fts5(
+        name, kind UNINDEXED, item_id UNINDEXED,
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    *catalog_search_triggers(),
+
+    # Log of added, renamed and deleted names that the in-memory autocomplete
+    # index (see autocomplete.py) follows, filled and trimmed by triggers
+    """CREATE TABLE IF NOT EXISTS SuggestChanges (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind VARCHAR(10) NOT NULL,
+        item_id CHAR(36) NOT NULL
+    )""",
+    *suggest_change_triggers(),
+
+    # Listening totals per song and per album for /albums/streaming-stats,
+    # kept up to date by triggers (see aggregates.py)
+    """CREATE TABLE IF NOT EXISTS SongListenStats (
+        song_id CHAR(36) PRIMARY KEY,
+        play_count INTEGER NOT NULL DEFAULT 0,
+        total_listen_time INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE INDEX IF NOT EXISTS idx_song_listen_stats_total ON SongListenStats(total_listen_time DESC)""",
+    """CREATE TABLE IF NOT EXISTS AlbumListenStats (
+        album_id CHAR(36) PRIMARY KEY,
+        play_count INTEGER NOT NULL DEFAULT 0,
+        total_listen_time INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE INDEX IF NOT EXISTS idx_album_listen_stats_total ON AlbumListenStats(total_listen_time DESC)""",
+    # Finds the albums of a played song (the primary key starts with album_id)
+    """CREATE INDEX IF NOT EXISTS idx_album_info_song_id ON Album_Info(song_id)""",
+    *listen_stats_triggers(),
+
+    # Listens per genre in hourly and daily buckets for the most listened
+    # genres, kept up to date by triggers (see aggregates.py)
+    """CREATE TABLE IF NOT EXISTS GenreListensHourly (
+        bucket_start DATETIME NOT NULL,
+        genre_id INTEGER NOT NULL,
+        listens INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket_start, genre_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS GenreListensDaily (
+        bucket_start DATE NOT NULL,
+        genre_id INTEGER NOT NULL,
+        listens INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket_start, genre_id)
+    )""",
+    # Finds the plays of a song when its genres change (and the History rows
+    # of a deleted song)
+    """CREATE INDEX IF NOT EXISTS idx_history_song_id ON History(song_id, start_time)""",
+    *genre_rollup_triggers(),
+
+    # Follower and following counts per user, kept exact by triggers (see aggregates.py)
+    """CREATE TABLE IF NOT EXISTS UserFollowCounts (
+        user_id CHAR(36) PRIMARY KEY,
+        follower_count INTEGER NOT NULL DEFAULT 0,
+        following_count INTEGER NOT NULL DEFAULT 0
+    )""",
+    # Most followed users first (ties in user_id order)
+    """CREATE INDEX IF NOT EXISTS idx_user_follow_counts_followers ON UserFollowCounts(follower_count DESC, user_id)""",
+    *follow_count_triggers(),
+
+    # Checkpoints of the trending charts' Count-Min sketches (see charts.py),
+    # one row per window, kind and time bucket
+    """CREATE TABLE IF NOT EXISTS ChartSketches (
+        window_name VARCHAR(10) NOT NULL,
+        kind VARCHAR(10) NOT NULL,
+        bucket_start INTEGER NOT NULL,
+        width INTEGER NOT NULL,
+        depth INTEGER NOT NULL,
+        hash_version INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        counters BLOB NOT NULL,
+        top_keys TEXT NOT NULL,
+        PRIMARY KEY (window_name, kind, bucket_start)
+    )""",
+
+    # Content digests of the images, for versioned image URLs (see media.py)
+    *image_digest_triggers()
 ]
+
+# Table for API login credentials (created by init_db after the tables above)
+authentication_table = """CREATE TABLE IF NOT EXISTS Authentication (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL
+)"""
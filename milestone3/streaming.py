@@ -0,0 +1,62 @@
+from serialization import dumps
+
+# Content types of the two streaming formats
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_FORMATS = {'json': JSON_MIMETYPE, 'ndjson': NDJSON_MIMETYPE}
+
+
+def iter_batches(cursor, batch_size=500):
+    """Yield lists of at most `batch_size` rows from `cursor` using fetchmany()"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def encode_json_array(batches, transform):
+    """
+    Encode batches of rows as one JSON array, yielding one chunk per batch.
+
+    Args:
+        batches (iterable): Lists of rows, e.g. from iter_batches()
+        transform (callable): Turns a list of rows into a list of JSON-serializable
+            objects, e.g. ModelSerializer.to_dicts
+    """
+    yield b'['
+    separator = b''
+    for rows in batches:
+        # Strip the brackets of each batch's array to splice them into one
+        yield separator + dumps(transform(rows))[1:-1]
+        separator = b','
+    yield b']\n'
+
+
+def encode_ndjson(batches, transform):
+    """Encode batches of rows as newline-delimited JSON, yielding one chunk per batch"""
+    for rows in batches:
+        yield b''.join(dumps(item) + b'\n' for item in transform(rows))
+
+
+def stream_rows(connect, run_query, transform, stream_format='json', batch_size=500):
+    """
+    Generate a streamed response body for a query of any size.
+
+    The connection is borrowed when the first chunk is produced and handed back
+    when the last one has been sent (or the client goes away), and only one
+    batch of rows is held in memory at a time.
+
+    Args:
+        connect (callable): Returns a connection; its close() is called at the end
+        run_query (callable): Takes the connection and returns an open cursor
+        transform (callable): Turns a list of rows into JSON-serializable objects
+        stream_format (str): 'json' for a single JSON array, 'ndjson' for one object per line
+        batch_size (int): Rows fetched from the cursor per chunk
+    """
+    encode = encode_ndjson if stream_format == 'ndjson' else encode_json_array
+    connection = connect()
+    try:
+        yield from encode(iter_batches(run_query(connection), batch_size), transform)
+    finally:
+        connection.close()
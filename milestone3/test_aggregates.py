@@ -0,0 +1,55 @@
+import sqlite3
+
+from statements import statements
+from aggregates import listen_stats_rebuild_statements
+
+
+def create_db(foreign_keys):
+    connection = sqlite3.connect(':memory:')
+    connection.execute(f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'}")
+    for statement in statements:
+        connection.execute(statement)
+    connection.execute("INSERT INTO Account (account_id, mail, password_hash, password_salt, language) "
+                       "VALUES ('u1', 'a@b.com', 'x', 'x', 'en')")
+    connection.execute("INSERT INTO User (user_id, nickname) VALUES ('u1', 'user')")
+    for album in ('a1', 'a2'):
+        connection.execute("INSERT INTO Album (album_id, album_name) VALUES (?, ?)", (album, album))
+    for song in ('s1', 's2'):
+        connection.execute("INSERT INTO Song (song_id, song_name, song_time) VALUES (?, ?, 200)", (song, song))
+    connection.executemany("INSERT INTO Album_Info (album_id, song_id, track_number) VALUES (?, ?, 1)",
+                           [('a1', 's1'), ('a1', 's2'), ('a2', 's1')])
+    connection.executemany("INSERT INTO History (user_id, song_id, start_time, duration) VALUES ('u1', ?, ?, ?)",
+                           [('s1', '2026-10-18T10:00:00', 100), ('s1', '2026-10-18T11:00:00', 50),
+                            ('s2', '2026-10-18T12:00:00', 30)])
+    return connection
+
+
+def album_totals(connection):
+    return connection.execute("SELECT album_id, play_count, total_listen_time FROM AlbumListenStats "
+                              "ORDER BY album_id").fetchall()
+
+
+def rebuilt_totals(connection):
+    for statement in listen_stats_rebuild_statements():
+        connection.execute(statement)
+    return album_totals(connection)
+
+
+def test_song_delete_matches_rebuild():
+    for foreign_keys in (False, True):
+        connection = create_db(foreign_keys)
+        assert album_totals(connection) == [('a1', 3, 180), ('a2', 2, 150)]
+        connection.execute("DELETE FROM Song WHERE song_id = 's1'")
+        assert album_totals(connection) == [('a1', 1, 30), ('a2', 0, 0)]
+        # Plays and album entries of the deleted song don't count any more
+        connection.execute("DELETE FROM History WHERE song_id = 's1'")
+        connection.execute("DELETE FROM Album_Info WHERE song_id = 's1'")
+        assert album_totals(connection) == [('a1', 1, 30), ('a2', 0, 0)]
+        assert album_totals(connection) == rebuilt_totals(connection)
+
+
+def test_album_info_delete_matches_rebuild():
+    connection = create_db(foreign_keys=False)
+    connection.execute("DELETE FROM Album_Info WHERE album_id = 'a1' AND song_id = 's1'")
+    assert album_totals(connection) == [('a1', 1, 30), ('a2', 2, 150)]
+    assert album_totals(connection) == rebuilt_totals(connection)
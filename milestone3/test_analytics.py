@@ -0,0 +1,59 @@
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+from statements import statements
+from analytics import ListeningAnalytics, top_sql, can_analyze
+
+
+def create_db(database):
+    connection = sqlite3.connect(database)
+    for statement in statements:
+        connection.execute(statement)
+    for user in ('u1', 'u2', 'u3'):
+        connection.execute("INSERT INTO Account (account_id, mail, password_hash, password_salt, language) "
+                           "VALUES (?, ?, 'x', 'x', 'en')", (user, f'{user}@b.com'))
+        connection.execute("INSERT INTO User (user_id, nickname) VALUES (?, ?)", (user, f'{user}-name'))
+    for song in ('s1', 's2', 's3', 's4'):
+        connection.execute("INSERT INTO Song (song_id, song_name, song_time) VALUES (?, ?, 300)", (song, song))
+    # Plays stored in the ISO 'T' format the API documents
+    connection.executemany("INSERT INTO History (user_id, song_id, start_time, duration) VALUES (?, ?, ?, ?)", [
+        ('u1', 's1', '2026-10-18T10:00:00', 100),
+        ('u2', 's2', '2026-10-18T11:00:00', 90),
+        ('u3', 's3', '2026-10-18T11:15:00', 80),
+        ('u1', 's4', '2026-10-18T12:30:00', 70),
+        ('u2', 's4', '2026-10-18T13:00:00', 60),
+    ])
+    connection.commit()
+    return connection
+
+
+def sql_top(connection, dimension, since, until):
+    bounds = (since.strftime('%Y-%m-%d %H:%M:%S') if since else '',
+              until.strftime('%Y-%m-%d %H:%M:%S') if until else '9999-12-31 23:59:59')
+    return connection.execute(top_sql(dimension, 'listen_time'), (*bounds, 10)).fetchall()
+
+
+@pytest.mark.skipif(not can_analyze(), reason="NumPy is not installed")
+@pytest.mark.parametrize('dimension, since, until', [
+    ('song', datetime(2026, 10, 18, 12, 30, tzinfo=timezone.utc), None),
+    ('user', None, datetime(2026, 10, 18, 11, 30, tzinfo=timezone.utc)),
+    ('song', datetime(2026, 10, 18, 11, 0, tzinfo=timezone.utc), datetime(2026, 10, 18, 13, 0, tzinfo=timezone.utc)),
+    ('user', None, None),
+])
+def test_sql_fallback_matches_numpy_on_iso_start_times(tmp_path, dimension, since, until):
+    database = str(tmp_path / 'history.db')
+    connection = create_db(database)
+    analytics = ListeningAnalytics()
+    analytics.refresh(lambda: sqlite3.connect(database), force=True)
+    expected = analytics.top(dimension, int(since.timestamp()) if since else None,
+                             int(until.timestamp()) if until else None)
+    assert expected
+    assert sql_top(connection, dimension, since, until) == expected
+
+
+def test_sql_fallback_bounds_iso_start_times():
+    connection = create_db(':memory:')
+    since = datetime(2026, 10, 18, 12, 30, tzinfo=timezone.utc)
+    assert [row[1:] for row in sql_top(connection, 'song', since, None)] == [(2, 130)]
@@ -0,0 +1,120 @@
+import math
+import sqlite3
+from collections import Counter
+
+import pytest
+
+import charts
+from charts import CountMinSketch, TrendingCharts, _timestamp
+from ingestion import PlayEvent
+from statements import statements
+
+NOW = 1_800_000_000
+
+
+def test_count_min_never_undercounts_and_stays_within_bound():
+    sketch = CountMinSketch(width=64, depth=4)
+    # A skewed stream: a few heavy keys and a long tail
+    plays = Counter({f'song-{i}': max(1, 500 // (i + 1)) for i in range(300)})
+    for key, count in plays.items():
+        slots = sketch.slots(key)
+        for _ in range(count):
+            sketch.add(slots)
+    bound = math.ceil(math.e / sketch.width * sum(plays.values()))
+    for key, count in plays.items():
+        estimate = sketch.estimate(sketch.slots(key))
+        assert count <= estimate <= count + bound
+
+
+def test_sketch_rejects_counters_of_another_shape():
+    with pytest.raises(ValueError):
+        CountMinSketch(64, 4, bytes(4 * 64 * 3))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [NOW]
+    monkeypatch.setattr(charts.time, 'time', lambda: now[0])
+    return now
+
+
+def new_charts():
+    trending = TrendingCharts(width=256, depth=4, top_k=10, cache_ttl=0)
+    # Skip loading from a database; s1 belongs to group g1
+    trending._loaded = True
+    trending._song_groups = {'s1': ('g1',), 's2': ()}
+    return trending
+
+
+def play(song_id, at):
+    return PlayEvent('u1', _timestamp(at), 10, song_id)
+
+
+def test_top_counts_songs_and_their_groups(clock):
+    trending = new_charts()
+    trending.add_plays([play('s1', NOW), play('s1', NOW), play('s2', NOW)], connect=None)
+    assert trending.top('hour', 'song')['items'] == [('s1', 2), ('s2', 1)]
+    assert trending.top('hour', 'group')['items'] == [('g1', 2)]
+
+
+def test_buckets_expire_window_by_window(clock):
+    trending = new_charts()
+    trending.add_plays([play('s1', NOW)], connect=None)
+
+    def totals():
+        return {window: trending.top(window, 'song')['total'] for window in charts.CHART_WINDOWS}
+
+    assert totals() == {'hour': 1, 'day': 1, 'week': 1}
+    clock[0] = NOW + 61 * 60
+    assert totals() == {'hour': 0, 'day': 1, 'week': 1}
+    clock[0] = NOW + 25 * 60 * 60
+    assert totals() == {'hour': 0, 'day': 0, 'week': 1}
+    clock[0] = NOW + 8 * 24 * 60 * 60
+    assert totals() == {'hour': 0, 'day': 0, 'week': 0}
+    assert not any(trending._buckets.values())
+
+
+def test_old_plays_only_count_in_windows_still_covering_them(clock):
+    trending = new_charts()
+    trending.add_plays([play('s1', NOW - 2 * 60 * 60)], connect=None)
+    assert trending.top('hour', 'song')['total'] == 0
+    assert trending.top('day', 'song')['items'] == [('s1', 1)]
+
+
+@pytest.fixture
+def connect(tmp_path):
+    path = str(tmp_path / 'charts.db')
+    connection = sqlite3.connect(path)
+    for statement in statements:
+        connection.execute(statement)
+    connection.commit()
+    connection.close()
+    return lambda: sqlite3.connect(path)
+
+
+def test_checkpoint_round_trip(clock, connect):
+    trending = new_charts()
+    trending.add_plays([play('s1', NOW), play('s1', NOW - 3 * 60 * 60), play('s2', NOW)], connect=None)
+    trending.checkpoint(connect, force=True)
+    connection = connect()
+    saved = connection.execute('SELECT COUNT(*) FROM ChartSketches').fetchone()[0]
+    connection.close()
+    assert saved > 0
+
+    restored = TrendingCharts(width=256, depth=4, top_k=10, cache_ttl=0)
+    # False: loaded from the checkpoint, not rebuilt from History
+    assert restored.ensure_loaded(connect) is False
+    for window in charts.CHART_WINDOWS:
+        for kind in charts.CHART_KINDS:
+            assert restored.top(window, kind) == trending.top(window, kind)
+
+
+def test_checkpoint_of_another_shape_is_not_restored(clock, connect):
+    trending = new_charts()
+    trending.add_plays([play('s1', NOW)], connect=None)
+    trending.checkpoint(connect, force=True)
+
+    other = TrendingCharts(width=128, depth=4, top_k=10, cache_ttl=0)
+    # Rebuilt from History (empty here) instead
+    assert other.ensure_loaded(connect) is True
+    assert other.top('hour', 'song')['items'] == []
@@ -0,0 +1,190 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from database import BusyRetry, ConnectionPool, PoolTimeout, is_busy_error
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'pool.db')
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('CREATE TABLE Item (item_id INTEGER PRIMARY KEY, name TEXT)')
+    connection.commit()
+    connection.close()
+    return path
+
+
+@pytest.fixture
+def blocker(database):
+    """A second connection holding the write lock until it rolls back"""
+    connection = sqlite3.connect(database, isolation_level=None, check_same_thread=False)
+    connection.execute('BEGIN IMMEDIATE')
+    yield connection
+    if connection.in_transaction:
+        connection.rollback()
+    connection.close()
+
+
+def writer_pool(database, retry):
+    return ConnectionPool(database, size=1, timeout=0, retry=retry)
+
+
+def test_retries_while_database_is_locked(database, blocker):
+    retry = BusyRetry(deadline=5.0, base_delay=0.01, max_delay=0.05)
+    pool = writer_pool(database, retry)
+    threading.Timer(0.2, blocker.rollback).start()
+
+    connection = pool.acquire()
+    connection.execute("INSERT INTO Item (name) VALUES ('a')")
+    connection.commit()
+    connection.close()
+
+    stats = retry.stats()
+    assert stats['retries'] >= 1
+    assert stats['recovered'] == 1
+    assert stats['gave_up'] == 0
+    pool.close_all()
+
+
+def test_gives_up_at_deadline(database, blocker):
+    retry = BusyRetry(deadline=0.2, base_delay=0.01, max_delay=0.05)
+    pool = writer_pool(database, retry)
+
+    connection = pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(sqlite3.OperationalError, match='locked'):
+        connection.execute("INSERT INTO Item (name) VALUES ('a')")
+    assert time.monotonic() - started < 1.0
+    # The implicit BEGIN of the failed attempt was rolled back
+    assert not connection.in_transaction
+    assert retry.stats()['gave_up'] == 1
+    connection.close()
+    pool.close_all()
+
+
+def test_statement_inside_transaction_is_not_retried(database):
+    calls = []
+    retry = BusyRetry(on_retry=lambda: calls.append('retry'))
+    retry.call = lambda fn, *args: calls.append('call') or fn(*args)
+    pool = writer_pool(database, retry)
+
+    connection = pool.acquire()
+    connection.execute("INSERT INTO Item (name) VALUES ('a')")
+    connection.execute("INSERT INTO Item (name) VALUES ('b')")
+    connection.commit()
+    connection.close()
+    # Only the statement that opened the transaction went through the retry
+    assert calls == ['call']
+    pool.close_all()
+
+
+def test_on_retry_releases_connections(database):
+    pool = writer_pool(database, None)
+    retry = BusyRetry(base_delay=0.001, on_retry=pool.release_thread)
+    depths = []
+
+    def work():
+        connection = pool.acquire()
+        depths.append(pool._local.depth)
+        if len(depths) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        connection.close()
+
+    retry.call(work)
+    # The first attempt's borrow was handed back before the second one ran
+    assert depths == [1, 1]
+    assert pool.stats()['idle'] == 1
+    assert retry.stats()['recovered'] == 1
+    pool.close_all()
+
+
+def test_busy_database_returns_503_with_retry_after(app, client, monkeypatch):
+    monkeypatch.setattr(app.busy_retry, 'deadline', 0.1)
+    connection = sqlite3.connect(app.DATABASE, isolation_level=None)
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        response = client.post('/albums/', json={'album_name': 'Album'})
+    finally:
+        connection.rollback()
+        connection.close()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert 'busy' in response.get_json()['message']
+
+
+def test_same_thread_reuses_its_connection(database):
+    pool = ConnectionPool(database, size=2)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert second is first
+    assert pool._local.depth == 2
+    # The first close only drops the depth; the connection stays borrowed
+    second.close()
+    assert pool._local.depth == 1
+    assert pool.stats()['idle'] == 0
+    first.close()
+    assert pool.stats()['idle'] == 1
+    # ...and the next borrow on this thread gets the same warm connection back
+    assert pool.acquire() is first
+    first.close()
+    pool.close_all()
+
+
+def test_other_threads_get_their_own_connection(database):
+    pool = ConnectionPool(database, size=2)
+    mine = pool.acquire()
+    theirs = []
+    thread = threading.Thread(target=lambda: theirs.append(pool.acquire()))
+    thread.start()
+    thread.join()
+    assert theirs[0] is not mine
+    assert pool.stats()['open'] == 2
+    mine.close()
+    pool.release(theirs[0])
+    pool.close_all()
+
+
+def test_exhausted_pool_times_out(database):
+    pool = ConnectionPool(database, size=1)
+    held = pool.acquire()
+    errors = []
+
+    def borrow():
+        try:
+            pool.acquire(timeout=0.1)
+        except PoolTimeout as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=borrow)
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+    # A pool timeout is not a busy database and must not be retried
+    assert not is_busy_error(errors[0])
+    assert pool.stats()['waiting'] == 0
+    held.close()
+    pool.close_all()
+
+
+def test_release_thread_returns_every_borrow(database):
+    pool = ConnectionPool(database, size=1)
+    connection = pool.acquire()
+    pool.acquire()
+    pool.acquire()
+    connection.execute("INSERT INTO Item (name) VALUES ('a')")
+    assert connection.in_transaction
+    pool.release_thread()
+    assert pool.stats()['idle'] == 1
+    # The forgotten transaction was rolled back, not committed
+    assert not connection.in_transaction
+    again = pool.acquire()
+    assert again.execute('SELECT COUNT(*) FROM Item').fetchone()[0] == 0
+    again.close()
+    # Releasing again (e.g. a late close()) is a no-op
+    connection.close()
+    assert pool.stats()['idle'] == 1
+    pool.close_all()
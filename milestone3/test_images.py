@@ -0,0 +1,80 @@
+import base64
+import shutil
+
+import pytest
+
+PNG = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR4nGNgYGD4DwABBAEAwS2OUAAAAABJRU5ErkJggg==')
+
+
+def add_album(client, image=PNG):
+    response = client.post('/albums/', json={'album_name': 'Album', 'album_image': base64.b64encode(image).decode()})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['album_id']
+
+
+def image_url(client):
+    [album] = client.get('/albums/').get_json()
+    return album['album_image_url']
+
+
+def test_list_links_versioned_image_url(client):
+    add_album(client)
+    url = image_url(client)
+    assert '?v=' in url
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert response.data == PNG
+
+
+def test_unversioned_image_url_is_revalidated(client):
+    album_id = add_album(client)
+    response = client.get(f'/albums/{album_id}/image')
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_replaced_image_gets_new_url(client):
+    album_id = add_album(client)
+    old_url = image_url(client)
+    other = PNG[:-12] + bytes(12)
+    response = client.put(f'/albums/{album_id}', json={'album_name': 'Album',
+                                                        'album_image': base64.b64encode(other).decode()})
+    assert response.status_code == 200, response.get_json()
+    assert image_url(client) != old_url
+    # The outdated URL shows the current image, but isn't cacheable for good
+    response = client.get(old_url)
+    assert response.data == other
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_inline_image_moves_to_media_store_when_first_sent(app, client):
+    album_id = add_album(client)
+    connection = app.db_writer.acquire()
+    connection.execute("UPDATE Album SET album_image = ? WHERE album_id = ?",
+                       (base64.b64encode(PNG).decode(), album_id))
+    connection.commit()
+    connection.close()
+    assert '?v=' not in image_url(client)
+
+    response = client.get(f'/albums/{album_id}/image')
+    assert response.status_code == 200
+    assert response.data == PNG
+    connection = app.db_reader.acquire()
+    value, digest = connection.execute("SELECT album_image, album_image_digest FROM Album").fetchone()
+    connection.close()
+    assert value == f'sha256:{digest}'
+    assert image_url(client).endswith(f'?v={digest[:16]}')
+
+
+def test_thumbnail_revalidation_reads_only_the_digest(app, client):
+    pytest.importorskip('PIL')
+    album_id = add_album(client)
+    url = image_url(client)
+    response = client.get(f'{url}&size=64')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    etag = response.headers['ETag']
+    # With the image gone from the media store, only the digest can answer
+    shutil.rmtree(app.media_store.root)
+    response = client.get(f'/albums/{album_id}/image?size=64', headers={'If-None-Match': etag})
+    assert response.status_code == 304
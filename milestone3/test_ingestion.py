@@ -0,0 +1,133 @@
+import sqlite3
+
+import pytest
+
+from database import ConnectionPool
+from ingestion import HistoryIngestor, IngestTimeout, PlayEvent
+
+
+@pytest.fixture
+def writer(tmp_path):
+    path = str(tmp_path / 'history.db')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE History (user_id TEXT, start_time TEXT, duration INTEGER, song_id TEXT, '
+                       'PRIMARY KEY (user_id, start_time))')
+    connection.close()
+    pool = ConnectionPool(path, size=1)
+    yield pool
+    pool.close_all()
+
+
+def history(pool):
+    connection = pool.acquire()
+    try:
+        return [tuple(row) for row in connection.execute('SELECT user_id, start_time FROM History ORDER BY 2')]
+    finally:
+        connection.close()
+
+
+def play(second, user_id='u1'):
+    return PlayEvent(user_id, f'2026-10-18 10:00:0{second}', 10, 's1')
+
+
+def test_failing_row_does_not_sink_its_batch(writer):
+    ingestor = HistoryIngestor(writer)
+    notified = []
+    ingestor.add_listener(notified.extend)
+    # The third play starts at the same time as the first one
+    batch = [play(0), play(1), play(0), play(2)]
+    ingestor._flush(batch)
+
+    assert all(event.done.is_set() for event in batch)
+    assert isinstance(batch[2].error, sqlite3.IntegrityError)
+    assert [event.error for event in batch if event is not batch[2]] == [None, None, None]
+    assert history(writer) == [('u1', '2026-10-18 10:00:00'), ('u1', '2026-10-18 10:00:01'),
+                               ('u1', '2026-10-18 10:00:02')]
+    # Listeners only hear about the plays that were written
+    assert notified == [batch[0], batch[1], batch[3]]
+    assert ingestor.stats()['failed'] == 1
+
+
+def test_close_flushes_buffered_plays(writer):
+    ingestor = HistoryIngestor(writer, flush_interval=30.0, durability='async')
+    for second in range(3):
+        ingestor.submit('u1', 10, 's1', start_time=f'2026-10-18 10:00:0{second}')
+    ingestor.close()
+    assert len(history(writer)) == 3
+    assert ingestor.stats()['buffered'] == 0
+
+
+def test_sync_submit_times_out(writer):
+    ingestor = HistoryIngestor(writer, commit_timeout=0.1)
+    # Holding the only writer connection keeps the flusher from committing
+    connection = writer.acquire()
+    try:
+        with pytest.raises(IngestTimeout):
+            ingestor.submit('u1', 10, 's1', start_time='2026-10-18 10:00:00')
+    finally:
+        connection.close()
+    ingestor.close()
+    # The play stayed queued and was written once the writer was free
+    assert len(history(writer)) == 1
+
+
+class BrokenWriter:
+    def acquire(self):
+        raise RuntimeError('no writer')
+
+
+def test_unexpected_errors_release_waiters_and_keep_flusher_alive():
+    ingestor = HistoryIngestor(BrokenWriter(), commit_timeout=5.0)
+    first = ingestor.submit('u1', 10, 's1')
+    second = ingestor.submit('u1', 10, 's1')
+    assert isinstance(first.error, RuntimeError)
+    assert isinstance(second.error, RuntimeError)
+    assert ingestor._thread.is_alive()
+    ingestor.close()
+
+
+def test_failing_listener_is_logged(writer, caplog):
+    ingestor = HistoryIngestor(writer)
+
+    def listener(events):
+        raise ValueError('listener broke')
+
+    ingestor.add_listener(listener)
+    event = ingestor.submit('u1', 10, 's1', start_time='2026-10-18 10:00:00')
+    ingestor.close()
+    assert event.error is None
+    assert 'History ingest listener failed' in caplog.text
+
+
+@pytest.fixture
+def play_data(app):
+    connection = app.db_writer.acquire()
+    connection.execute("INSERT INTO Account (account_id, mail, password_hash, password_salt, language) "
+                       "VALUES ('u1', 'a@b.com', 'x', 'x', 'en')")
+    connection.execute("INSERT INTO User (user_id, nickname) VALUES ('u1', 'user')")
+    connection.execute("INSERT INTO Song (song_id, song_name, song_time) VALUES ('s1', 'song', 200)")
+    connection.commit()
+    connection.close()
+    return {'user_id': 'u1', 'song_id': 's1', 'duration': 10, 'start_time': '2026-10-18 10:00:00'}
+
+
+def test_buffered_post_status_codes(app, client, play_data, monkeypatch):
+    assert client.post('/histories/', json=play_data).status_code == 201
+    assert client.post('/histories/', json=play_data).status_code == 409
+    assert client.post('/histories/', json={**play_data, 'song_id': 'nope'}).status_code == 404
+
+    monkeypatch.setattr(app.history_ingestor, 'durability', 'async')
+    response = client.post('/histories/', json={**play_data, 'start_time': '2026-10-18 10:00:01'})
+    assert response.status_code == 202
+
+
+def test_buffered_post_times_out_with_503(app, client, play_data, monkeypatch):
+    monkeypatch.setattr(app.history_ingestor, 'commit_timeout', 0.1)
+    # The request itself runs on this thread and only reads, so holding the
+    # writer here stalls nothing but the flusher
+    connection = app.db_writer.acquire()
+    try:
+        response = client.post('/histories/', json=play_data)
+    finally:
+        connection.close()
+    assert response.status_code == 503
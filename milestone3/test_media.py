@@ -0,0 +1,21 @@
+import base64
+import sqlite3
+
+from media import InlineMedia
+
+
+def inline_media(value):
+    connection = sqlite3.connect(':memory:')
+    connection.execute("CREATE TABLE Media (data)")
+    connection.execute("INSERT INTO Media (data) VALUES (?)", (value,))
+    return InlineMedia(connection.blobopen('Media', 'data', 1, readonly=True), is_text=True)
+
+
+def test_base64_with_trailing_newline():
+    data = bytes(range(20))
+    for text in (base64.b64encode(data).decode(), base64.b64encode(data).decode() + '\r\n',
+                 'data:audio/mpeg;base64,' + base64.b64encode(data).decode() + '\n'):
+        media = inline_media(text)
+        assert media.size == len(data)
+        # Suffix range bytes=-7
+        assert media.read(media.size - 7, media.size) == data[-7:]
@@ -0,0 +1,37 @@
+import sqlite3
+
+from statements import statements
+from migrations import MigrationRunner, MIGRATIONS
+
+
+def test_rows_inserted_after_row_version_migration_get_last_modified(tmp_path):
+    database = str(tmp_path / 'legacy.db')
+    connection = sqlite3.connect(database)
+    # Song as it was before row versions
+    connection.execute("""CREATE TABLE Song (
+        song_id CHAR(36) PRIMARY KEY,
+        song_name VARCHAR(50) NOT NULL,
+        song_time INTEGER NOT NULL,
+        song_image BLOB,
+        audio BLOB,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    connection.execute("INSERT INTO Song (song_id, song_name, song_time, created_at) "
+                       "VALUES ('s1', 'old', 100, '2025-01-01 00:00:00')")
+    connection.commit()
+
+    runner = MigrationRunner(database, MIGRATIONS)
+    runner.run(phase='pre')
+    for statement in statements:
+        connection.execute(statement)
+    connection.commit()
+    connection.close()
+    runner.run(phase='post')
+
+    connection = sqlite3.connect(database)
+
+    connection.execute("INSERT INTO Song (song_id, song_name, song_time) VALUES ('s2', 'new', 100)")
+    rows = dict(connection.execute("SELECT song_id, last_modified FROM Song").fetchall())
+    assert rows['s1'] == '2025-01-01 00:00:00'
+    assert rows['s2'] is not None
+    assert connection.execute("SELECT row_version FROM Song WHERE song_id = 's2'").fetchone()[0] == 0
@@ -0,0 +1,89 @@
+import base64
+import sqlite3
+
+import pytest
+
+from pagination import InvalidPageRequest, KeysetPage, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    values = ('2026-10-18 10:00:00', 42, None, 'Beyoncé')
+    cursor = encode_cursor(values)
+    assert '=' not in cursor
+    assert decode_cursor(cursor, len(values)) == values
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor!',
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+    base64.urlsafe_b64encode(b'{"user_id": 1}').decode(),
+    base64.urlsafe_b64encode(b'"u1"').decode(),
+    encode_cursor(['u1', 's1']),
+    encode_cursor(['u1'])[:-2],
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidPageRequest):
+        decode_cursor(cursor, 1)
+
+
+@pytest.mark.parametrize('limit', ['0', '1001', 'ten'])
+def test_invalid_limit_is_rejected(limit):
+    with pytest.raises(InvalidPageRequest):
+        KeysetPage.from_args(['user_id'], {'limit': limit}, 100, 1000)
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = sqlite3.Row
+    connection.execute('CREATE TABLE Follower (user_id_1 TEXT, user_id_2 TEXT, PRIMARY KEY (user_id_1, user_id_2))')
+    # Many rows share the same first key column
+    connection.executemany('INSERT INTO Follower VALUES (?, ?)',
+                           [(f'u{a}', f'u{b}') for a in range(4) for b in range(5)])
+    return connection
+
+
+def walk(connection, limit, descending=False):
+    """Fetch every page by following the cursors, like a client would"""
+    rows, after = [], None
+    while True:
+        args = {'limit': str(limit)}
+        if after:
+            args['after'] = after
+        page = KeysetPage.from_args(['user_id_1', 'user_id_2'], args, 100, 1000, descending)
+        rows.extend(tuple(row) for row in page.fetch(connection, 'SELECT * FROM Follower'))
+        after = page.next_cursor
+        if after is None:
+            return rows
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('limit', [1, 3, 5, 7, 20])
+def test_pages_cover_every_row_once_in_order(connection, limit, descending):
+    direction = ' DESC' if descending else ''
+    expected = [tuple(row) for row in connection.execute(
+        f'SELECT * FROM Follower ORDER BY user_id_1{direction}, user_id_2{direction}')]
+    assert walk(connection, limit, descending) == expected
+
+
+def test_last_page_has_no_cursor(connection):
+    page = KeysetPage(['user_id_1', 'user_id_2'], 20)
+    assert len(page.fetch(connection, 'SELECT * FROM Follower')) == 20
+    assert page.next_cursor is None
+
+
+def test_pages_stay_stable_when_rows_are_added(connection):
+    page = KeysetPage(['user_id_1', 'user_id_2'], 6)
+    first = page.fetch(connection, 'SELECT * FROM Follower')
+    # A row sorting before the cursor doesn't shift the next page
+    connection.execute("INSERT INTO Follower VALUES ('u0', 'u00')")
+    after = decode_cursor(page.next_cursor, 2)
+    assert after == tuple(first[-1])
+    second = KeysetPage(['user_id_1', 'user_id_2'], 6, after).fetch(connection, 'SELECT * FROM Follower')
+    assert tuple(second[0]) == ('u1', 'u1')
+
+
+def test_api_rejects_invalid_cursor(client):
+    response = client.get('/songs/?after=not-a-cursor')
+    assert response.status_code == 400
+    assert 'cursor' in response.get_json()['message']
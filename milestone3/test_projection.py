@@ -0,0 +1,71 @@
+import base64
+
+import pytest
+
+from projection import FieldSet, InvalidFieldSet
+
+SONGS = FieldSet('Song', ['song_id'], ['song_id', 'song_name', 'song_time', 'song_image', 'audio'],
+                 media=['song_image', 'audio'], links=['song_image_url', 'audio_url'],
+                 link_columns={'song_image_url': 'song_image_digest'})
+
+
+def test_default_leaves_blobs_out():
+    query, mask = SONGS.select()
+    assert query == 'SELECT song_id, song_name, song_time, song_image_digest FROM Song'
+    assert mask == 'song_id,song_name,song_time,song_image_url,audio_url'
+
+
+def test_requested_fields_always_include_the_key():
+    query, mask = SONGS.select('song_name')
+    assert query == 'SELECT song_id, song_name FROM Song'
+    assert mask == 'song_id,song_name'
+
+
+@pytest.mark.parametrize('requested', [' song_name , song_time ', 'song_name,,song_time,', 'song_time,song_name'])
+def test_fields_parameter_parsing(requested):
+    query, mask = SONGS.select(requested)
+    assert set(mask.split(',')) == {'song_id', 'song_name', 'song_time'}
+    assert mask.split(',')[0] == 'song_id'
+
+
+def test_blob_is_selected_only_when_requested():
+    # The audio link needs no column, so the audio BLOB isn't read for it
+    query, _ = SONGS.select('song_name,audio_url')
+    assert query == 'SELECT song_id, song_name FROM Song'
+    query, _ = SONGS.select('audio')
+    assert query == 'SELECT song_id, audio FROM Song'
+
+
+def test_link_reads_its_small_column_only():
+    query, mask = SONGS.select('song_image_url')
+    assert query == 'SELECT song_id, song_image_digest FROM Song'
+    assert mask == 'song_id,song_image_url'
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(InvalidFieldSet, match='password'):
+        SONGS.select('song_name,password')
+
+
+def test_blank_fields_parameter_means_default():
+    assert SONGS.select('') == SONGS.select()
+
+
+def test_joined_source_qualifies_columns():
+    query, _ = SONGS.select('song_name', source='Song JOIN Likes USING (song_id)')
+    assert query == 'SELECT Song.song_id, Song.song_name FROM Song JOIN Likes USING (song_id)'
+
+
+def test_api_sparse_fieldset(client):
+    audio = base64.b64encode(b'ID3' + bytes(64)).decode()
+    response = client.post('/songs/', json={'song_name': 'Song', 'song_time': 100, 'audio': audio})
+    assert response.status_code == 201, response.get_json()
+
+    [song] = client.get('/songs/').get_json()
+    assert 'audio' not in song and song['audio_url']
+    [song] = client.get('/songs/?fields=song_name').get_json()
+    assert set(song) == {'song_id', 'song_name'}
+
+    response = client.get('/songs/?fields=song_name,nope')
+    assert response.status_code == 400
+    assert 'nope' in response.get_json()['message']
@@ -0,0 +1,109 @@
+import sqlite3
+
+import pytest
+from flask_restx import Model, fields, marshal
+
+from serialization import ModelSerializer, SQLiteDateTime
+
+# Every model a list endpoint serializes with paged()
+LIST_MODELS = ['account_model', 'user_list_model', 'follow_counts_model', 'follower_model',
+               'playlist_list_model', 'playlist_user_model', 'playlist_song_model', 'like_model',
+               'song_list_model', 'genre_model', 'album_list_model', 'album_info_model',
+               'group_list_model', 'album_group_model', 'artist_model', 'history_model',
+               'genrefields_model', 'group_artist_model']
+
+# Values as SQLite hands them back, per field type: typical ones first, then
+# ones of an unexpected type the field has to convert
+SAMPLES = {
+    fields.String: ['name', 42],
+    fields.Integer: [7, '8'],
+    fields.Float: [1.5, 2],
+    fields.Boolean: [1, 0],
+    fields.DateTime: ['2026-10-18T10:00:00', '2026-10-18T10:00:00.5+02:00'],
+    # CURRENT_TIMESTAMP defaults
+    SQLiteDateTime: ['2026-10-18 10:00:00', '2026-10-18T10:00:00'],
+    fields.Date: ['2026-10-18', '1999-01-02'],
+}
+
+
+def rows_for(model, variant):
+    """
+    A row holding every column the model reads: sample values (variant 0 or 1)
+    or NULLs (variant None; keys are kept so URLs can still be built)
+    """
+    columns = {}
+    for name, field in model.items():
+        if isinstance(field, fields.Url):
+            digest = getattr(field, 'digest', None)
+            if digest:
+                columns[digest] = None if variant is None else 'ab' * 32
+            continue
+        source = field.attribute or name
+        if not name.endswith('_id'):
+            columns[source] = None if variant is None else SAMPLES[type(field)][variant]
+        elif type(field) is fields.String:
+            columns[source] = f'{name}-1'
+        else:
+            columns[source] = SAMPLES[type(field)][0]
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = sqlite3.Row
+    select = ', '.join(f'? AS "{column}"' for column in columns)
+    return connection.execute(f'SELECT {select}', list(columns.values())).fetchall()
+
+
+@pytest.mark.parametrize('name', LIST_MODELS)
+@pytest.mark.parametrize('variant', [0, 1, None])
+def test_serializer_matches_marshal(app, name, variant):
+    model = getattr(app, name)
+    rows = rows_for(model, variant)
+    with app.app.test_request_context():
+        expected = [marshal(dict(row), model) for row in rows]
+        assert ModelSerializer(model).to_dicts(rows) == expected
+
+
+@pytest.mark.parametrize('name', ['song_list_model', 'user_list_model', 'history_model'])
+def test_serializer_matches_marshal_with_mask(app, name):
+    model = getattr(app, name)
+    mask = ','.join(list(model)[:2] + list(model)[-1:])
+    rows = rows_for(model, 0)
+    with app.app.test_request_context():
+        expected = [marshal(dict(row), model, mask=mask) for row in rows]
+        assert ModelSerializer(model).to_dicts(rows, mask) == expected
+
+
+def test_serializer_matches_marshal_for_nested_fields(app):
+    owner = Model('Owner', {'nickname': fields.String, 'follower_count': fields.Integer(default=0)})
+    model = Model('WithNested', {
+        'song_id': fields.String,
+        'owner': fields.Nested(owner),
+        'maybe_owner': fields.Nested(owner, allow_null=True),
+        'tags': fields.List(fields.String),
+        'plays': fields.Integer(default=0),
+    })
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = sqlite3.Row
+    rows = connection.execute("SELECT 's1' AS song_id, NULL AS owner, NULL AS maybe_owner, "
+                              "NULL AS tags, NULL AS plays").fetchall()
+    expected = [marshal(dict(row), model) for row in rows]
+    assert ModelSerializer(model).to_dicts(rows) == expected
+
+
+def test_sqlite_timestamps_are_output_as_iso8601():
+    field = SQLiteDateTime(dt_format='iso8601')
+    assert field.format('2026-10-18 10:00:00') == '2026-10-18T10:00:00'
+
+
+def test_history_list_with_default_start_time(app, client):
+    connection = app.db_writer.acquire()
+    connection.execute("INSERT INTO Account (account_id, mail, password_hash, password_salt, language) "
+                       "VALUES ('u1', 'a@b.com', 'x', 'x', 'en')")
+    connection.execute("INSERT INTO User (user_id, nickname) VALUES ('u1', 'user')")
+    connection.execute("INSERT INTO Song (song_id, song_name, song_time) VALUES ('s1', 'song', 200)")
+    connection.execute("INSERT INTO History (user_id, duration, song_id) VALUES ('u1', 10, 's1')")
+    connection.commit()
+    connection.close()
+    response = client.get('/histories/')
+    assert response.status_code == 200
+    [play] = response.get_json()
+    assert 'T' in play['start_time']
+    assert client.get('/accounts/u1').get_json()['registration_date'].count('T') == 1
@@ -0,0 +1,45 @@
+import io
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Pillow is optional; without it images are always sent at full size
+    Image = ImageOps = None
+
+
+def can_resize():
+    """Return True if Pillow is installed and thumbnails can be made"""
+    return Image is not None
+
+
+def resize_image(data, size, jpeg_quality=85):
+    """
+    Scale an image down to fit in a `size` x `size` box, keeping its aspect ratio.
+
+    Images with transparency are saved as PNG, everything else as JPEG.
+
+    Args:
+        data (bytes): The original image
+        size (int): Largest width/height of the result (pixels)
+        jpeg_quality (int): JPEG quality of the result
+
+    Returns:
+        bytes: The thumbnail, or None if the image already fits (it is never
+               enlarged) or can't be decoded (e.g. SVG), so the original is sent
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            if original.width <= size and original.height <= size:
+                return None
+            # Honour the camera orientation before the EXIF data is dropped
+            image = ImageOps.exif_transpose(original)
+            image.thumbnail((size, size), Image.LANCZOS)
+            output = io.BytesIO()
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                image.save(output, 'PNG', optimize=True)
+            else:
+                image.convert('RGB').save(output, 'JPEG', quality=jpeg_quality,
+                                          optimize=True, progressive=True)
+            return output.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None